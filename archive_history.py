@@ -0,0 +1,205 @@
+import argparse
+import glob
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import build_rollups
+import db_access
+import export_purchases
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(ROOT_DIR, 'vending.db')
+ARCHIVE_DIR = os.path.join(ROOT_DIR, 'archive')
+# Recommender state kept by python_MVP/recommender.py
+RECOMMENDER_SCHEMA_FILE = os.path.join(ROOT_DIR, 'recommender.sql')
+
+# Purchases newer than this stay hot (restock forecasts look back 14 days)
+HOT_DAYS = 90
+# Resolved alerts stay hot until they were raised this long ago. alerts
+# has no resolution time, so age is counted from created_at.
+ALERT_GRACE_DAYS = 7
+# Rows moved per transaction, keeps the write lock short for the app
+BATCH_ROWS = 50_000
+# SQLite's default limit is 10 attached databases including main/temp
+MAX_ATTACHED = 8
+
+# Archive copies drop the foreign keys: users, items and machines stay hot
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS purchases (
+    purchase_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    machine_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    credits_earned INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_purchases_timestamp ON purchases(timestamp);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    alert_id INTEGER PRIMARY KEY,
+    machine_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at TEXT,
+    resolved INTEGER DEFAULT 0
+);
+"""
+
+# table -> (id column, time column, extra predicate for rows that may move)
+ARCHIVED_TABLES = {
+    'purchases': ('purchase_id', 'timestamp', '1'),
+    'alerts': ('alert_id', 'created_at', 'resolved = 1'),
+}
+
+def archive_path(month, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"vending_{month.replace('-', '_')}.db")
+
+def _db_bytes(conn):
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return pages * page_size, free * page_size
+
+def _file_bytes(path):
+    return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+def safe_purchase_id(conn, export_dir):
+    # Never archive purchases the rollups, the stored recommender matrices or
+    # the Parquet export haven't consumed yet, or those totals would
+    # silently lose them.
+    marks = [build_rollups.high_water_mark(conn, name) for name in build_rollups.ROLLUPS]
+    marks.append(conn.execute("SELECT COALESCE(MIN(last_purchase_id), 0) FROM recommender_state").fetchone()[0])
+    state_file = os.path.join(export_dir, export_purchases.STATE_FILE)
+    if os.path.exists(state_file):
+        with open(state_file, 'r') as f:
+            marks.append(json.load(f)['last_purchase_id'])
+    return min(marks)
+
+def _move_month(conn, table, month, lo, hi, cutoff, archive_dir, created):
+    # Moves one batch's rows for one month, selected by id range rather than
+    # id lists, so a batch is one copy and one delete however big it is.
+    id_col, time_col, predicate = ARCHIVED_TABLES[table]
+    where = f"{id_col} > ? AND {id_col} <= ? AND substr({time_col}, 1, 7) = ? AND {time_col} < ? AND {predicate}"
+    params = (lo, hi, month, cutoff)
+    path = archive_path(month, archive_dir)
+    conn.execute("ATTACH DATABASE ? AS arch", (path,))
+    try:
+        if path not in created:
+            conn.executescript(ARCHIVE_SCHEMA.replace('CREATE TABLE IF NOT EXISTS ', 'CREATE TABLE IF NOT EXISTS arch.')
+                               .replace('CREATE INDEX IF NOT EXISTS ', 'CREATE INDEX IF NOT EXISTS arch.'))
+            created.add(path)
+        # Copy and delete commit separately. WAL commits aren't atomic across
+        # attached files, so a crash in between must leave a duplicate (which
+        # INSERT OR IGNORE absorbs on the rerun), never a lost row.
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"INSERT OR IGNORE INTO arch.{table} SELECT * FROM main.{table} WHERE {where}", params)
+        conn.execute("COMMIT")
+        conn.execute("BEGIN IMMEDIATE")
+        deleted = conn.execute(f"DELETE FROM main.{table} WHERE {where}", params).rowcount
+        conn.execute("COMMIT")
+    finally:
+        conn.execute("DETACH DATABASE arch")
+    return deleted
+
+def archive_table(conn, table, cutoff, max_id, archive_dir=ARCHIVE_DIR, batch_rows=BATCH_ROWS):
+    # Walk the id range oldest first. Ids follow insertion time, so once a
+    # whole batch is newer than the cutoff there is nothing older left.
+    id_col, time_col, predicate = ARCHIVED_TABLES[table]
+    lo = conn.execute(f"SELECT COALESCE(MIN({id_col}), 0) - 1 FROM {table}").fetchone()[0]
+    moved = 0
+    months = set()
+    created = set()
+    while lo < max_id:
+        hi = min(lo + batch_rows, max_id)
+        rows, old = conn.execute(f"""
+            SELECT COUNT(*), COALESCE(SUM({time_col} < ?), 0)
+            FROM {table}
+            WHERE {id_col} > ? AND {id_col} <= ?
+        """, (cutoff, lo, hi)).fetchone()
+        if rows and not old:
+            break
+        if old:
+            batch_months = [month for (month,) in conn.execute(f"""
+                SELECT DISTINCT substr({time_col}, 1, 7) FROM {table}
+                WHERE {id_col} > ? AND {id_col} <= ? AND {time_col} < ? AND {predicate}
+            """, (lo, hi, cutoff))]
+            for month in sorted(batch_months):
+                moved += _move_month(conn, table, month, lo, hi, cutoff, archive_dir, created)
+                months.add(month)
+        lo = hi
+    return moved, months
+
+def archive_history(db_file=DB_FILE, archive_dir=ARCHIVE_DIR, hot_days=HOT_DAYS,
+                    alert_grace_days=ALERT_GRACE_DAYS, vacuum=False, export_dir=export_purchases.EXPORT_DIR):
+    started = time.perf_counter()
+    os.makedirs(archive_dir, exist_ok=True)
+    # Autocommit mode so we control BEGIN/COMMIT per batch
+    conn = db_access.connect(db_file, isolation_level=None)
+    for path in (build_rollups.ROLLUP_SCHEMA_FILE, RECOMMENDER_SCHEMA_FILE):
+        with open(path, 'r') as f:
+            conn.executescript(f.read())
+    before_bytes = _file_bytes(db_file)
+
+    now = datetime.now()
+    purchase_cutoff = (now - timedelta(days=hot_days)).strftime('%Y-%m-%d %H:%M:%S')
+    # created_at defaults to CURRENT_TIMESTAMP, which SQLite writes in UTC
+    alert_cutoff = (datetime.now(timezone.utc) - timedelta(days=alert_grace_days)).strftime('%Y-%m-%d %H:%M:%S')
+    purchase_limit = safe_purchase_id(conn, export_dir)
+    max_purchase = conn.execute("SELECT COALESCE(MAX(purchase_id), 0) FROM purchases").fetchone()[0]
+    alert_limit = conn.execute("SELECT COALESCE(MAX(alert_id), 0) FROM alerts").fetchone()[0]
+
+    moved_purchases, purchase_months = archive_table(conn, 'purchases', purchase_cutoff, purchase_limit, archive_dir)
+    moved_alerts, alert_months = archive_table(conn, 'alerts', alert_cutoff, alert_limit, archive_dir)
+
+    # Fold the WAL back in and truncate it, otherwise the -wal file keeps
+    # its high-water size even though the rows are gone.
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    _, free_bytes = _db_bytes(conn)
+    if vacuum:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    after_bytes = _file_bytes(db_file)
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Archived {moved_purchases:,} purchases older than {purchase_cutoff} "
+          f"into {len(purchase_months)} monthly files and {moved_alerts:,} resolved alerts raised before {alert_cutoff} UTC "
+          f"in {elapsed:.1f}s.")
+    if purchase_limit < max_purchase:
+        print(f"Purchases above id {purchase_limit} were kept until the rollups/recommender/export catch up.")
+    print(f"Hot database: {before_bytes / 1e6:,.1f} MB -> {after_bytes / 1e6:,.1f} MB on disk, "
+          f"{free_bytes / 1e6:,.1f} MB of free pages{' reclaimed by VACUUM' if vacuum else ' reusable (run with --vacuum to shrink the file)'}.")
+    return moved_purchases, moved_alerts
+
+def connect_with_history(db_file=DB_FILE, archive_dir=ARCHIVE_DIR, months=None):
+    # For the rare historical query: attaches the monthly archives (newest
+    # first, up to MAX_ATTACHED) and exposes purchases_all / alerts_all as
+    # temp views over hot + cold rows. Pass months=['2026-01', ...] to pick.
+    conn = db_access.connect(db_file)
+    paths = sorted(glob.glob(os.path.join(archive_dir, 'vending_*.db')), reverse=True)
+    if months is not None:
+        wanted = {archive_path(month, archive_dir) for month in months}
+        paths = [path for path in paths if path in wanted]
+    if len(paths) > MAX_ATTACHED:
+        raise ValueError(f"{len(paths)} archives requested; SQLite can attach at most {MAX_ATTACHED} here, pass months=")
+    schemas = []
+    for n, path in enumerate(paths):
+        conn.execute(f"ATTACH DATABASE ? AS arch{n}", (f"file:{path}?mode=ro",))
+        schemas.append(f"arch{n}")
+    for table in ARCHIVED_TABLES:
+        union = " UNION ALL ".join([f"SELECT * FROM main.{table}"] + [f"SELECT * FROM {s}.{table}" for s in schemas])
+        conn.execute(f"CREATE TEMP VIEW {table}_all AS {union}")
+    return conn
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old purchases and resolved alerts into monthly archive databases")
+    parser.add_argument('--db', default=DB_FILE, help="Hot database file")
+    parser.add_argument('--archive-dir', default=ARCHIVE_DIR, help="Where the monthly archive files go")
+    parser.add_argument('--hot-days', type=int, default=HOT_DAYS, help="Keep purchases newer than this many days")
+    parser.add_argument('--alert-grace-days', type=int, default=ALERT_GRACE_DAYS, help="Keep resolved alerts raised within this many days")
+    parser.add_argument('--export-dir', default=export_purchases.EXPORT_DIR, help="Parquet export to wait for, if one exists")
+    parser.add_argument('--vacuum', action='store_true', help="VACUUM afterwards to shrink the file (locks the database while it runs)")
+    args = parser.parse_args()
+    archive_history(args.db, args.archive_dir, args.hot_days, args.alert_grace_days, args.vacuum, args.export_dir)
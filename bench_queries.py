@@ -0,0 +1,378 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import build_rollups
+import db_access
+import seed_db
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = os.path.join(ROOT_DIR, 'bench_dbs')
+DEFAULT_SCALES = [1, 10, 100]
+DEFAULT_REPEAT = 50
+WARMUP = 3
+SEED = 42
+# Flag a query as regressed when its p50 is this much slower than baseline
+REGRESSION_THRESHOLD = 0.20
+# Index report only lists queries whose plan changed or that moved this much
+NOTABLE_SPEEDUP = 2.0
+
+# Rollup-backed dashboard reads (vending-web/src/lib/db.ts)
+ITEM_SALES_CTE = """
+    WITH item_sales AS (
+        SELECT day, item_id, purchase_count, revenue
+        FROM sales_daily_item
+        UNION ALL
+        SELECT DATE(timestamp), item_id, 1, credits_earned
+        FROM purchases
+        WHERE purchase_id > (SELECT last_purchase_id FROM rollup_state WHERE name = 'sales_daily')
+    )
+"""
+
+def _search_params(rng, shape):
+    # Match expressions the way server.js builds them: one prefix group per
+    # word, ANDed for the strict pass and ORed for the fallback. Every
+    # fourth search adds a word from another item, so nothing matches all
+    # words and the OR fallback runs.
+    names = shape['item_names']
+    text = names[rng.integers(len(names))]
+    if rng.random() < 0.25:
+        text += ' ' + names[rng.integers(len(names))].split()[0]
+    groups = [f'("{word}"*)' if len(word) >= 2 else f'("{word}")' for word in re.findall(r'[^\W_]+', text.lower())]
+    return (' AND '.join(groups), ' OR '.join(groups))
+
+# name -> (sql, params builder). Params get a seeded RNG and the DB shape so
+# each repetition hits a different machine, like real traffic would.
+QUERIES = {
+    'dashboard_total_revenue': (
+        ITEM_SALES_CTE + "SELECT SUM(revenue) AS total FROM item_sales",
+        lambda rng, shape: (),
+    ),
+    'dashboard_last_week_revenue': (
+        ITEM_SALES_CTE + """
+        SELECT SUM(revenue) AS total FROM item_sales
+        WHERE day < ? AND day >= DATE(?, '-7 days')""",
+        lambda rng, shape: (shape['last_week'], shape['last_week']),
+    ),
+    'top_products': (
+        ITEM_SALES_CTE + """
+        SELECT i.name AS name, SUM(s.purchase_count) AS total_sold, SUM(s.revenue) AS total_revenue
+        FROM item_sales s
+        JOIN items i ON s.item_id = i.item_id
+        GROUP BY s.item_id
+        ORDER BY total_sold DESC
+        LIMIT ?""",
+        lambda rng, shape: (5,),
+    ),
+    'revenue_series': (
+        ITEM_SALES_CTE + """
+        SELECT day AS date, SUM(revenue) AS total_revenue
+        FROM item_sales
+        WHERE day >= DATE('now', ?)
+        GROUP BY day
+        ORDER BY day ASC""",
+        lambda rng, shape: ('-7 days',),
+    ),
+    # Pre-rollup versions, kept as a reference for what the rollups save
+    'top_products_raw': (
+        """
+        SELECT i.name AS name, COUNT(p.purchase_id) AS total_sold, SUM(p.credits_earned) AS total_revenue
+        FROM purchases p
+        JOIN items i ON p.item_id = i.item_id
+        GROUP BY p.item_id
+        ORDER BY total_sold DESC
+        LIMIT ?""",
+        lambda rng, shape: (5,),
+    ),
+    'revenue_series_raw': (
+        """
+        SELECT DATE(timestamp) AS date, SUM(credits_earned) AS total_revenue
+        FROM purchases
+        WHERE DATE(timestamp) >= DATE('now', ?)
+        GROUP BY DATE(timestamp)
+        ORDER BY DATE(timestamp) ASC""",
+        lambda rng, shape: ('-7 days',),
+    ),
+    # server.js endpoints
+    'search_item': (
+        """
+        WITH strict AS (
+            SELECT rowid AS item_id, rank FROM items_fts WHERE items_fts MATCH ?
+        ),
+        loose AS (
+            SELECT rowid AS item_id, rank FROM items_fts
+            WHERE items_fts MATCH ? AND NOT EXISTS (SELECT 1 FROM strict)
+        ),
+        m AS (
+            SELECT * FROM strict UNION ALL SELECT * FROM loose
+        )
+        SELECT vm.machine_id, vm.address, inv.quantity, i.item_id, i.name
+        FROM m
+        JOIN items i ON i.item_id = m.item_id
+        JOIN inventory inv ON inv.item_id = m.item_id AND inv.quantity > 0
+        JOIN vending_machines vm ON inv.machine_id = vm.machine_id
+        ORDER BY m.rank, vm.machine_id""",
+        _search_params,
+    ),
+    'machine_inventory': (
+        """
+        SELECT i.item_id, i.name, i.category, inv.quantity
+        FROM inventory inv
+        JOIN items i ON inv.item_id = i.item_id
+        WHERE inv.machine_id = ?""",
+        lambda rng, shape: (int(rng.integers(1, shape['machines'] + 1)),),
+    ),
+    'active_alerts': (
+        """
+        SELECT * FROM alerts
+        WHERE resolved = 0
+        ORDER BY created_at DESC""",
+        lambda rng, shape: (),
+    ),
+}
+
+# Candidate indexes that --index / --try-indexes can evaluate
+INDEXES = {
+    'inventory_machine_item': "CREATE INDEX IF NOT EXISTS bench_inventory_machine_item ON inventory(machine_id, item_id)",
+    'inventory_item_quantity': "CREATE INDEX IF NOT EXISTS bench_inventory_item_quantity ON inventory(item_id, quantity)",
+    'items_name': "CREATE INDEX IF NOT EXISTS bench_items_name ON items(name)",
+    'purchases_timestamp': "CREATE INDEX IF NOT EXISTS bench_purchases_timestamp ON purchases(timestamp)",
+    'purchases_day': "CREATE INDEX IF NOT EXISTS bench_purchases_day ON purchases(DATE(timestamp))",
+    'purchases_item': "CREATE INDEX IF NOT EXISTS bench_purchases_item ON purchases(item_id)",
+    'alerts_resolved': "CREATE INDEX IF NOT EXISTS bench_alerts_resolved ON alerts(resolved, created_at)",
+}
+
+ALERT_TYPES = ['low_stock', 'high_temperature', 'power_off']
+ALERTS_PER_MACHINE = 20
+UNRESOLVED_SHARE = 0.1
+
+def _populate_alerts(db_file, rng):
+    # The seed leaves alerts empty; give /alerts a realistic backlog to sort
+    conn = db_access.connect(db_file)
+    n_machines = conn.execute("SELECT COUNT(*) FROM vending_machines").fetchone()[0]
+    n_alerts = n_machines * ALERTS_PER_MACHINE
+    end = datetime.now()
+    base = np.datetime64(end.replace(microsecond=0) - timedelta(days=seed_db.HISTORY_DAYS), 's')
+    secs = rng.integers(0, seed_db.HISTORY_DAYS * 86400, size=n_alerts)
+    stamps = np.char.replace(np.datetime_as_string(base + secs.astype('timedelta64[s]'), unit='s'), 'T', ' ')
+    types = rng.integers(len(ALERT_TYPES), size=n_alerts)
+    rows = zip(
+        rng.integers(1, n_machines + 1, size=n_alerts).tolist(),
+        [ALERT_TYPES[t] for t in types.tolist()],
+        [f"Bench alert {i}" for i in range(n_alerts)],
+        stamps.tolist(),
+        (rng.random(n_alerts) >= UNRESOLVED_SHARE).astype(int).tolist(),
+    )
+    conn.executemany("INSERT INTO alerts (machine_id, type, message, created_at, resolved) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+def _create_search_index(db_file):
+    # The catalog FTS index is what /search/item queries, not a candidate
+    # index, so every run has it (older cached databases included)
+    conn = db_access.connect(db_file)
+    with open(seed_db.SEARCH_SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    conn.commit()
+    conn.close()
+
+def build_database(scale, rebuild=False):
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    db_file = os.path.join(BENCH_DIR, f"bench_scale{scale:g}_seed{SEED}.db")
+    if os.path.exists(db_file) and not rebuild:
+        _create_search_index(db_file)
+        return db_file
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    seed_db.run_scaled_seed(scale, seed=SEED, db_file=db_file, with_indexes=False)
+    _populate_alerts(db_file, np.random.default_rng(SEED))
+    conn = build_rollups.connect(db_file)
+    build_rollups.refresh_rollups(conn)
+    conn.close()
+    _create_search_index(db_file)
+    return db_file
+
+def _db_shape(conn):
+    last_week = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
+    return {
+        'machines': conn.execute("SELECT COUNT(*) FROM vending_machines").fetchone()[0],
+        'purchases': conn.execute("SELECT COUNT(*) FROM purchases").fetchone()[0],
+        'item_names': [row[0] for row in conn.execute("SELECT name FROM items ORDER BY item_id")],
+        'last_week': last_week,
+    }
+
+def query_plan(conn, sql, params):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+def percentiles(samples_ms):
+    if len(samples_ms) == 1:
+        return {'p50': samples_ms[0], 'p95': samples_ms[0], 'p99': samples_ms[0]}
+    cuts = statistics.quantiles(samples_ms, n=100, method='inclusive')
+    return {'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98]}
+
+def run_queries(db_file, names, repeat):
+    # Same PRAGMAs as the apps, minus the per-statement metrics overhead
+    conn = db_access.connect(db_file, instrumented=False)
+    shape = _db_shape(conn)
+    results = {}
+    for name in names:
+        sql, make_params = QUERIES[name]
+        rng = np.random.default_rng(SEED)
+        for _ in range(WARMUP):
+            conn.execute(sql, make_params(rng, shape)).fetchall()
+        samples = []
+        for _ in range(repeat):
+            params = make_params(rng, shape)
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - started) * 1000)
+        results[name] = dict(percentiles(samples), plan=query_plan(conn, sql, make_params(rng, shape)))
+    conn.close()
+    return shape, results
+
+def _drop_schema_indexes(db_file):
+    # Cached databases from older runs may still carry the indexes.sql
+    # indexes, which would hide what the candidates are worth
+    with open(seed_db.INDEXES_FILE, 'r') as f:
+        names = re.findall(r'CREATE INDEX IF NOT EXISTS (\w+)', f.read())
+    conn = db_access.connect(db_file)
+    for name in names:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    conn.commit()
+    conn.close()
+
+def _with_indexes(db_file, index_names, create):
+    conn = db_access.connect(db_file)
+    for name in index_names:
+        if create:
+            conn.execute(INDEXES[name])
+        else:
+            index = INDEXES[name].split(' IF NOT EXISTS ')[1].split(' ')[0]
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+    # Sampled ANALYZE keeps this cheap on the 100M-row databases
+    conn.execute("PRAGMA analysis_limit = 1000")
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+def print_results(scale, shape, results, baseline=None):
+    print(f"\nScale {scale:g}: {shape['machines']:,} machines, {shape['purchases']:,} purchases")
+    print(f"  {'query':<30}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'vs base':>10}")
+    for name, r in results.items():
+        delta = ''
+        if baseline and name in baseline:
+            delta = f"{r['p50'] / baseline[name]['p50']:.2f}x" if baseline[name]['p50'] > 0 else ''
+        print(f"  {name:<30}{r['p50']:>10.3f}{r['p95']:>10.3f}{r['p99']:>10.3f}{delta:>10}")
+
+def print_plans(results):
+    for name, r in results.items():
+        print(f"  {name}:")
+        for line in r['plan']:
+            print(f"      {line}")
+
+def compare_to_baseline(report, baseline):
+    regressions = []
+    for scale, entry in report['scales'].items():
+        base = baseline.get('scales', {}).get(scale, {}).get('queries', {})
+        for name, r in entry['queries'].items():
+            if name in base and base[name]['p50'] > 0:
+                change = r['p50'] / base[name]['p50'] - 1
+                if change > REGRESSION_THRESHOLD:
+                    regressions.append((scale, name, change))
+            if name in base and base[name]['plan'] != r['plan']:
+                print(f"Plan changed for {name} at scale {scale}:")
+                print("    was: " + " | ".join(base[name]['plan']))
+                print("    now: " + " | ".join(r['plan']))
+    for scale, name, change in regressions:
+        print(f"REGRESSION {name} at scale {scale}: p50 {change * 100:+.0f}% vs baseline")
+    return regressions
+
+def try_indexes(db_file, scale, names, repeat, baseline_results, applied=()):
+    # Evaluate each candidate index on its own against the run's baseline.
+    # Indexes applied with --index stay in place for the whole run; only
+    # candidates created here are dropped again.
+    print(f"\nIndex candidates at scale {scale:g} (p50 speedup vs {'--index run' if applied else 'no index'}):")
+    speedups = {}
+    for index_name in INDEXES:
+        if index_name in applied:
+            print(f"  {index_name:<26}applied for the whole run")
+            continue
+        _with_indexes(db_file, [index_name], create=True)
+        _, results = run_queries(db_file, names, repeat)
+        _with_indexes(db_file, [index_name], create=False)
+        speedups[index_name] = {}
+        improved = []
+        for name, r in results.items():
+            base = baseline_results[name]['p50']
+            speedup = base / r['p50'] if r['p50'] > 0 else float('inf')
+            speedups[index_name][name] = speedup
+            if r['plan'] != baseline_results[name]['plan'] or not 1 / NOTABLE_SPEEDUP < speedup < NOTABLE_SPEEDUP:
+                improved.append(f"{name} {speedup:.1f}x")
+        print(f"  {index_name:<26}{', '.join(improved) if improved else 'no effect'}")
+    return speedups
+
+def run_bench(scales, names, repeat, indexes=(), explore=False, rebuild=False, show_plans=False, baseline=None):
+    report = {'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'repeat': repeat,
+              'indexes': list(indexes), 'scales': {}}
+    for scale in scales:
+        db_file = build_database(scale, rebuild=rebuild)
+        # Start from the bare schema, then apply only the requested indexes
+        _drop_schema_indexes(db_file)
+        _with_indexes(db_file, INDEXES, create=False)
+        _with_indexes(db_file, indexes, create=True)
+        shape, results = run_queries(db_file, names, repeat)
+        entry = {'machines': shape['machines'], 'purchases': shape['purchases'], 'queries': results}
+        base = baseline['scales'].get(f"{scale:g}", {}).get('queries') if baseline else None
+        print_results(scale, shape, results, base)
+        if show_plans:
+            print_plans(results)
+        if explore:
+            entry['index_speedups'] = try_indexes(db_file, scale, names, repeat, results, applied=indexes)
+        _with_indexes(db_file, indexes, create=False)
+        report['scales'][f"{scale:g}"] = entry
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard and API SQL against seeded databases")
+    parser.add_argument('--scales', default=','.join(str(s) for s in DEFAULT_SCALES), help="Comma-separated seed_db scale factors")
+    parser.add_argument('--queries', help=f"Comma-separated subset of: {', '.join(QUERIES)}")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Timed runs per query")
+    parser.add_argument('--index', action='append', default=[], choices=sorted(INDEXES), help="Apply a candidate index for the whole run (repeatable)")
+    parser.add_argument('--try-indexes', action='store_true', help="Measure each candidate index on its own and report speedups")
+    parser.add_argument('--plans', action='store_true', help="Print EXPLAIN QUERY PLAN for every query")
+    parser.add_argument('--rebuild', action='store_true', help="Regenerate the benchmark databases")
+    parser.add_argument('--output', help="Write the results as JSON")
+    parser.add_argument('--save-baseline', metavar='PATH', help="Write the results as the new baseline")
+    parser.add_argument('--compare', metavar='PATH', help="Compare against a stored baseline; exit 1 on regressions")
+    args = parser.parse_args()
+
+    scales = [float(s) for s in args.scales.split(',')]
+    names = args.queries.split(',') if args.queries else list(QUERIES)
+    unknown = [n for n in names if n not in QUERIES]
+    if unknown:
+        parser.error(f"unknown queries: {', '.join(unknown)}")
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+
+    report = run_bench(scales, names, args.repeat, indexes=args.index, explore=args.try_indexes,
+                       rebuild=args.rebuild, show_plans=args.plans, baseline=baseline)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nResults written to {path}")
+
+    if baseline and compare_to_baseline(report, baseline):
+        sys.exit(1)
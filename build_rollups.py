@@ -0,0 +1,132 @@
+import argparse
+import os
+import time
+from datetime import datetime
+
+import db_access
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(ROOT_DIR, 'vending.db')
+ROLLUP_SCHEMA_FILE = os.path.join(ROOT_DIR, 'rollups.sql')
+ROLLUP_NAME = 'sales_daily'
+
+# Purchases folded in per transaction, keeps write locks short on big backfills
+BATCH_ROWS = 500_000
+
+# Each SELECT needs its WHERE clause (the id range) so SQLite doesn't parse
+# ON CONFLICT as a join constraint; use WHERE true if the filter ever goes
+MERGE_MACHINE_SQL = """
+    INSERT INTO sales_daily_machine (day, machine_id, purchase_count, revenue)
+    SELECT DATE(timestamp), machine_id, COUNT(*), TOTAL(credits_earned)
+    FROM purchases
+    WHERE purchase_id > ? AND purchase_id <= ?
+    GROUP BY DATE(timestamp), machine_id
+    ON CONFLICT (day, machine_id) DO UPDATE SET
+        purchase_count = purchase_count + excluded.purchase_count,
+        revenue = revenue + excluded.revenue
+"""
+MERGE_ITEM_SQL = """
+    INSERT INTO sales_daily_item (day, item_id, purchase_count, revenue)
+    SELECT DATE(timestamp), item_id, COUNT(*), TOTAL(credits_earned)
+    FROM purchases
+    WHERE purchase_id > ? AND purchase_id <= ?
+    GROUP BY DATE(timestamp), item_id
+    ON CONFLICT (day, item_id) DO UPDATE SET
+        purchase_count = purchase_count + excluded.purchase_count,
+        revenue = revenue + excluded.revenue
+"""
+
+MERGE_MACHINE_ITEM_SQL = """
+    INSERT INTO sales_daily_machine_item (day, machine_id, item_id, purchase_count, revenue)
+    SELECT DATE(timestamp), machine_id, item_id, COUNT(*), TOTAL(credits_earned)
+    FROM purchases
+    WHERE purchase_id > ? AND purchase_id <= ?
+    GROUP BY DATE(timestamp), machine_id, item_id
+    ON CONFLICT (day, machine_id, item_id) DO UPDATE SET
+        purchase_count = purchase_count + excluded.purchase_count,
+        revenue = revenue + excluded.revenue
+"""
+
+# rollup_state name -> (tables it owns, merge statements sharing its high-water mark)
+ROLLUPS = {
+    ROLLUP_NAME: (['sales_daily_machine', 'sales_daily_item'], [MERGE_MACHINE_SQL, MERGE_ITEM_SQL]),
+    'sales_daily_machine_item': (['sales_daily_machine_item'], [MERGE_MACHINE_ITEM_SQL]),
+}
+
+def connect(db_file=DB_FILE):
+    # Autocommit mode so we control BEGIN/COMMIT per batch
+    conn = db_access.connect(db_file, isolation_level=None)
+    with open(ROLLUP_SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    return conn
+
+def high_water_mark(conn, name=ROLLUP_NAME):
+    row = conn.execute("SELECT last_purchase_id FROM rollup_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+def purchase_sequence(conn):
+    # Highest purchase_id ever handed out. Unlike MAX(purchase_id) it stays
+    # put when the archiver empties purchases, and only goes back down when
+    # the table is dropped and recreated (a reseed).
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'purchases'").fetchone()
+    return row[0] if row else 0
+
+def reset_rollups(conn, names=None):
+    conn.execute("BEGIN IMMEDIATE")
+    for name in names or ROLLUPS:
+        for table in ROLLUPS[name][0]:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("UPDATE rollup_state SET last_purchase_id = 0, updated_at = NULL WHERE name = ?", (name,))
+    conn.execute("COMMIT")
+
+def refresh_rollups(conn, batch_rows=BATCH_ROWS):
+    max_id = conn.execute("SELECT COALESCE(MAX(purchase_id), 0) FROM purchases").fetchone()[0]
+    sequence = purchase_sequence(conn)
+    marks = {}
+    for name, (_, merges) in ROLLUPS.items():
+        started = time.perf_counter()
+        hwm = high_water_mark(conn, name)
+        if sequence < hwm:
+            # purchases was reset (e.g. reseeded) underneath us, start over
+            print(f"purchases id sequence {sequence} is below {name} high-water mark {hwm}, rebuilding.")
+            reset_rollups(conn, [name])
+            hwm = 0
+
+        folded = 0
+        while hwm < max_id:
+            upper = min(hwm + batch_rows, max_id)
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for sql in merges:
+                    conn.execute(sql, (hwm, upper))
+                conn.execute(
+                    "UPDATE rollup_state SET last_purchase_id = ?, updated_at = ? WHERE name = ?",
+                    (upper, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), name),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            folded += upper - hwm
+            hwm = upper
+
+        elapsed = time.perf_counter() - started
+        print(f"{name} current through purchase_id {hwm} (scanned id range of {folded:,}) in {elapsed:.2f}s.")
+        marks[name] = hwm
+    return marks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally refresh the daily sales rollup tables")
+    parser.add_argument('--db', default=DB_FILE, help="Database file to update")
+    parser.add_argument('--rebuild', action='store_true', help="Drop existing rollup rows and rebuild from all purchases")
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="Keep refreshing on this interval")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.rebuild:
+        reset_rollups(conn)
+    refresh_rollups(conn)
+    while args.watch:
+        time.sleep(args.watch)
+        refresh_rollups(conn)
+    conn.close()
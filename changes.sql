@@ -0,0 +1,144 @@
+-- Per-table change counters for the dashboard cache (python_MVP/data_loader.py).
+-- Every write to a tracked table bumps its counter in the same transaction,
+-- so a cached result stays valid until a table it read from changes, not
+-- until anything at all is committed (heartbeats commit constantly).
+-- Rollup and sketch rows are rewritten together with their rollup_state /
+-- sketch_state row, so those state tables stand in for them.
+-- Created after bulk seeds load, so the triggers never slow the load down.
+
+CREATE TABLE IF NOT EXISTS table_changes (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO table_changes (name) VALUES
+    ('users'),
+    ('vending_machines'),
+    ('items'),
+    ('inventory'),
+    ('purchases'),
+    ('surveys'),
+    ('problem_reports'),
+    ('alerts'),
+    ('rollup_state'),
+    ('sketch_state');
+
+CREATE TRIGGER IF NOT EXISTS users_changes_insert AFTER INSERT ON users BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_changes_update AFTER UPDATE ON users BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_changes_delete AFTER DELETE ON users BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'users';
+END;
+
+CREATE TRIGGER IF NOT EXISTS vending_machines_changes_insert AFTER INSERT ON vending_machines BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'vending_machines';
+END;
+
+CREATE TRIGGER IF NOT EXISTS vending_machines_changes_update AFTER UPDATE ON vending_machines BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'vending_machines';
+END;
+
+CREATE TRIGGER IF NOT EXISTS vending_machines_changes_delete AFTER DELETE ON vending_machines BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'vending_machines';
+END;
+
+CREATE TRIGGER IF NOT EXISTS items_changes_insert AFTER INSERT ON items BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'items';
+END;
+
+CREATE TRIGGER IF NOT EXISTS items_changes_update AFTER UPDATE ON items BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'items';
+END;
+
+CREATE TRIGGER IF NOT EXISTS items_changes_delete AFTER DELETE ON items BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'items';
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_changes_insert AFTER INSERT ON inventory BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'inventory';
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_changes_update AFTER UPDATE ON inventory BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'inventory';
+END;
+
+CREATE TRIGGER IF NOT EXISTS inventory_changes_delete AFTER DELETE ON inventory BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'inventory';
+END;
+
+CREATE TRIGGER IF NOT EXISTS purchases_changes_insert AFTER INSERT ON purchases BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'purchases';
+END;
+
+CREATE TRIGGER IF NOT EXISTS purchases_changes_update AFTER UPDATE ON purchases BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'purchases';
+END;
+
+CREATE TRIGGER IF NOT EXISTS purchases_changes_delete AFTER DELETE ON purchases BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'purchases';
+END;
+
+CREATE TRIGGER IF NOT EXISTS surveys_changes_insert AFTER INSERT ON surveys BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'surveys';
+END;
+
+CREATE TRIGGER IF NOT EXISTS surveys_changes_update AFTER UPDATE ON surveys BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'surveys';
+END;
+
+CREATE TRIGGER IF NOT EXISTS surveys_changes_delete AFTER DELETE ON surveys BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'surveys';
+END;
+
+CREATE TRIGGER IF NOT EXISTS problem_reports_changes_insert AFTER INSERT ON problem_reports BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'problem_reports';
+END;
+
+CREATE TRIGGER IF NOT EXISTS problem_reports_changes_update AFTER UPDATE ON problem_reports BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'problem_reports';
+END;
+
+CREATE TRIGGER IF NOT EXISTS problem_reports_changes_delete AFTER DELETE ON problem_reports BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'problem_reports';
+END;
+
+CREATE TRIGGER IF NOT EXISTS alerts_changes_insert AFTER INSERT ON alerts BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'alerts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS alerts_changes_update AFTER UPDATE ON alerts BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'alerts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS alerts_changes_delete AFTER DELETE ON alerts BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'alerts';
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollup_state_changes_insert AFTER INSERT ON rollup_state BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'rollup_state';
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollup_state_changes_update AFTER UPDATE ON rollup_state BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'rollup_state';
+END;
+
+CREATE TRIGGER IF NOT EXISTS rollup_state_changes_delete AFTER DELETE ON rollup_state BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'rollup_state';
+END;
+
+CREATE TRIGGER IF NOT EXISTS sketch_state_changes_insert AFTER INSERT ON sketch_state BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'sketch_state';
+END;
+
+CREATE TRIGGER IF NOT EXISTS sketch_state_changes_update AFTER UPDATE ON sketch_state BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'sketch_state';
+END;
+
+CREATE TRIGGER IF NOT EXISTS sketch_state_changes_delete AFTER DELETE ON sketch_state BEGIN
+    UPDATE table_changes SET version = version + 1 WHERE name = 'sketch_state';
+END;
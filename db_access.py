@@ -0,0 +1,367 @@
+import atexit
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.environ.get('VENDING_DB', os.path.join(ROOT_DIR, 'vending.db'))
+# One JSON snapshot per process, merged by the business dashboard
+METRICS_DIR = os.environ.get('VENDING_METRICS_DIR', os.path.join(ROOT_DIR, 'db_metrics'))
+
+# Every connection gets the same durability and cache settings, whichever
+# tool opened it. WAL + NORMAL only fsyncs at checkpoints.
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL;",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA busy_timeout = 5000;",
+    "PRAGMA cache_size = -32768;",
+    "PRAGMA temp_store = MEMORY;",
+    "PRAGMA mmap_size = 268435456;",
+]
+# sqlite3 keeps this many prepared statements per connection (default 128)
+STATEMENT_CACHE = 256
+POOL_SIZE = 4
+POOL_TIMEOUT = 30
+
+SLOW_QUERY_MS = 50
+SLOW_LOG_ENTRIES = 200
+FLUSH_SECONDS = 10
+# Snapshots from processes that stopped longer ago than this are ignored
+METRICS_MAX_AGE = 3600
+# Histogram bucket upper bounds; one extra bucket catches everything slower
+BUCKETS_MS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 10000]
+
+_PLANNABLE = re.compile(r'^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+_SCHEMA_OBJECT = re.compile(r'CREATE\s+(?:VIRTUAL\s+)?(?:TABLE|INDEX|TRIGGER)\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.IGNORECASE)
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    # Collapses whitespace so one statement from different call sites is one key
+    return ' '.join(sql.split())
+
+def _bucket(elapsed_ms):
+    for n, bound in enumerate(BUCKETS_MS):
+        if elapsed_ms <= bound:
+            return n
+    return len(BUCKETS_MS)
+
+def percentile(buckets, q, max_ms):
+    # Upper bound of the bucket holding the q-th percentile, capped at the max seen
+    total = sum(buckets)
+    if not total:
+        return 0.0
+    running = 0
+    for n, count in enumerate(buckets):
+        running += count
+        if running >= q / 100 * total:
+            return min(BUCKETS_MS[n], max_ms) if n < len(BUCKETS_MS) else max_ms
+    return max_ms
+
+class Metrics:
+    # Per-statement latency histograms and the slow-query log for this process
+
+    def __init__(self, source):
+        self.source = source
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.slow = deque(maxlen=SLOW_LOG_ENTRIES)
+        self.flushed_at = time.monotonic()
+        self.dirty = False
+
+    def record(self, sql, elapsed_ms):
+        key = normalize(sql)
+        with self.lock:
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                                'buckets': [0] * (len(BUCKETS_MS) + 1)}
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            stats['buckets'][_bucket(elapsed_ms)] += 1
+            self.dirty = True
+            due = time.monotonic() - self.flushed_at >= FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def log_slow(self, sql, elapsed_ms, plan):
+        with self.lock:
+            self.slow.append({
+                'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'source': self.source,
+                'sql': normalize(sql),
+                'ms': round(elapsed_ms, 2),
+                'plan': plan,
+            })
+            self.dirty = True
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'source': self.source,
+                'pid': os.getpid(),
+                'statements': [dict(stats, sql=sql, buckets=list(stats['buckets']))
+                               for sql, stats in self.statements.items()],
+                'slow': list(self.slow),
+            }
+
+    def path(self, metrics_dir=None):
+        return os.path.join(metrics_dir or METRICS_DIR, f"{self.source}-{os.getpid()}.json")
+
+    def flush(self, metrics_dir=None):
+        # Atomic replace, so a reader never sees half a snapshot
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            if not self.dirty:
+                return
+            self.dirty = False
+        path = self.path(metrics_dir)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            # Metrics must never take the app down (read-only checkout etc.)
+            pass
+
+def _default_source():
+    # Script name; `python -c ...` and stdin scripts have no useful one
+    name = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv else ''))[0]
+    return 'python' if not name or name.startswith('-') else name
+
+_metrics = Metrics(_default_source())
+atexit.register(lambda: _metrics.flush())
+
+def set_source(name):
+    # Names this process in the metrics ("business", "customer", ...)
+    _metrics.source = name
+
+def _timed(conn, sql, params, started):
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    _metrics.record(sql, elapsed_ms)
+    if elapsed_ms >= SLOW_QUERY_MS:
+        _metrics.log_slow(sql, elapsed_ms, conn.plan(sql, params))
+
+class InstrumentedCursor(sqlite3.Cursor):
+    # Times execute(); for SELECTs that covers planning, sorting and the
+    # first row. Use Connection.query_all to include fetching every row.
+
+    def execute(self, sql, params=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            _timed(self.connection, sql, params, started)
+
+    def executemany(self, sql, seq_of_params):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_params)
+        finally:
+            _timed(self.connection, sql, None, started)
+
+    def executescript(self, script):
+        started = time.perf_counter()
+        try:
+            return super().executescript(script)
+        finally:
+            _timed(self.connection, script, None, started)
+
+class InstrumentedConnection(sqlite3.Connection):
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+    def executescript(self, script):
+        return self.cursor().executescript(script)
+
+    def query_all(self, sql, params=()):
+        # (rows, column names), timed including the fetch
+        started = time.perf_counter()
+        try:
+            cursor = sqlite3.Connection.execute(self, sql, params)
+            rows = cursor.fetchall()
+            return rows, [column[0] for column in cursor.description or ()]
+        finally:
+            _timed(self, sql, params, started)
+
+    def plan(self, sql, params):
+        # EXPLAIN QUERY PLAN lines for the slow-query log; scripts and
+        # executemany batches (params None) aren't planned
+        if params is None or not _PLANNABLE.match(sql):
+            return []
+        try:
+            rows = sqlite3.Connection.execute(self, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+        except sqlite3.Error:
+            return []
+        return [row[-1] for row in rows]
+
+def connect(db_file=DB_FILE, pragmas=PRAGMAS, instrumented=True, **kwargs):
+    # instrumented=False for callers that time queries themselves (bench_queries)
+    factory = InstrumentedConnection if instrumented else sqlite3.Connection
+    conn = sqlite3.connect(db_file, factory=factory, cached_statements=STATEMENT_CACHE, **kwargs)
+    for pragma in pragmas:
+        sqlite3.Connection.execute(conn, pragma)
+    return conn
+
+def connect_read_only(db_file=DB_FILE, **kwargs):
+    # A mode=ro connection can't change the journal mode; the rest still applies
+    pragmas = [pragma for pragma in PRAGMAS if 'journal_mode' not in pragma]
+    return connect(f"file:{db_file}?mode=ro", pragmas=pragmas, uri=True, **kwargs)
+
+def missing_objects(conn, schema_files):
+    # Tables, indexes and triggers the schema files create that the database lacks
+    names = []
+    for path in schema_files:
+        with open(path, 'r') as f:
+            names += _SCHEMA_OBJECT.findall(f.read())
+    existing = {name for (name,) in sqlite3.Connection.execute(conn, "SELECT name FROM sqlite_master")}
+    return [name for name in names if name not in existing]
+
+def require_objects(conn, db_file, schema_files):
+    # Apps never run DDL: building an index on a large table would hold the
+    # write lock for the whole build. Schema changes are a deploy step.
+    missing = missing_objects(conn, schema_files)
+    if missing:
+        names = ', '.join(missing[:5]) + (f" and {len(missing) - 5} more" if len(missing) > 5 else '')
+        raise RuntimeError(f"{db_file} is missing {names}; run "
+                           f"`python seed_db.py --migrate --db {db_file}` (needed once after checkout and "
+                           f"whenever a .sql schema file changes, see README.md)")
+
+class ConnectionPool:
+    # Thread-safe pool of instrumented connections. Connections are opened
+    # lazily up to size; callers beyond that wait for one to come back.
+
+    def __init__(self, db_file=DB_FILE, size=POOL_SIZE, required_files=(), **kwargs):
+        self.db_file = db_file
+        self.size = size
+        self.required_files = required_files
+        self.kwargs = dict(kwargs, check_same_thread=False)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._watcher = None
+        self._checked_lock = threading.Lock()
+        self._checked = False
+
+    def _open(self):
+        conn = connect(self.db_file, **self.kwargs)
+        with self._checked_lock:
+            if not self._checked:
+                try:
+                    require_objects(conn, self.db_file, self.required_files)
+                except RuntimeError:
+                    conn.close()
+                    raise
+                self._checked = True
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._opened < self.size
+            if create:
+                self._opened += 1
+        if create:
+            try:
+                return self._open()
+            except BaseException:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return self._idle.get(timeout=POOL_TIMEOUT)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def _watch(self, sql):
+        # A dedicated uninstrumented connection so polling stays out of the metrics
+        with self._lock:
+            if self._watcher is None:
+                self._watcher = sqlite3.connect(self.db_file, check_same_thread=False)
+            return self._watcher.execute(sql).fetchall()
+
+    def data_version(self):
+        # Moves whenever any other connection commits, pooled ones included
+        return self._watch("PRAGMA data_version")[0][0]
+
+    def table_versions(self):
+        # name -> change counter, bumped by the triggers in changes.sql
+        return dict(self._watch("SELECT name, version FROM table_changes"))
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+
+def load_metrics(metrics_dir=None):
+    # Merges every recent process snapshot (and this process, live) into
+    # per-statement rows plus the combined slow-query log, newest first
+    metrics_dir = metrics_dir or METRICS_DIR
+    snapshots = {_metrics.path(metrics_dir): _metrics.snapshot()}
+    if os.path.isdir(metrics_dir):
+        now = time.time()
+        for name in os.listdir(metrics_dir):
+            path = os.path.join(metrics_dir, name)
+            if not name.endswith('.json') or path in snapshots or now - os.path.getmtime(path) > METRICS_MAX_AGE:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    snapshots[path] = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+    merged = {}
+    slow = []
+    for snapshot in snapshots.values():
+        for stats in snapshot['statements']:
+            key = (snapshot['source'], stats['sql'])
+            row = merged.setdefault(key, {'source': snapshot['source'], 'sql': stats['sql'], 'calls': 0,
+                                          'total_ms': 0.0, 'max_ms': 0.0, 'buckets': [0] * (len(BUCKETS_MS) + 1)})
+            row['calls'] += stats['calls']
+            row['total_ms'] += stats['total_ms']
+            row['max_ms'] = max(row['max_ms'], stats['max_ms'])
+            row['buckets'] = [a + b for a, b in zip(row['buckets'], stats['buckets'])]
+        slow.extend(snapshot['slow'])
+
+    statements = []
+    for row in merged.values():
+        statements.append({
+            'source': row['source'],
+            'statement': row['sql'],
+            'calls': row['calls'],
+            'total_ms': round(row['total_ms'], 1),
+            'avg_ms': round(row['total_ms'] / row['calls'], 3),
+            'p50_ms': percentile(row['buckets'], 50, row['max_ms']),
+            'p95_ms': percentile(row['buckets'], 95, row['max_ms']),
+            'p99_ms': percentile(row['buckets'], 99, row['max_ms']),
+            'max_ms': round(row['max_ms'], 2),
+        })
+    statements.sort(key=lambda row: row['total_ms'], reverse=True)
+    slow.sort(key=lambda entry: entry['at'], reverse=True)
+    return statements, slow
@@ -0,0 +1,335 @@
+import argparse
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import db_access
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(ROOT_DIR, 'vending.db')
+SKETCH_SCHEMA_FILE = os.path.join(ROOT_DIR, 'sketches.sql')
+
+# Longest sliding window the dashboard offers; older day buckets are dropped
+RETENTION_DAYS = 30
+BATCH_ROWS = 100_000
+
+# Count-Min: estimates overshoot by at most e/width of the window's total
+# with probability 1 - e^-depth
+CMS_DEPTH = 4
+CMS_WIDTH = 1024
+# Space-Saving counters per day and dimension; anything with more than
+# 1/TOP_K of the traffic is guaranteed to be among them
+TOP_K = 64
+# HyperLogLog registers = 2^HLL_P, ~1.04/sqrt(2^P) relative error (4.6%)
+HLL_P = 9
+
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+_GOLDEN = 0x9E3779B97F4A7C15
+_USER_SEED = 1_000_003
+
+def hash64(values, seed):
+    # splitmix64 finalizer, vectorized; uint64 arrays wrap silently
+    x = np.asarray(values, dtype=np.int64).astype(np.uint64) + np.uint64(seed * _GOLDEN % (1 << 64))
+    x = (x ^ (x >> np.uint64(30))) * _M1
+    x = (x ^ (x >> np.uint64(27))) * _M2
+    return x ^ (x >> np.uint64(31))
+
+def _bit_length(x):
+    n = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = x >= (np.uint64(1) << np.uint64(shift))
+        n[big] += shift
+        x = np.where(big, x >> np.uint64(shift), x)
+    return n + (x > 0)
+
+class CountMin:
+
+    def __init__(self, table=None):
+        self.table = np.zeros((CMS_DEPTH, CMS_WIDTH), dtype=np.int64) if table is None else table
+
+    def _columns(self, keys):
+        return np.stack([hash64(keys, row) % np.uint64(CMS_WIDTH) for row in range(CMS_DEPTH)]).astype(np.int64)
+
+    def add(self, keys, weights):
+        columns = self._columns(keys)
+        for row in range(CMS_DEPTH):
+            np.add.at(self.table[row], columns[row], weights)
+
+    def estimate(self, keys):
+        columns = self._columns(keys)
+        return self.table[np.arange(CMS_DEPTH)[:, None], columns].min(axis=0)
+
+    def merge(self, other):
+        self.table += other.table
+
+class SpaceSaving:
+    # key -> count for the TOP_K heaviest keys. Batches arrive pre-summed
+    # per key, so the Python loop runs once per distinct key, not per row.
+
+    def __init__(self, counts=None):
+        self.counts = counts or {}
+
+    def add(self, keys, weights):
+        for key, weight in zip(keys.tolist(), weights.tolist()):
+            if key in self.counts or len(self.counts) < TOP_K:
+                self.counts[key] = self.counts.get(key, 0) + weight
+            else:
+                # Replace the smallest counter; it inherits that count as error
+                smallest = min(self.counts, key=self.counts.get)
+                self.counts[key] = self.counts.pop(smallest) + weight
+
+    def merge(self, other):
+        # Sum, then keep the TOP_K largest (mergeable summaries)
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        if len(self.counts) > TOP_K:
+            self.counts = dict(sorted(self.counts.items(), key=lambda kv: kv[1], reverse=True)[:TOP_K])
+
+class DistinctUsers:
+    # One HyperLogLog per key (item or machine), registers stacked in a
+    # single uint8 array
+
+    def __init__(self, keys=None, registers=None):
+        self.index = {key: n for n, key in enumerate(keys or [])}
+        self.registers = registers if registers is not None else np.zeros((0, 1 << HLL_P), dtype=np.uint8)
+
+    def _rows(self, keys):
+        new = [key for key in dict.fromkeys(keys.tolist()) if key not in self.index]
+        if new:
+            for key in new:
+                self.index[key] = len(self.index)
+            self.registers = np.vstack([self.registers, np.zeros((len(new), 1 << HLL_P), dtype=np.uint8)])
+        return np.array([self.index[key] for key in keys.tolist()], dtype=np.int64)
+
+    def add(self, keys, user_ids):
+        if not len(keys):
+            return
+        hashed = hash64(user_ids, _USER_SEED)
+        bucket = (hashed >> np.uint64(64 - HLL_P)).astype(np.int64)
+        rest = hashed & ((np.uint64(1) << np.uint64(64 - HLL_P)) - np.uint64(1))
+        rank = (64 - HLL_P) - _bit_length(rest) + 1
+        rows = self._rows(keys)
+        np.maximum.at(self.registers, (rows, bucket), rank.astype(np.uint8))
+
+    def merge(self, other):
+        if not other.index:
+            return
+        keys = np.array(list(other.index), dtype=np.int64)
+        rows = self._rows(keys)
+        self.registers[rows] = np.maximum(self.registers[rows], other.registers[list(other.index.values())])
+
+    def estimate(self, keys):
+        m = 1 << HLL_P
+        alpha = 0.7213 / (1 + 1.079 / m)
+        result = np.zeros(len(keys))
+        for n, key in enumerate(keys):
+            row = self.index.get(key)
+            if row is None:
+                continue
+            registers = self.registers[row]
+            estimate = alpha * m * m / np.sum(np.exp2(-registers.astype(np.float64)))
+            zeros = np.count_nonzero(registers == 0)
+            if estimate <= 2.5 * m and zeros:
+                # Linear counting is far more accurate for small sets
+                estimate = m * np.log(m / zeros)
+            result[n] = estimate
+        return np.round(result)
+
+class DemandSketch:
+    # Everything tracked for one day (or, merged, for a window): item
+    # requests (survey upvotes) and machine problem reports, each with
+    # heavy hitters, point counts and distinct users.
+
+    def __init__(self):
+        self.requests = 0
+        self.reports = 0
+        self.item_counts = CountMin()
+        self.machine_counts = CountMin()
+        self.top_items = SpaceSaving()
+        self.top_machines = SpaceSaving()
+        self.item_users = DistinctUsers()
+        self.machine_users = DistinctUsers()
+
+    def add_requests(self, item_ids, user_ids, weights):
+        keys, inverse = np.unique(item_ids, return_inverse=True)
+        totals = np.bincount(inverse, weights=weights).astype(np.int64)
+        self.requests += int(totals.sum())
+        self.item_counts.add(keys, totals)
+        self.top_items.add(keys, totals)
+        self.item_users.add(item_ids, user_ids)
+
+    def add_reports(self, machine_ids, user_ids):
+        keys, totals = np.unique(machine_ids, return_counts=True)
+        self.reports += int(totals.sum())
+        self.machine_counts.add(keys, totals)
+        self.top_machines.add(keys, totals)
+        # Anonymous reports count toward totals but not distinct reporters
+        known = user_ids >= 0
+        self.machine_users.add(machine_ids[known], user_ids[known])
+
+    def merge(self, other):
+        self.requests += other.requests
+        self.reports += other.reports
+        for name in ('item_counts', 'machine_counts', 'top_items', 'top_machines', 'item_users', 'machine_users'):
+            getattr(self, name).merge(getattr(other, name))
+        return self
+
+    def top(self, dimension, n):
+        # Heavy-hitter candidates from Space-Saving, counted with Count-Min
+        # (both overestimate, so the smaller is the better bound)
+        top, counts, users = {
+            'items': (self.top_items, self.item_counts, self.item_users),
+            'machines': (self.top_machines, self.machine_counts, self.machine_users),
+        }[dimension]
+        keys = np.array(list(top.counts), dtype=np.int64)
+        if not len(keys):
+            return keys, keys, keys
+        estimates = np.minimum(counts.estimate(keys), np.array(list(top.counts.values()), dtype=np.int64))
+        order = np.argsort(-estimates, kind='stable')[:n]
+        return keys[order], estimates[order], users.estimate(keys[order].tolist()).astype(np.int64)
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            totals=np.array([self.requests, self.reports], dtype=np.int64),
+            item_counts=self.item_counts.table,
+            machine_counts=self.machine_counts.table,
+            top_items=np.array(list(self.top_items.counts.items()), dtype=np.int64).reshape(-1, 2),
+            top_machines=np.array(list(self.top_machines.counts.items()), dtype=np.int64).reshape(-1, 2),
+            item_user_keys=np.array(list(self.item_users.index), dtype=np.int64),
+            item_user_registers=self.item_users.registers,
+            machine_user_keys=np.array(list(self.machine_users.index), dtype=np.int64),
+            machine_user_registers=self.machine_users.registers,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, blob):
+        arrays = np.load(io.BytesIO(blob))
+        sketch = cls()
+        sketch.requests, sketch.reports = arrays['totals'].tolist()
+        sketch.item_counts = CountMin(arrays['item_counts'])
+        sketch.machine_counts = CountMin(arrays['machine_counts'])
+        sketch.top_items = SpaceSaving(dict(arrays['top_items'].tolist()))
+        sketch.top_machines = SpaceSaving(dict(arrays['top_machines'].tolist()))
+        sketch.item_users = DistinctUsers(arrays['item_user_keys'].tolist(), arrays['item_user_registers'])
+        sketch.machine_users = DistinctUsers(arrays['machine_user_keys'].tolist(), arrays['machine_user_registers'])
+        return sketch
+
+# name -> query for rows past the high-water mark: (id, day, key, user, weight)
+SOURCES = {
+    'surveys': """
+        SELECT survey_id, substr(created_at, 1, 10), item_id, user_id, vote
+        FROM surveys
+        WHERE survey_id > ?
+        ORDER BY survey_id
+        LIMIT ?
+    """,
+    'problem_reports': """
+        SELECT report_id, substr(created_at, 1, 10), machine_id, COALESCE(user_id, -1), 1
+        FROM problem_reports
+        WHERE report_id > ?
+        ORDER BY report_id
+        LIMIT ?
+    """,
+}
+
+def connect(db_file=DB_FILE):
+    # Autocommit mode so we control BEGIN/COMMIT per batch
+    conn = db_access.connect(db_file, isolation_level=None)
+    with open(SKETCH_SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    return conn
+
+def load_day(conn, day):
+    row = conn.execute("SELECT sketch FROM demand_sketches WHERE day = ?", (day,)).fetchone()
+    return DemandSketch.from_bytes(row[0]) if row else DemandSketch()
+
+def high_water_mark(conn, name):
+    row = conn.execute("SELECT last_id FROM sketch_state WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else 0
+
+def reset_sketches(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("DELETE FROM demand_sketches")
+    conn.execute("UPDATE sketch_state SET last_id = 0, updated_at = NULL")
+    conn.execute("COMMIT")
+
+def refresh_sketches(conn, batch_rows=BATCH_ROWS, today=None):
+    today = today or datetime.now()
+    oldest = (today - timedelta(days=RETENTION_DAYS - 1)).strftime('%Y-%m-%d')
+    for name, sql in SOURCES.items():
+        started = time.perf_counter()
+        hwm = high_water_mark(conn, name)
+        folded = 0
+        while True:
+            rows = conn.execute(sql, (hwm, batch_rows)).fetchall()
+            if not rows:
+                break
+            ids, days, keys, users, weights = (np.array(column) for column in zip(*rows))
+            keys, users, weights = keys.astype(np.int64), users.astype(np.int64), weights.astype(np.int64)
+            # Sketches and the high-water mark commit together, so a crash
+            # never counts a row twice or drops it
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for day in np.unique(days).tolist():
+                    if day < oldest:
+                        continue
+                    rows_for_day = days == day
+                    sketch = load_day(conn, day)
+                    if name == 'surveys':
+                        # Upvotes are requests; downvotes don't subtract demand
+                        wanted = rows_for_day & (weights > 0)
+                        sketch.add_requests(keys[wanted], users[wanted], weights[wanted])
+                    else:
+                        sketch.add_reports(keys[rows_for_day], users[rows_for_day])
+                    conn.execute(
+                        "INSERT OR REPLACE INTO demand_sketches (day, sketch) VALUES (?, ?)",
+                        (day, sketch.to_bytes()),
+                    )
+                hwm = int(ids[-1])
+                conn.execute(
+                    "UPDATE sketch_state SET last_id = ?, updated_at = ? WHERE name = ?",
+                    (hwm, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), name),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            folded += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"{name} sketched through id {hwm} ({folded:,} new rows) in {elapsed:.2f}s.")
+    conn.execute("DELETE FROM demand_sketches WHERE day < ?", (oldest,))
+
+def window_sketch(rows, days, today=None):
+    # Merge of the day sketches inside the last `days` days (today included).
+    # rows: (day, blob) pairs, at most RETENTION_DAYS of them, so the cost
+    # is independent of how many votes or reports went in.
+    today = today or datetime.now()
+    since = (today - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    window = DemandSketch()
+    for day, blob in rows:
+        if day >= since:
+            window.merge(DemandSketch.from_bytes(blob))
+    return window
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold new surveys and problem reports into the daily demand sketches")
+    parser.add_argument('--db', default=DB_FILE, help="Database file to update")
+    parser.add_argument('--rebuild', action='store_true', help="Drop the sketches and rebuild from the retained history")
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="Keep refreshing on this interval")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.rebuild:
+        reset_sketches(conn)
+    refresh_sketches(conn)
+    while args.watch:
+        time.sleep(args.watch)
+        refresh_sketches(conn)
+    conn.close()
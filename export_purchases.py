@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+import build_rollups
+import db_access
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(ROOT_DIR, 'vending.db')
+EXPORT_DIR = os.path.join(ROOT_DIR, 'exports', 'purchases')
+STATE_FILE = '_export_state.json'
+
+# Rows pulled from SQLite per round trip; bounds memory on 100M-row exports
+FETCH_ROWS = 200_000
+ROW_GROUP_ROWS = 1_000_000
+
+# Partition column "day" lives in the directory name (day=YYYY-MM-DD)
+SCHEMA = pa.schema([
+    ('purchase_id', pa.int64()),
+    ('timestamp', pa.timestamp('s')),
+    ('user_id', pa.int64()),
+    ('machine_id', pa.int64()),
+    ('item_id', pa.int64()),
+    ('item_name', pa.string()),
+    ('category', pa.string()),
+    ('price', pa.float64()),
+    ('credits_earned', pa.float64()),
+    ('address', pa.string()),
+    ('location_lat', pa.float64()),
+    ('location_lng', pa.float64()),
+])
+
+EXPORT_SQL = """
+    SELECT p.purchase_id, DATE(p.timestamp) AS day, p.timestamp, p.user_id, p.machine_id, p.item_id,
+           i.name, i.category, i.price, p.credits_earned,
+           vm.address, vm.location_lat, vm.location_lng
+    FROM purchases p
+    JOIN items i ON p.item_id = i.item_id
+    JOIN vending_machines vm ON p.machine_id = vm.machine_id
+    WHERE p.purchase_id > ?
+    ORDER BY p.purchase_id
+"""
+
+def load_state(export_dir):
+    path = os.path.join(export_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return {'last_purchase_id': 0}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(export_dir, state):
+    path = os.path.join(export_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def exported_days(export_dir):
+    if not os.path.isdir(export_dir):
+        return set()
+    # A day counts only once its part file was published, not just mkdir'd
+    return {
+        name.split('=', 1)[1] for name in os.listdir(export_dir)
+        if name.startswith('day=') and os.path.exists(os.path.join(export_dir, name, 'part-0.parquet'))
+    }
+
+def clear_export(export_dir):
+    # Drops every published partition and the state file
+    for name in os.listdir(export_dir):
+        if name.startswith('day='):
+            shutil.rmtree(os.path.join(export_dir, name))
+    if os.path.exists(os.path.join(export_dir, STATE_FILE)):
+        os.remove(os.path.join(export_dir, STATE_FILE))
+
+def _next_part(day_dir):
+    # Late purchases for a published day go in an extra part file
+    n = 0
+    while os.path.exists(os.path.join(day_dir, f"part-{n}.parquet")):
+        n += 1
+    return os.path.join(day_dir, f"part-{n}.parquet")
+
+def _to_batch(rows):
+    columns = list(zip(*rows))
+    stamps = pc.strptime(pa.array(columns[2], pa.string()), format='%Y-%m-%d %H:%M:%S', unit='s')
+    arrays = [pa.array(columns[0], pa.int64()), stamps] + [
+        pa.array(values, field.type) for values, field in zip(columns[3:], list(SCHEMA)[2:])
+    ]
+    return pa.array(columns[1], pa.string()), pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+def export_purchases(db_file=DB_FILE, export_dir=EXPORT_DIR, until=None, reset=False):
+    # Appends one Parquet partition per finished day that isn't exported
+    # yet. Today is left for the next run; purchases that arrive late for
+    # an exported day are added to it as another part file.
+    started = time.perf_counter()
+    until = until or datetime.now().strftime('%Y-%m-%d')
+    os.makedirs(export_dir, exist_ok=True)
+    state = load_state(export_dir)
+
+    # Read-only and outside any write transaction, so the app keeps writing
+    conn = db_access.connect_read_only(db_file)
+    sequence = build_rollups.purchase_sequence(conn)
+    exported_through = max([state['last_purchase_id']] + list(state.get('days', {}).values()))
+    if exported_through > sequence:
+        # purchases was reset (e.g. reseeded) since the last run: new ids
+        # below our mark would be skipped and the rest mixed into old days
+        if not reset:
+            conn.close()
+            raise RuntimeError(f"{db_file} purchase ids only reach {sequence} but {export_dir} is exported through "
+                               f"{exported_through}; the database was reset. Rerun with --reset to "
+                               f"drop the published partitions and export from scratch.")
+        print(f"purchases id sequence {sequence} is below the export mark {exported_through}, re-exporting.")
+        clear_export(export_dir)
+        state = load_state(export_dir)
+    # day -> highest purchase_id published for it, so a rerun after a crash
+    # never writes the same rows twice
+    published_through = state.setdefault('days', {})
+    done = exported_days(export_dir)
+
+    cursor = conn.execute(EXPORT_SQL, (state['last_purchase_id'],))
+
+    # day -> (writer, tmp path, highest purchase_id written)
+    writers = {}
+    published = set()
+    parts = 0
+    rows_written = 0
+    late_rows = 0
+
+    def publish(day):
+        writer, tmp, last_id = writers.pop(day)
+        writer.close()
+        # Publish atomically: readers never see a half-written partition
+        os.replace(tmp, tmp[:-len('.tmp')])
+        published_through[day] = last_id
+        save_state(export_dir, state)
+        published.add(day)
+
+    # First purchase we had to leave behind (today's or later); the next
+    # run resumes from just before it.
+    resume_from = None
+    last_seen = state['last_purchase_id']
+    try:
+        while True:
+            rows = cursor.fetchmany(FETCH_ROWS)
+            if not rows:
+                break
+            last_seen = rows[-1][0]
+            days, batch = _to_batch(rows)
+            ids = batch.column(0)
+            # Ids follow insertion time, so days before the stream's
+            # position are finished; publishing them right away keeps few
+            # files open even when a first export covers years
+            position = days[-1].as_py()
+            for day in pc.unique(days).to_pylist():
+                if day >= until:
+                    if resume_from is None:
+                        first = pc.index(days, day).as_py()
+                        resume_from = rows[first][0]
+                    continue
+                part = batch.filter(pc.and_(pc.equal(days, day), pc.greater(ids, published_through.get(day, 0))))
+                if not part.num_rows:
+                    continue
+                if day not in writers:
+                    day_dir = os.path.join(export_dir, f"day={day}")
+                    os.makedirs(day_dir, exist_ok=True)
+                    tmp = _next_part(day_dir) + '.tmp'
+                    writers[day] = (pq.ParquetWriter(tmp, SCHEMA, compression='zstd'), tmp, 0)
+                    parts += 1
+                writer, tmp, _ = writers[day]
+                writer.write_batch(part, row_group_size=ROW_GROUP_ROWS)
+                writers[day] = (writer, tmp, pc.max(part.column(0)).as_py())
+                rows_written += part.num_rows
+                if day in done:
+                    late_rows += part.num_rows
+                if day < position:
+                    publish(day)
+            for day in [day for day in writers if day < position]:
+                publish(day)
+    except BaseException:
+        for writer, tmp, _ in writers.values():
+            writer.close()
+            os.remove(tmp)
+        raise
+    finally:
+        conn.close()
+
+    for day in list(writers):
+        publish(day)
+
+    state['last_purchase_id'] = resume_from - 1 if resume_from is not None else last_seen
+    state['exported_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    save_state(export_dir, state)
+
+    elapsed = time.perf_counter() - started
+    new_days = published - done
+    print(f"Exported {rows_written:,} purchases into {len(new_days)} new partitions ({parts} part files) "
+          f"in {elapsed:.1f}s ({len(done | published)} total).")
+    if late_rows:
+        print(f"{late_rows:,} late purchases were appended to {len(published & done)} already exported days.")
+    return sorted(published)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Append date-partitioned Parquet snapshots of purchases")
+    parser.add_argument('--db', default=DB_FILE, help="Database file to read")
+    parser.add_argument('--out', default=EXPORT_DIR, help="Dataset directory")
+    parser.add_argument('--until', help="Export days before this date (YYYY-MM-DD, default today)")
+    parser.add_argument('--reset', action='store_true', help="If the database was reseeded, drop the existing export and start over")
+    args = parser.parse_args()
+    export_purchases(args.db, args.out, args.until, args.reset)
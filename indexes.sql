@@ -0,0 +1,11 @@
+-- Secondary indexes, kept out of schema.sql so bulk loads can build them
+-- once after the data is in. Every statement is idempotent.
+
+CREATE INDEX IF NOT EXISTS idx_inventory_machine_item ON inventory(machine_id, item_id);
+CREATE INDEX IF NOT EXISTS idx_purchases_machine_item ON purchases(machine_id, item_id);
+CREATE INDEX IF NOT EXISTS idx_problem_reports_machine ON problem_reports(machine_id, status);
+-- Open reports across the fleet (fleet_summary, urgent_maintenance)
+CREATE INDEX IF NOT EXISTS idx_problem_reports_status ON problem_reports(status, machine_id);
+CREATE INDEX IF NOT EXISTS idx_alerts_machine_open ON alerts(machine_id, resolved);
+-- Covers "which machines stock item X" for /search/item and the search page
+CREATE INDEX IF NOT EXISTS idx_inventory_item_stock ON inventory(item_id, quantity, machine_id);
@@ -0,0 +1,418 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sqlite3
+import statistics
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import db_access
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.path.join(ROOT_DIR, 'vending.db')
+INDEXES_FILE = os.path.join(ROOT_DIR, 'indexes.sql')
+HOST = '127.0.0.1'
+PORT = 3001
+
+# Same thresholds as /machine/update in server.js
+LOW_STOCK = 3
+HIGH_TEMPERATURE = 45
+
+# Heartbeats waiting for the writer; a full queue makes handlers wait,
+# which pushes back on clients instead of growing memory.
+QUEUE_SIZE = 50_000
+MAX_BATCH = 5_000
+# After the first heartbeat arrives, wait this long for company before committing
+BATCH_LINGER = 0.002
+STATS_INTERVAL = 10.0
+# SQLite caps bound parameters; stay well below it for IN (...) lists
+IN_CHUNK = 500
+
+LOW_STOCK_RE = re.compile(r'^Item (\S+) low stock')
+# SQLite integers are signed 64-bit; anything bigger fails at bind time
+MAX_INTEGER = 2 ** 63 - 1
+
+def connect(db_file=DB_FILE):
+    # WAL + NORMAL (db_access.PRAGMAS) only fsyncs at checkpoints; a crash
+    # can lose the last batches but never corrupts the file, which
+    # heartbeats can tolerate.
+    conn = db_access.connect(db_file, isolation_level=None, check_same_thread=False)
+    # The alert and inventory lookups need indexes.sql; building them here
+    # would block ingestion for minutes on a big database
+    try:
+        db_access.require_objects(conn, db_file, [INDEXES_FILE])
+    except RuntimeError:
+        conn.close()
+        raise
+    return conn
+
+def alert_key(machine_id, alert_type, message):
+    # One open alert per machine and condition; low stock is per item
+    if alert_type == 'low_stock':
+        match = LOW_STOCK_RE.match(message)
+        return (machine_id, alert_type, match.group(1) if match else message)
+    return (machine_id, alert_type, None)
+
+def _integer(value, field):
+    # JSON ids arrive as 2, "2" or 2.0 depending on the client; bools are not ids
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"{field} must be an integer")
+    try:
+        value = int(value)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError(f"{field} must be an integer") from None
+    # Ids and counts are never negative
+    if not 0 <= value <= MAX_INTEGER:
+        raise ValueError(f"{field} must be between 0 and {MAX_INTEGER}")
+    return value
+
+def parse_update(update):
+    # Checks and normalizes a heartbeat before it is queued. Anything that
+    # reached apply_batch malformed would roll back the whole group commit,
+    # failing every machine in the batch, not just the sender.
+    if not isinstance(update, dict) or update.get('machine_id') in (None, ''):
+        raise ValueError("machine_id is required")
+    inventory = update.get('inventory') or {}
+    if not isinstance(inventory, dict):
+        raise ValueError("inventory must be an object of item_id: quantity")
+    temperature = update.get('temperature')
+    if temperature is not None:
+        if isinstance(temperature, bool) or not isinstance(temperature, (int, float)):
+            raise ValueError("temperature must be a number")
+    power = update.get('power')
+    if power is not None and not isinstance(power, str):
+        raise ValueError("power must be a string")
+    return {
+        # Integers throughout, so alert and inventory keys match what SQLite returns
+        'machine_id': _integer(update['machine_id'], 'machine_id'),
+        'inventory': {_integer(item_id, 'inventory item_id'): _integer(quantity, 'inventory quantity')
+                      for item_id, quantity in inventory.items()},
+        'temperature': temperature,
+        'power': power,
+    }
+
+def alerts_for(update):
+    machine_id = update['machine_id']
+    alerts = []
+    for item_id, quantity in (update.get('inventory') or {}).items():
+        if quantity < LOW_STOCK:
+            alerts.append((machine_id, 'low_stock', f"Item {item_id} low stock ({quantity} left)"))
+    temperature = update.get('temperature')
+    if temperature is not None and temperature > HIGH_TEMPERATURE:
+        alerts.append((machine_id, 'high_temperature', f"Temperature high: {temperature}°C"))
+    if update.get('power') == 'off':
+        alerts.append((machine_id, 'power_off', "Machine power is OFF"))
+    return alerts
+
+def apply_batch(conn, updates):
+    # Coalesce first: the latest heartbeat per machine/item wins, so a chatty
+    # machine costs one UPDATE per batch no matter how often it reported.
+    statuses = {}
+    quantities = {}
+    wanted_alerts = {}
+    for update in updates:
+        machine_id = update['machine_id']
+        statuses[machine_id] = 'offline' if update.get('power') == 'off' else 'operational'
+        for item_id, quantity in (update.get('inventory') or {}).items():
+            quantities[(machine_id, item_id)] = quantity
+        for alert in alerts_for(update):
+            wanted_alerts[alert_key(*alert)] = alert
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Unchanged rows are skipped: a no-op UPDATE would still fire the
+        # change-counter triggers and drop the dashboards' cached results
+        conn.executemany(
+            "UPDATE vending_machines SET status = ? WHERE machine_id = ? AND status IS NOT ?",
+            [(status, machine_id, status) for machine_id, status in statuses.items()],
+        )
+        conn.executemany(
+            "UPDATE inventory SET quantity = ? WHERE machine_id = ? AND item_id = ? AND quantity IS NOT ?",
+            [(quantity, machine_id, item_id, quantity) for (machine_id, item_id), quantity in quantities.items()],
+        )
+
+        inserted = 0
+        if wanted_alerts:
+            # Read open alerts inside the write transaction so a concurrent
+            # resolve can't slip between the check and the insert.
+            machine_ids = sorted({key[0] for key in wanted_alerts})
+            open_alerts = {}
+            for start in range(0, len(machine_ids), IN_CHUNK):
+                chunk = machine_ids[start:start + IN_CHUNK]
+                rows = conn.execute(f"""
+                    SELECT alert_id, machine_id, type, message FROM alerts
+                    WHERE resolved = 0 AND machine_id IN ({','.join('?' * len(chunk))})
+                """, chunk)
+                for alert_id, machine_id, alert_type, message in rows:
+                    open_alerts[alert_key(machine_id, alert_type, message)] = (alert_id, message)
+
+            new_rows, refreshed = [], []
+            for key, (machine_id, alert_type, message) in wanted_alerts.items():
+                existing = open_alerts.get(key)
+                if existing is None:
+                    new_rows.append((machine_id, alert_type, message))
+                elif existing[1] != message:
+                    # Keep the open alert current (e.g. "1 left" instead of "2 left")
+                    refreshed.append((message, existing[0]))
+            conn.executemany("INSERT INTO alerts (machine_id, type, message) VALUES (?, ?, ?)", new_rows)
+            conn.executemany("UPDATE alerts SET message = ? WHERE alert_id = ?", refreshed)
+            inserted = len(new_rows)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return inserted
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class IngestService:
+    def __init__(self, db_file=DB_FILE):
+        self.db_file = db_file
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        # One writer thread owns the connection; SQLite allows one writer anyway
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.conn = None
+        self.updates = 0
+        self.batches = 0
+        self.alerts_inserted = 0
+        self.commit_ms = deque(maxlen=10_000)
+        self.batch_sizes = deque(maxlen=10_000)
+        self.started = time.perf_counter()
+
+    def _commit(self, updates):
+        if self.conn is None:
+            self.conn = connect(self.db_file)
+        started = time.perf_counter()
+        inserted = apply_batch(self.conn, updates)
+        return inserted, (time.perf_counter() - started) * 1000
+
+    async def submit(self, update):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((update, future))
+        # Acknowledge only after the batch holding this update committed
+        await future
+
+    async def writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            # Everything that queued up while the last commit ran goes in
+            # this one; linger briefly so a lone heartbeat picks up company.
+            deadline = loop.time() + BATCH_LINGER
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+
+            updates = [update for update, _ in batch]
+            try:
+                inserted, commit_ms = await loop.run_in_executor(self.executor, self._commit, updates)
+            except Exception as e:
+                print(f"Batch of {len(batch)} failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.updates += len(batch)
+            self.batches += 1
+            self.alerts_inserted += inserted
+            self.commit_ms.append(commit_ms)
+            self.batch_sizes.append(len(batch))
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        commits = list(self.commit_ms)
+        return {
+            'updates': self.updates,
+            'batches': self.batches,
+            'alerts_inserted': self.alerts_inserted,
+            'updates_per_sec': self.updates / elapsed if elapsed > 0 else 0.0,
+            'avg_batch_size': statistics.fmean(self.batch_sizes) if self.batch_sizes else 0.0,
+            'commit_ms_p50': percentile(commits, 50),
+            'commit_ms_p99': percentile(commits, 99),
+            'queue_depth': self.queue.qsize(),
+        }
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            s = self.stats()
+            print(f"{s['updates']:,} updates in {s['batches']:,} batches "
+                  f"(avg {s['avg_batch_size']:.1f}/batch), {s['updates_per_sec']:,.0f} updates/sec, "
+                  f"commit p50 {s['commit_ms_p50']:.1f}ms p99 {s['commit_ms_p99']:.1f}ms, "
+                  f"{s['alerts_inserted']:,} alerts, queue {s['queue_depth']}")
+
+    async def route(self, method, path, body):
+        if method == 'POST' and path == '/machine/update':
+            try:
+                update = json.loads(body or b'{}')
+            except ValueError:
+                return 400, {'error': 'invalid JSON body'}
+            try:
+                update = parse_update(update)
+            except ValueError as e:
+                return 400, {'error': str(e)}
+            try:
+                await self.submit(update)
+            except Exception as e:
+                return 500, {'error': str(e)}
+            return 200, {'status': 'update processed'}
+        if method == 'GET' and path == '/stats':
+            return 200, self.stats()
+        return 404, {'error': 'not found'}
+
+    async def handle(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive, enough for the machines' JSON POSTs
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.route(method, path.split('?', 1)[0], body)
+                data = json.dumps(payload).encode()
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(db_file=DB_FILE, host=HOST, port=PORT):
+    service = IngestService(db_file)
+    # Open the writer connection up front so a database that needs
+    # migrating fails here, not on the first heartbeat
+    service.conn = connect(db_file)
+    server = await asyncio.start_server(service.handle, host, port, backlog=1024)
+    print(f"Telemetry ingest listening on http://{host}:{port}/machine/update")
+    async with server:
+        await asyncio.gather(server.serve_forever(), service.writer(), service.report())
+
+# Load generator
+
+async def _request(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(
+        f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+    )
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+def _fleet(db_file):
+    conn = sqlite3.connect(db_file)
+    slots = {}
+    for machine_id, item_id in conn.execute("SELECT machine_id, item_id FROM inventory"):
+        slots.setdefault(machine_id, []).append(str(item_id))
+    conn.close()
+    return list(slots.items())
+
+def heartbeat(machine_id, item_ids, rng):
+    return {
+        'machine_id': machine_id,
+        'inventory': {item_id: rng.randint(0, 15) for item_id in item_ids},
+        'temperature': round(rng.gauss(38, 4), 1),
+        'power': 'off' if rng.random() < 0.01 else 'on',
+        'last_heartbeat': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+async def load_test(db_file=DB_FILE, host=HOST, port=PORT, concurrency=64, duration=30.0, seed=None):
+    fleet = _fleet(db_file)
+    if not fleet:
+        print("No inventory rows to simulate; seed the database first.")
+        return
+    latencies = []
+    sent = 0
+    errors = 0
+    stop_at = time.perf_counter() + duration
+
+    async def client(worker_id):
+        nonlocal sent, errors
+        rng = random.Random(None if seed is None else seed + worker_id)
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while time.perf_counter() < stop_at:
+                machine_id, item_ids = fleet[rng.randrange(len(fleet))]
+                started = time.perf_counter()
+                status, _ = await _request(reader, writer, 'POST', '/machine/update', heartbeat(machine_id, item_ids, rng))
+                latencies.append((time.perf_counter() - started) * 1000)
+                if status == 200:
+                    sent += 1
+                else:
+                    errors += 1
+        finally:
+            writer.close()
+
+    print(f"Sending heartbeats for {len(fleet):,} machines over {concurrency} connections for {duration:.0f}s...")
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, server_stats = await _request(reader, writer, 'GET', '/stats')
+    writer.close()
+
+    print(f"Sustained {sent / elapsed:,.0f} updates/sec ({sent:,} ok, {errors:,} errors in {elapsed:.1f}s)")
+    print(f"Request latency p50 {percentile(latencies, 50):.1f}ms p99 {percentile(latencies, 99):.1f}ms")
+    print(f"Server: avg batch {server_stats['avg_batch_size']:.1f} updates, "
+          f"commit p50 {server_stats['commit_ms_p50']:.1f}ms p99 {server_stats['commit_ms_p99']:.1f}ms, "
+          f"{server_stats['alerts_inserted']:,} alerts inserted")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched telemetry ingestion for machine heartbeats")
+    parser.add_argument('mode', choices=['serve', 'loadgen'])
+    parser.add_argument('--db', default=DB_FILE, help="Database file")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--concurrency', type=int, default=64, help="loadgen: open connections")
+    parser.add_argument('--duration', type=float, default=30.0, help="loadgen: seconds to run")
+    parser.add_argument('--seed', type=int, help="loadgen: random seed")
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        asyncio.run(serve(args.db, args.host, args.port))
+    else:
+        asyncio.run(load_test(args.db, args.host, args.port, args.concurrency, args.duration, args.seed))
@@ -1,46 +1,123 @@
 import streamlit as st
-import pandas as pd
 
-st.set_page_config(page_title="Vending-Go Admin", layout="wide")
+import data_loader as data
+import demand
+import restock_planner
+import snapshots
 
-inv = pd.read_csv('inventory.csv')
-fb = pd.read_csv('feedback.csv')
+st.set_page_config(page_title="Vending-Go Admin", layout="wide")
+data.set_source("business")
 
 st.title("📈 Business Analytics Portal")
 
 # Level 1: Grand Totals (Anonymized)
+summary = data.fleet_summary()
 col1, col2, col3 = st.columns(3)
-col1.metric("Total Machines", len(inv))
-col2.metric("Active Issues", len(fb[fb['type'] == 'issue']))
-col3.metric("Stock Health", f"{inv['stock_level'].mean():.1f}%")
+col1.metric("Total Machines", int(summary['total_machines']))
+col2.metric("Active Issues", int(summary['open_issues']))
+col3.metric("Stock Health", f"{summary['stock_health']:.1f}%")
+
+# Month-over-month revenue comes from the Parquet snapshots written by
+# export_purchases.py, so it never scans the live database
+st.divider()
+st.subheader("Revenue by Month")
+monthly = snapshots.monthly_revenue()
+if monthly.empty:
+    st.info("No snapshot yet. Run export_purchases.py to build one.")
+else:
+    latest = monthly.iloc[-1]
+    change = latest['change_percent']
+    st.metric(f"Revenue {latest['month']}", f"${latest['revenue']:,.2f}",
+              None if change != change else f"{change:+.1f}% vs last month")
+    st.bar_chart(monthly.set_index('month')['revenue'])
 
 # Level 2: Recommendations and Demand
 st.divider()
 st.subheader("Customer Demand (Anonymized)")
 
-# This counts requests for items
-request_counts = fb[fb['type'] == 'request']['content'].value_counts()
-st.bar_chart(request_counts)
+# Read from the day sketches kept by demand_sketches.py: a window merges
+# at most 30 fixed-size sketches, however many votes have piled up
+window_label = st.radio("Window", list(demand.WINDOWS), horizontal=True)
+days = demand.WINDOWS[window_label]
+requests_total, reports_total = demand.totals(days)
+col1, col2 = st.columns(2)
+with col1:
+    st.metric("Item Requests", f"{requests_total:,}")
+    requests = demand.top_items(days)
+    if not requests.empty:
+        st.bar_chart(requests.set_index('item')['requests'])
+        st.dataframe(requests)
+with col2:
+    st.metric("Problem Reports", f"{reports_total:,}")
+    st.dataframe(demand.top_machines(days))
+st.caption(f"Sketches updated {demand.last_updated() or 'never (run demand_sketches.py)'}; "
+           "counts are Count-Min/Space-Saving estimates, distinct users HyperLogLog (~5%).")
 
 # Level 3: Individual Machine Drill-down
 st.subheader("Machine Status")
-selected_machine = st.selectbox("Select Machine to Inspect", inv['name'])
+machines = data.machine_options()
+selected_machine = st.selectbox(
+    "Select Machine to Inspect", machines['machine_id'],
+    format_func=dict(zip(machines['machine_id'], machines['address'])).get,
+)
 
-machine_data = inv[inv['name'] == selected_machine].iloc[0]
-st.write(f"**Location:** {machine_data['university']}")
-st.write(f"**Current Top Seller:** {machine_data['top_item']}")
+machine_data = data.machine_detail(int(selected_machine))
+st.write(f"**Location:** {machine_data['address']}")
+st.write(f"**Status:** {machine_data['status']}")
+st.write(f"**Current Top Seller:** {machine_data['top_item'] or 'No sales yet'}")
 
 # Display issues for this specific machine
 st.warning("Reported Issues:")
-st.table(fb[(fb['machine_id'] == machine_data['id']) & (fb['type'] == 'issue')])
+st.table(data.machine_issues(int(selected_machine)))
 
-# Add this to business.py under the bar chart section
 st.divider()
 st.subheader("⚠️ Urgent Maintenance Needed")
 
-# Join feedback and inventory to see which names have the most issues
-issue_df = fb[fb['type'] == 'issue']
-priority_list = issue_df.groupby('machine_id').size().reset_index(name='issue_count')
-priority_list = priority_list.merge(inv[['id', 'name']], left_on='machine_id', right_on='id').sort_values(by='issue_count', ascending=False)
+# Machines with the most open problem reports, ranked in SQL
+st.table(data.urgent_maintenance(5))
+
+st.divider()
+st.subheader("🚚 Restock Plan")
+
+col1, col2, col3 = st.columns(3)
+horizon = col1.slider("Forecast horizon (hours)", 12, 168, restock_planner.HORIZON_HOURS, step=12)
+drivers = col2.number_input("Drivers", 1, 50, restock_planner.DRIVERS)
+max_stops = col3.number_input("Max stops per driver", 5, 200, restock_planner.MAX_STOPS)
+
+# Depletion rates and routes are recomputed only when the data changes
+plan = restock_planner.cached_plan(horizon, int(drivers), int(max_stops))
+routes = plan['routes']
+
+col1, col2, col3 = st.columns(3)
+col1.metric("Machines Due", len(plan['machines']))
+col2.metric("Slots At Risk", len(plan['slots']))
+col3.metric("Units To Load", int(routes['restock_units'].sum()) if not routes.empty else 0)
+
+if routes.empty:
+    st.success("Nothing forecast to run out in this window.")
+else:
+    st.map(routes[['lat', 'lon']])
+    st.table(restock_planner.route_summary(routes))
+    driver = st.selectbox("Route for driver", sorted(routes['driver'].unique()))
+    st.dataframe(routes[routes['driver'] == driver][['stop', 'address', 'hours_to_stockout', 'restock_units', 'leg_km']])
+
+st.divider()
+st.subheader("🐢 Database Performance")
 
-st.table(priority_list[['name', 'issue_count']].head(5))
\ No newline at end of file
+# Latency per statement from every process on db_access (both dashboards,
+# seed, rollups, ingest), flushed to db_metrics/ every few seconds
+statements, slow = data.performance()
+if statements.empty:
+    st.info("No queries recorded yet.")
+else:
+    by_source = statements.groupby('source')['total_ms'].sum().sort_values(ascending=False)
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Statements Tracked", len(statements))
+    col2.metric("Busiest Source", by_source.index[0], f"{by_source.iloc[0] / 1000:,.1f}s total")
+    col3.metric("Slow Queries Logged", len(slow))
+    st.bar_chart(by_source)
+    st.caption("Heaviest statements by total time")
+    st.dataframe(statements.head(20))
+    if not slow.empty:
+        st.caption("Slow-query log with query plans")
+        st.dataframe(slow)
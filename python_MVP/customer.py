@@ -1,24 +1,41 @@
 import streamlit as st
-import pandas as pd
+
+import data_loader as data
+import item_search
+import recommender
+import spatial_index
 
 st.set_page_config(page_title="Vending-Go Customer", layout="centered")
+data.set_source("customer")
 
-# Load Data
-inv = pd.read_csv('inventory.csv')
+# Demo account until the MVP has sign-in
+DEMO_USER_ID = 1
+# MSU Union, where the demo fleet is centred
+DEFAULT_LOCATION = (42.7233, -84.4812)
 
 st.title("🥤 Vending-Go")
 st.caption("Nearby Snack Tracker")
 
+# Shared by the recommendations and the machine map
+st.sidebar.header("Your Location")
+my_lat = st.sidebar.number_input("Latitude", value=DEFAULT_LOCATION[0], format="%.4f")
+my_lng = st.sidebar.number_input("Longitude", value=DEFAULT_LOCATION[1], format="%.4f")
+
 tab1, tab2, tab3 = st.tabs(["Home", "Map", "Request"])
 
 with tab1:
     st.header("Recommended for You")
     col1, col2 = st.columns(2)
-    col1.metric("Current Credit", "$12.50", "+$2.00")
-    col2.metric("Reward Score", "740", "Gold Tier")
-    
-    st.subheader("Fast Restocks Near You")
-    st.dataframe(inv[['name', 'top_item', 'stock_level']])
+    col1.metric("Current Credit", f"{data.user_credits(DEMO_USER_ID):,}")
+    favourites = recommender.favourite_items(DEMO_USER_ID)
+    col2.metric("Your Favourite", favourites[0] if favourites else "Nothing yet")
+
+    # Co-occurrence picks limited to what's in stock at the closest machines
+    picks = recommender.recommend_nearby(DEMO_USER_ID, my_lat, my_lng)
+    if picks.empty:
+        st.info("Nothing in stock nearby right now.")
+    else:
+        st.table(picks[['name', 'price', 'address', 'distance_km']])
 
 with tab2:
     st.header("Find a Machine")
@@ -27,23 +44,44 @@ with tab2:
     
     # Filter by accessibility or search
     acc_only = st.checkbox("Only show accessible machines")
-    
-    filtered_df = inv
-    if acc_only:
-        filtered_df = filtered_df[filtered_df['is_accessible'] == True]
+
+    how_many = st.slider("Machines to show", 5, 50, 10)
+
+    # Typo-tolerant catalog search, then the nearest machines with any
+    # match in stock, answered from the grid index
+    item_ids = None
     if search:
-        filtered_df = filtered_df[filtered_df['top_item'].str.contains(search, case=False)]
+        matches = item_search.search_items(search)
+        item_ids = matches['item_id'].tolist()
+        st.caption("Matching: " + (", ".join(matches['name']) if item_ids else "nothing in the catalog"))
+    filtered_df = spatial_index.nearest_machines(my_lat, my_lng, k=how_many, item_ids=item_ids, accessible_only=acc_only)
 
     st.map(filtered_df)
-    st.table(filtered_df[['name', 'university', 'is_accessible']])
+    st.table(filtered_df[['address', 'distance_km', 'accessible_features']])
+
+    if item_ids:
+        with st.expander("Every machine stocking it"):
+            st.dataframe(item_search.machines_stocking(item_ids))
 
 with tab3:
     st.header("Request or Report")
+    machines = data.machine_options()
+    items = data.item_options()
     with st.form("feedback_form"):
-        m_id = st.selectbox("Which machine?", inv['id'])
+        m_id = st.selectbox(
+            "Which machine?", machines['machine_id'],
+            format_func=dict(zip(machines['machine_id'], machines['address'])).get,
+        )
         f_type = st.radio("Type", ["Request New Item", "Report Issue"])
+        item_id = st.selectbox(
+            "Item (for requests)", items['item_id'],
+            format_func=dict(zip(items['item_id'], items['name'])).get,
+        )
         content = st.text_area("Details")
         
         if st.form_submit_button("Submit"):
-            # JANK ALERT: In a real app, this would write to the CSV
-            st.success("Submitted! (In MVP mode, this doesn't save to file yet)")
\ No newline at end of file
+            if f_type == "Request New Item":
+                data.submit_item_request(DEMO_USER_ID, int(item_id))
+            else:
+                data.submit_problem_report(int(m_id), content or "No details given", user_id=DEMO_USER_ID)
+            st.success("Submitted!")
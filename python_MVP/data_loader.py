@@ -0,0 +1,251 @@
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+
+import pandas as pd
+
+# Dashboards share the app's database in the repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The pooled, instrumented SQLite layer lives in the repo root too
+sys.path.insert(0, ROOT_DIR)
+import db_access
+
+DB_FILE = os.environ.get('VENDING_DB', os.path.join(ROOT_DIR, 'vending.db'))
+INDEXES_FILE = os.path.join(ROOT_DIR, 'indexes.sql')
+ROLLUP_SCHEMA_FILE = os.path.join(ROOT_DIR, 'rollups.sql')
+SEARCH_SCHEMA_FILE = os.path.join(ROOT_DIR, 'search.sql')
+SKETCH_SCHEMA_FILE = os.path.join(ROOT_DIR, 'sketches.sql')
+RECOMMENDER_SCHEMA_FILE = os.path.join(ROOT_DIR, 'recommender.sql')
+CHANGES_SCHEMA_FILE = os.path.join(ROOT_DIR, 'changes.sql')
+
+# Slots are stocked up to this many units (see seed_db.py)
+STOCK_CAPACITY = 15
+MAX_CACHE_ENTRIES = 256
+
+# Tables without their own change counter (changes.sql) -> the one that
+# moves whenever they do
+COVERED_BY = {
+    'sales_daily_machine': 'rollup_state',
+    'sales_daily_item': 'rollup_state',
+    'sales_daily_machine_item': 'rollup_state',
+    'demand_sketches': 'sketch_state',
+    'items_fts': 'items',
+    'items_fts_vocab': 'items',
+}
+_TABLE_NAME = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)', re.IGNORECASE)
+_CTE_NAME = re.compile(r'(?:\bWITH|,)\s*(\w+)\s+AS\s*\(', re.IGNORECASE)
+
+# Streamlit reruns the page script on every interaction but keeps imported
+# modules alive, so one connection pool and result cache serve every rerun.
+_lock = threading.RLock()
+_pool = None
+# key -> (tables, their counters when computed, value)
+_cache = OrderedDict()
+_data_version = None
+_table_versions = {}
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            # Created by seed_db.py (--migrate for existing databases); the
+            # pool only checks they are there
+            pool = db_access.ConnectionPool(
+                DB_FILE, required_files=(INDEXES_FILE, ROLLUP_SCHEMA_FILE, SEARCH_SCHEMA_FILE, SKETCH_SCHEMA_FILE,
+                                         RECOMMENDER_SCHEMA_FILE, CHANGES_SCHEMA_FILE),
+            )
+            # Open one connection now so a database that needs migrating
+            # fails with the migrate hint before the cache reads the counters
+            pool.release(pool.acquire())
+            _pool = pool
+        return _pool
+
+def set_source(name):
+    # Labels this app's queries on the performance panel
+    db_access.set_source(name)
+
+def _versions():
+    # The counters only move when something commits, so re-read them only
+    # when data_version says another connection did
+    global _data_version, _table_versions
+    version = get_pool().data_version()
+    if version != _data_version:
+        _table_versions = get_pool().table_versions()
+        _data_version = version
+    return _table_versions
+
+@lru_cache(maxsize=1024)
+def tables_read(sql):
+    # Tables a statement reads, CTEs resolved to what they read
+    names = set(_TABLE_NAME.findall(sql)) - set(_CTE_NAME.findall(sql))
+    return tuple(sorted({COVERED_BY.get(name, name) for name in names}))
+
+def _stamp(tables, versions):
+    # Counters for tables; anything untracked means any change may matter
+    if not tables or any(table not in versions for table in tables):
+        tables = tuple(sorted(versions))
+    return tuple(versions[table] for table in tables)
+
+def _lookup(key, tables):
+    # (hit, value, stamp to store a fresh value under)
+    with _lock:
+        stamp = _stamp(tables, _versions())
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == stamp:
+            _cache.move_to_end(key)
+            return True, entry[1], stamp
+        return False, None, stamp
+
+def _remember(key, value, stamp):
+    # Stored under the counters read before computing: if a table changed
+    # meanwhile, the next lookup sees newer counters and recomputes
+    with _lock:
+        _cache[key] = (stamp, value)
+        _cache.move_to_end(key)
+        if len(_cache) > MAX_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+
+def _run(sql, params):
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        return conn.query_all(sql, params)
+    finally:
+        pool.release(conn)
+
+def query(sql, params=()):
+    # Cached until a table the statement reads from changes. Cached frames
+    # are shared between reruns; callers must not mutate them.
+    key = (sql, tuple(params))
+    hit, df, stamp = _lookup(key, tables_read(sql))
+    if hit:
+        return df
+    rows, columns = _run(sql, params)
+    df = pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+    _remember(key, df, stamp)
+    return df
+
+def cached(key, compute, tables=()):
+    # Memoize any derived result (e.g. a restock plan) until one of tables
+    # changes; without tables, until anything does
+    hit, value, stamp = _lookup(key, tuple(sorted({COVERED_BY.get(table, table) for table in tables})))
+    if hit:
+        return value
+    value = compute()
+    _remember(key, value, stamp)
+    return value
+
+def fetch(sql, params=()):
+    # Uncached, for lookups whose parameters rarely repeat
+    return _run(sql, params)[0]
+
+def execute(sql, params=()):
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        pool.release(conn)
+
+def performance():
+    # Per-statement latency and the slow-query log across every process
+    # using db_access (dashboards, seed, rollups, ingest)
+    statements, slow = db_access.load_metrics()
+    statements = pd.DataFrame(statements, columns=['source', 'statement', 'calls', 'total_ms', 'avg_ms',
+                                                   'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'])
+    slow = pd.DataFrame(slow, columns=['at', 'source', 'ms', 'sql', 'plan'])
+    slow['plan'] = slow['plan'].map(' / '.join)
+    return statements, slow
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+# Business dashboard
+
+def fleet_summary():
+    return query(f"""
+        SELECT
+            (SELECT COUNT(*) FROM vending_machines) AS total_machines,
+            (SELECT COUNT(*) FROM problem_reports WHERE status = 'open') AS open_issues,
+            (SELECT 100.0 * TOTAL(MIN(quantity, {STOCK_CAPACITY})) / MAX(COUNT(*) * {STOCK_CAPACITY}, 1)
+             FROM inventory) AS stock_health
+    """).iloc[0]
+
+def machine_options():
+    return query("SELECT machine_id, address FROM vending_machines ORDER BY machine_id")
+
+def machine_detail(machine_id):
+    return query("""
+        SELECT vm.machine_id, vm.address, vm.status, vm.accessible_features,
+            (SELECT i.name
+             FROM purchases p
+             JOIN items i ON p.item_id = i.item_id
+             WHERE p.machine_id = vm.machine_id
+             GROUP BY p.item_id
+             ORDER BY COUNT(*) DESC
+             LIMIT 1) AS top_item
+        FROM vending_machines vm
+        WHERE vm.machine_id = ?
+    """, (machine_id,)).iloc[0]
+
+def machine_issues(machine_id):
+    return query("""
+        SELECT report_id, description, status, created_at
+        FROM problem_reports
+        WHERE machine_id = ? AND status = 'open'
+        ORDER BY created_at DESC
+    """, (machine_id,))
+
+def urgent_maintenance(limit=5):
+    return query("""
+        SELECT vm.address AS name, r.issue_count
+        FROM (
+            SELECT machine_id, COUNT(*) AS issue_count
+            FROM problem_reports
+            WHERE status = 'open'
+            GROUP BY machine_id
+            ORDER BY issue_count DESC
+            LIMIT ?
+        ) r
+        JOIN vending_machines vm ON r.machine_id = vm.machine_id
+        ORDER BY r.issue_count DESC
+    """, (limit,))
+
+# Customer app
+
+def machine_stock(limit=100):
+    # Most-stocked machines first, aggregated in SQL instead of pandas
+    return query(f"""
+        SELECT vm.address AS name,
+               COUNT(CASE WHEN inv.quantity > 0 THEN 1 END) AS items_in_stock,
+               ROUND(100.0 * TOTAL(MIN(inv.quantity, {STOCK_CAPACITY})) / (COUNT(*) * {STOCK_CAPACITY}), 1) AS stock_level
+        FROM inventory inv
+        JOIN vending_machines vm ON inv.machine_id = vm.machine_id
+        GROUP BY inv.machine_id
+        ORDER BY stock_level DESC
+        LIMIT ?
+    """, (limit,))
+
+def user_credits(user_id):
+    rows = fetch("SELECT credits FROM users WHERE user_id = ?", (user_id,))
+    return rows[0][0] if rows else 0
+
+def item_options():
+    return query("SELECT item_id, name FROM items ORDER BY name")
+
+def submit_problem_report(machine_id, description, user_id=None):
+    execute(
+        "INSERT INTO problem_reports (user_id, machine_id, description, created_at) VALUES (?, ?, ?, ?)",
+        (user_id, machine_id, description, _now()),
+    )
+
+def submit_item_request(user_id, item_id, vote=1):
+    execute(
+        "INSERT INTO surveys (user_id, item_id, vote, created_at) VALUES (?, ?, ?, ?)",
+        (user_id, item_id, vote, _now()),
+    )
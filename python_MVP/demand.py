@@ -0,0 +1,43 @@
+import pandas as pd
+
+import data_loader as data
+# Lives in the repo root, which data_loader puts on sys.path
+import demand_sketches
+
+# Sliding windows offered on the dashboard, all within RETENTION_DAYS
+WINDOWS = {'Today': 1, 'Last 7 days': 7, 'Last 30 days': 30}
+
+def window(days):
+    # Merges at most RETENTION_DAYS fixed-size day sketches, then stays
+    # cached until the sketches are refreshed
+    return data.cached(('demand_window', days), lambda: demand_sketches.window_sketch(
+        data.fetch("SELECT day, sketch FROM demand_sketches"), days,
+    ), tables=('demand_sketches',))
+
+def top_items(days, n=20):
+    item_ids, requests, requesters = window(days).top('items', n)
+    names = data.query("SELECT item_id, name FROM items").set_index('item_id')['name']
+    return pd.DataFrame({
+        'item': [names.get(item_id, f"Item {item_id}") for item_id in item_ids.tolist()],
+        'requests': requests,
+        'requesters': requesters,
+    })
+
+def top_machines(days, n=10):
+    machine_ids, reports, reporters = window(days).top('machines', n)
+    addresses = dict(data.fetch(f"""
+        SELECT machine_id, address FROM vending_machines
+        WHERE machine_id IN ({','.join('?' * len(machine_ids))})
+    """, machine_ids.tolist()))
+    return pd.DataFrame({
+        'machine': [addresses.get(machine_id, f"Machine {machine_id}") for machine_id in machine_ids.tolist()],
+        'reports': reports,
+        'reporters': reporters,
+    })
+
+def totals(days):
+    sketch = window(days)
+    return sketch.requests, sketch.reports
+
+def last_updated():
+    return data.query("SELECT MIN(updated_at) AS updated_at FROM sketch_state")['updated_at'].iloc[0]
@@ -0,0 +1,118 @@
+import re
+
+import pandas as pd
+
+import data_loader as data
+
+# Query words shorter than this only match whole terms ("m" in "M&Ms"
+# shouldn't pull in every item starting with m)
+MIN_PREFIX_CHARS = 2
+# Dice similarity over trigrams needed to treat an unknown word as a typo
+MIN_SIMILARITY = 0.45
+LIMIT = 20
+
+_WORD = re.compile(r"[^\W_]+")
+
+def words(text):
+    # Same split as FTS5's unicode61 tokenizer: runs of letters and digits
+    return _WORD.findall(text.lower())
+
+def trigrams(word):
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class Vocabulary:
+    # In-memory trigram index over every term in items_fts, for correcting
+    # words that match nothing ("snikers" -> "snickers").
+
+    def __init__(self, terms):
+        self.terms = list(terms)
+        self.grams = [trigrams(term) for term in self.terms]
+        self.postings = {}
+        for n, grams in enumerate(self.grams):
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(n)
+
+    def has_prefix(self, word):
+        return any(term.startswith(word) for term in self.terms)
+
+    def closest(self, word):
+        grams = trigrams(word)
+        shared = {}
+        for gram in grams:
+            for n in self.postings.get(gram, ()):
+                shared[n] = shared.get(n, 0) + 1
+        best, best_score = None, MIN_SIMILARITY
+        for n, count in shared.items():
+            score = 2.0 * count / (len(grams) + len(self.grams[n]))
+            if score > best_score:
+                best, best_score = self.terms[n], score
+        return best
+
+def get_vocabulary():
+    # Rebuilt when the catalog changes; its terms number in
+    # the hundreds, so this is well under a millisecond
+    return data.cached(('item_search_vocabulary',), lambda: Vocabulary(
+        term for (term,) in data.fetch("SELECT term FROM items_fts_vocab")
+    ), tables=('items_fts_vocab',))
+
+def get_synonyms():
+    return data.cached(('item_search_synonyms',), lambda: dict(
+        data.fetch("SELECT term, expansion FROM search_synonyms")
+    ), tables=('search_synonyms',))
+
+def match_expression(text, operator='AND'):
+    # Builds an FTS5 query with one group per word: the word as a prefix,
+    # plus its synonym as a phrase, plus a spelling correction when the word
+    # matches nothing. Groups are ANDed so extra words narrow the search.
+    vocabulary = get_vocabulary()
+    synonyms = get_synonyms()
+    groups = []
+    for word in words(text):
+        if len(word) >= MIN_PREFIX_CHARS:
+            alternatives = [f'"{word}"*']
+        else:
+            alternatives = [f'"{word}"']
+        if word in synonyms:
+            alternatives.append('"' + ' '.join(words(synonyms[word])) + '"')
+        elif not vocabulary.has_prefix(word):
+            corrected = vocabulary.closest(word)
+            if corrected:
+                alternatives.append(f'"{corrected}"')
+        groups.append('(' + ' OR '.join(alternatives) + ')')
+    return f' {operator} '.join(groups)
+
+def search_items(text, limit=LIMIT):
+    # Best matches first (bm25). Items must match every word; only when
+    # none do does any word count, so "pepsi cola zero" still finds Pepsi.
+    for operator in ('AND', 'OR'):
+        expression = match_expression(text, operator)
+        if not expression:
+            break
+        rows = data.fetch("""
+            SELECT i.item_id, i.name, i.category, i.price
+            FROM items_fts
+            JOIN items i ON i.item_id = items_fts.rowid
+            WHERE items_fts MATCH ?
+            ORDER BY items_fts.rank
+            LIMIT ?
+        """, (expression, limit))
+        if rows:
+            return pd.DataFrame(rows, columns=['item_id', 'name', 'category', 'price'])
+    return pd.DataFrame(columns=['item_id', 'name', 'category', 'price'])
+
+def matching_item_ids(text, limit=LIMIT):
+    return search_items(text, limit)['item_id'].tolist()
+
+def machines_stocking(item_ids):
+    # Every machine with any of the items in stock, not just top sellers
+    if not item_ids:
+        return pd.DataFrame(columns=['machine_id', 'address', 'item_id', 'name', 'quantity'])
+    rows = data.fetch(f"""
+        SELECT vm.machine_id, vm.address, i.item_id, i.name, inv.quantity
+        FROM inventory inv
+        JOIN items i ON inv.item_id = i.item_id
+        JOIN vending_machines vm ON inv.machine_id = vm.machine_id
+        WHERE inv.item_id IN ({','.join('?' * len(item_ids))}) AND inv.quantity > 0
+    """, list(item_ids))
+    return pd.DataFrame(rows, columns=['machine_id', 'address', 'item_id', 'name', 'quantity'])
@@ -0,0 +1,359 @@
+import argparse
+import io
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import data_loader as data
+import db_access
+import spatial_index
+
+STATE_NAME = 'cooccurrence'
+
+# A net upvote counts like this many purchases of the item
+VOTE_WEIGHT = 3.0
+# Purchase / survey ids folded in per step by refresh_recommender
+BATCH_ROWS = 500_000
+# Outer products generated per step while folding users into the matrix
+PAIR_CHUNK = 2_000_000
+# Machines around the customer whose stock is eligible
+NEARBY_MACHINES = 10
+TOP_N = 5
+# Packs (row, col) into one sortable int64 key, as in spatial_index
+_STRIDE = 1 << 21
+
+class SparseMatrix:
+    # Sorted packed (row, col) keys with float values. Rows are contiguous,
+    # so this is CSR in effect: a row or a batch of rows is a searchsorted.
+
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.values = np.empty(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, rows, cols, values):
+        # Adds into existing cells in place and inserts only the new ones
+        keys = np.asarray(rows, dtype=np.int64) * _STRIDE + np.asarray(cols, dtype=np.int64)
+        keys, inverse = np.unique(keys, return_inverse=True)
+        values = np.bincount(inverse, weights=values, minlength=len(keys))
+        at = np.searchsorted(self.keys, keys)
+        hit = at < len(self.keys)
+        hit[hit] = self.keys[at[hit]] == keys[hit]
+        self.values[at[hit]] += values[hit]
+        miss = ~hit
+        self.keys = np.insert(self.keys, at[miss], keys[miss])
+        self.values = np.insert(self.values, at[miss], values[miss])
+
+    def get(self, rows, cols):
+        keys = np.asarray(rows, dtype=np.int64) * _STRIDE + np.asarray(cols, dtype=np.int64)
+        at = np.minimum(np.searchsorted(self.keys, keys), max(len(self.keys) - 1, 0))
+        if not len(self.keys):
+            return np.zeros(len(keys))
+        return np.where(self.keys[at] == keys, self.values[at], 0.0)
+
+    def rows(self, rows):
+        # (row, col, value) for every stored cell of the given rows
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = np.searchsorted(self.keys, rows * _STRIDE)
+        stops = np.searchsorted(self.keys, (rows + 1) * _STRIDE)
+        idx = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)] or [np.empty(0, dtype=np.int64)])
+        keys = self.keys[idx]
+        return keys // _STRIDE, keys % _STRIDE, self.values[idx]
+
+def _weights(raw):
+    # Diminishing returns on repeat buys; net-downvoted items carry no weight
+    return np.log1p(np.maximum(raw, 0.0))
+
+def _pairs(rows, cols, weights):
+    # Every (i, j, w_i * w_j) within each row, i.e. the rows' outer products.
+    # rows must be grouped, which SparseMatrix.rows guarantees.
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.empty(0, dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(rows)])
+    per_entry = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(rows)), per_entry)
+    offset = np.arange(len(left)) - np.repeat(np.cumsum(per_entry) - per_entry, per_entry)
+    right = np.repeat(np.repeat(starts, sizes), per_entry) + offset
+    return cols[left], cols[right], weights[left] * weights[right]
+
+class Recommender:
+    # Item-item co-occurrence over purchases and survey votes. Each user is
+    # a sparse row of raw interest (purchases + VOTE_WEIGHT * net votes);
+    # the co-occurrence matrix is the sum of the users' weighted outer
+    # products, so new activity only swaps the touched users' old outer
+    # products for their new ones.
+
+    def __init__(self):
+        self.interest = SparseMatrix()
+        self.cooccurrence = SparseMatrix()
+        self.last_purchase_id = 0
+        self.last_survey_id = 0
+
+    def update(self, user_ids, item_ids, amounts):
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(user_ids):
+            return
+        touched = np.unique(user_ids)
+        old = self.interest.rows(touched)
+        self.interest.add(user_ids, item_ids, np.asarray(amounts, dtype=np.float64))
+        new = self.interest.rows(touched)
+        for (rows, cols, raw), sign in ((old, -1.0), (new, 1.0)):
+            weights = _weights(raw)
+            keep = weights > 0
+            self._fold(rows[keep], cols[keep], weights[keep], sign)
+
+    def _fold(self, rows, cols, weights, sign):
+        # Batches whole users so no chunk's pairs exceed PAIR_CHUNK
+        if not len(rows):
+            return
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        sizes = np.diff(np.r_[starts, len(rows)])
+        cost = np.cumsum(sizes.astype(np.int64) ** 2)
+        first = 0
+        while first < len(starts):
+            last = max(int(np.searchsorted(cost, cost[first] - sizes[first] ** 2 + PAIR_CHUNK, side='right')), first + 1)
+            lo = starts[first]
+            hi = starts[last] if last < len(starts) else len(rows)
+            left_cols, right_cols, products = _pairs(rows[lo:hi], cols[lo:hi], weights[lo:hi])
+            self.cooccurrence.add(left_cols, right_cols, sign * products)
+            first = last
+
+    def similar(self, item_ids, candidates):
+        # Cosine similarity between each item and each candidate
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        candidates = np.asarray(candidates, dtype=np.int64)
+        rows, cols, values = self.cooccurrence.rows(item_ids)
+        pos = np.searchsorted(candidates, cols)
+        pos = np.minimum(pos, max(len(candidates) - 1, 0))
+        keep = (candidates[pos] == cols) & (rows != cols) if len(candidates) else np.zeros(len(cols), dtype=bool)
+        rows, cols, values, pos = rows[keep], cols[keep], values[keep], pos[keep]
+        norm = np.sqrt(self.cooccurrence.get(rows, rows) * self.cooccurrence.get(cols, cols))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sims = np.where(norm > 0, values / norm, 0.0)
+        return rows, pos, sims
+
+    def recommend(self, user_id, candidates, n=TOP_N):
+        # Top-n candidate item ids for the user, best first
+        candidates = np.unique(np.asarray(candidates, dtype=np.int64))
+        if not len(candidates):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        _, items, raw = self.interest.rows([user_id])
+        disliked = items[raw < 0]
+        liked, weights = items[raw > 0], _weights(raw[raw > 0])
+        scores = np.zeros(len(candidates))
+        if len(liked):
+            rows, pos, sims = self.similar(liked, candidates)
+            np.add.at(scores, pos, sims * weights[np.searchsorted(liked, rows)])
+        if not scores.any():
+            # New customers (or nothing related in stock): most popular first
+            scores = self.cooccurrence.get(candidates, candidates)
+        scores[np.isin(candidates, disliked)] = -np.inf
+        order = np.argsort(-scores, kind='stable')[:n]
+        order = order[np.isfinite(scores[order]) & (scores[order] > 0)]
+        return candidates[order], scores[order]
+
+    def favourites(self, user_id, n=TOP_N):
+        _, items, raw = self.interest.rows([user_id])
+        order = np.argsort(-raw, kind='stable')[:n]
+        order = order[raw[order] > 0]
+        return items[order], raw[order]
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            interest_keys=self.interest.keys,
+            interest_values=self.interest.values,
+            cooccurrence_keys=self.cooccurrence.keys,
+            cooccurrence_values=self.cooccurrence.values,
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, blob, last_purchase_id, last_survey_id):
+        arrays = np.load(io.BytesIO(blob))
+        rec = cls()
+        rec.interest.keys, rec.interest.values = arrays['interest_keys'], arrays['interest_values']
+        rec.cooccurrence.keys, rec.cooccurrence.values = arrays['cooccurrence_keys'], arrays['cooccurrence_values']
+        rec.last_purchase_id = last_purchase_id
+        rec.last_survey_id = last_survey_id
+        return rec
+
+# Activity between a high-water mark and an upper id. Grouped in SQL so a
+# day of activity is one small delta per user and item.
+PURCHASES_SQL = """
+    SELECT user_id, item_id, COUNT(*)
+    FROM purchases
+    WHERE purchase_id > ? AND purchase_id <= ?
+    GROUP BY user_id, item_id
+"""
+VOTES_SQL = """
+    SELECT user_id, item_id, SUM(vote)
+    FROM surveys
+    WHERE survey_id > ? AND survey_id <= ?
+    GROUP BY user_id, item_id
+"""
+LATEST_IDS_SQL = """
+    SELECT (SELECT COALESCE(MAX(purchase_id), 0) FROM purchases),
+           (SELECT COALESCE(MAX(survey_id), 0) FROM surveys),
+           (SELECT COALESCE(MAX(seq), 0) FROM sqlite_sequence WHERE name = 'purchases')
+"""
+
+def catch_up(rec, fetch, purchase_upper, survey_upper):
+    # Folds purchases and votes above rec's marks up to the given ids
+    purchases = np.array(fetch(PURCHASES_SQL, (rec.last_purchase_id, purchase_upper)), dtype=np.float64).reshape(-1, 3)
+    votes = np.array(fetch(VOTES_SQL, (rec.last_survey_id, survey_upper)), dtype=np.float64).reshape(-1, 3)
+    rec.update(
+        np.concatenate([purchases[:, 0], votes[:, 0]]),
+        np.concatenate([purchases[:, 1], votes[:, 1]]),
+        np.concatenate([purchases[:, 2], VOTE_WEIGHT * votes[:, 2]]),
+    )
+    # After the archiver has emptied purchases MAX(purchase_id) is below the mark
+    rec.last_purchase_id = max(rec.last_purchase_id, purchase_upper)
+    rec.last_survey_id = max(rec.last_survey_id, survey_upper)
+
+def load_state(fetch):
+    # The stored recommender, or an empty one if none was saved yet
+    rows = fetch("SELECT matrices, last_purchase_id, last_survey_id FROM recommender_state WHERE name = ?", (STATE_NAME,))
+    if not rows or rows[0][0] is None:
+        return Recommender()
+    return Recommender.from_bytes(*rows[0])
+
+def connect(db_file=data.DB_FILE):
+    # Autocommit mode so we control BEGIN/COMMIT
+    conn = db_access.connect(db_file, isolation_level=None)
+    with open(data.RECOMMENDER_SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    return conn
+
+def reset_recommender(conn):
+    conn.execute("UPDATE recommender_state SET last_purchase_id = 0, last_survey_id = 0, matrices = NULL, "
+                 "updated_at = NULL WHERE name = ?", (STATE_NAME,))
+
+def refresh_recommender(conn, batch_rows=BATCH_ROWS):
+    # Loads the stored matrices, folds in everything past their marks and
+    # stores them again. Matrices and marks commit together.
+    started = time.perf_counter()
+    fetch = lambda sql, params=(): conn.execute(sql, params).fetchall()
+    rec = load_state(fetch)
+    max_purchase, max_survey, sequence = fetch(LATEST_IDS_SQL)[0]
+    if sequence < rec.last_purchase_id:
+        # purchases was reset (e.g. reseeded) underneath us, start over
+        print(f"purchases id sequence {sequence} is below the recommender mark {rec.last_purchase_id}, rebuilding.")
+        rec = Recommender()
+    first_purchase, first_survey = rec.last_purchase_id, rec.last_survey_id
+    while rec.last_purchase_id < max_purchase or rec.last_survey_id < max_survey:
+        catch_up(rec, fetch, min(rec.last_purchase_id + batch_rows, max_purchase),
+                 min(rec.last_survey_id + batch_rows, max_survey))
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "UPDATE recommender_state SET last_purchase_id = ?, last_survey_id = ?, matrices = ?, updated_at = ? "
+            "WHERE name = ?",
+            (rec.last_purchase_id, rec.last_survey_id, rec.to_bytes(), datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+             STATE_NAME),
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    elapsed = time.perf_counter() - started
+    print(f"Recommender current through purchase_id {rec.last_purchase_id} and survey_id {rec.last_survey_id} "
+          f"(scanned id ranges of {rec.last_purchase_id - first_purchase:,} purchases and "
+          f"{rec.last_survey_id - first_survey:,} votes) in {elapsed:.2f}s; "
+          f"{len(rec.cooccurrence):,} co-occurrence cells.")
+    return rec
+
+# Streamlit serves sessions on separate threads. _sync replaces and
+# updates the matrices' arrays, so every read holds this lock too.
+_lock = threading.Lock()
+# Loaded from recommender_state on first use
+_recommender = None
+
+def _sync():
+    # Starts from the stored matrices (refresh_recommender), then folds in
+    # purchases and votes past their marks in memory.
+    global _recommender
+    with _lock:
+        max_purchase, max_survey, sequence = data.fetch(LATEST_IDS_SQL)[0]
+        if _recommender is None or sequence < _recommender.last_purchase_id:
+            _recommender = load_state(data.fetch)
+            if sequence < _recommender.last_purchase_id:
+                # Stored state predates a reseed; refresh_recommender will rebuild it
+                _recommender = Recommender()
+        catch_up(_recommender, data.fetch, max_purchase, max_survey)
+        return _recommender.last_purchase_id, _recommender.last_survey_id
+
+def get_recommender():
+    # Catches up only when purchases or surveys changed since the last call.
+    # Use the result under _lock.
+    data.cached(('recommender_sync',), _sync, tables=('purchases', 'surveys'))
+    return _recommender
+
+def _catalog():
+    # item_id -> (name, category, price), rebuilt only when items change
+    return data.cached(('recommender_catalog',), lambda: {
+        item_id: (name, category, price)
+        for item_id, name, category, price in data.fetch("SELECT item_id, name, category, price FROM items")
+    }, tables=('items',))
+
+def nearby_stock(lat, lng, machines=NEARBY_MACHINES):
+    # Closest in-stock machine for every item stocked around the customer,
+    # as {item_id: (machine_id, distance_km)}. Plain dicts: at this size
+    # pandas overhead would dominate the lookup.
+    machine_ids, distances = spatial_index.get_index().nearest(lat, lng, machines)
+    if not len(machine_ids):
+        return {}
+    rank = {machine_id: n for n, machine_id in enumerate(machine_ids.tolist())}
+    rows = data.fetch(f"""
+        SELECT machine_id, item_id FROM inventory
+        WHERE machine_id IN ({','.join('?' * len(rank))}) AND quantity > 0
+    """, list(rank))
+    stock = {}
+    for machine_id, item_id in sorted(rows, key=lambda row: rank[row[0]]):
+        stock.setdefault(item_id, (machine_id, round(float(distances[rank[machine_id]]), 3)))
+    return stock
+
+def recommend_nearby(user_id, lat, lng, n=TOP_N, machines=NEARBY_MACHINES):
+    stock = nearby_stock(lat, lng, machines)
+    rec = get_recommender()
+    with _lock:
+        item_ids, scores = rec.recommend(user_id, list(stock), n)
+    picks = [stock[item_id] for item_id in item_ids.tolist()]
+    machine_ids = sorted({machine_id for machine_id, _ in picks})
+    addresses = dict(data.fetch(f"""
+        SELECT machine_id, address FROM vending_machines
+        WHERE machine_id IN ({','.join('?' * len(machine_ids))})
+    """, machine_ids))
+    catalog = _catalog()
+    return pd.DataFrame([
+        (item_id, *catalog[item_id], machine_id, addresses.get(machine_id), distance, round(float(score), 3))
+        for item_id, score, (machine_id, distance) in zip(item_ids.tolist(), scores, picks)
+    ], columns=['item_id', 'name', 'category', 'price', 'machine_id', 'address', 'distance_km', 'score'])
+
+def favourite_items(user_id, n=3):
+    rec = get_recommender()
+    with _lock:
+        item_ids, _ = rec.favourites(user_id, n)
+    catalog = _catalog()
+    return [catalog[item_id][0] if item_id in catalog else f"Item {item_id}" for item_id in item_ids.tolist()]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fold new purchases and votes into the stored recommender matrices")
+    parser.add_argument('--db', default=data.DB_FILE, help="Database file to update")
+    parser.add_argument('--rebuild', action='store_true', help="Drop the stored matrices and rebuild from all purchases in the database")
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help="Keep refreshing on this interval")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.rebuild:
+        reset_recommender(conn)
+    refresh_recommender(conn)
+    while args.watch:
+        time.sleep(args.watch)
+        refresh_recommender(conn)
+    conn.close()
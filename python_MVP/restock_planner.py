@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import data_loader as data
+
+# Sales window used to estimate how fast each slot empties
+LOOKBACK_DAYS = 14
+# Plan a visit for anything forecast to run out within this many hours
+HORIZON_HOURS = 48
+# Same threshold the machines raise low_stock alerts at
+LOW_STOCK = 3
+DRIVERS = 5
+MAX_STOPS = 25
+# Drivers leave from and return to the MSU Union
+DEPOT = (42.7233, -84.4812)
+KM_PER_DEG = 111.2
+TWO_OPT_PASSES = 4
+
+def depletion_rates(lookback_days=LOOKBACK_DAYS, as_of=None):
+    # Units sold per day for every machine/item pair, from the daily
+    # machine/item rollup plus purchases not yet folded into it.
+    as_of = as_of or datetime.now()
+    since = (as_of - timedelta(days=lookback_days)).strftime('%Y-%m-%d')
+    sales = data.query("""
+        SELECT machine_id, item_id, SUM(units) AS units
+        FROM (
+            SELECT machine_id, item_id, purchase_count AS units
+            FROM sales_daily_machine_item
+            WHERE day >= ?
+            UNION ALL
+            SELECT machine_id, item_id, 1
+            FROM purchases
+            WHERE purchase_id > (SELECT last_purchase_id FROM rollup_state WHERE name = 'sales_daily_machine_item')
+              AND timestamp >= ?
+        )
+        GROUP BY machine_id, item_id
+    """, (since, since))
+    return sales.assign(units_per_day=sales['units'].to_numpy(dtype=np.float64) / lookback_days)
+
+def forecast_stockouts(horizon_hours=HORIZON_HOURS, lookback_days=LOOKBACK_DAYS):
+    inventory = data.query("SELECT machine_id, item_id, quantity FROM inventory")
+    rates = depletion_rates(lookback_days)
+    slots = inventory.merge(rates[['machine_id', 'item_id', 'units_per_day']], on=['machine_id', 'item_id'], how='left')
+
+    quantity = slots['quantity'].to_numpy(dtype=np.float64)
+    per_day = slots['units_per_day'].fillna(0.0).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hours = np.where(per_day > 0, quantity / per_day * 24.0, np.inf)
+    hours[quantity <= 0] = 0.0
+
+    slots['units_per_day'] = per_day
+    slots['hours_to_stockout'] = hours
+    slots['restock_units'] = np.maximum(data.STOCK_CAPACITY - quantity, 0).astype(np.int64)
+    slots['needs_visit'] = (hours <= horizon_hours) | (quantity < LOW_STOCK)
+    return slots
+
+def _distance_matrix(lats, lngs):
+    # Equirectangular is plenty accurate at city scale and fully vectorized
+    x = np.radians(lngs) * np.cos(np.radians(np.mean(lats)))
+    y = np.radians(lats)
+    dx = x[:, None] - x[None, :]
+    dy = y[:, None] - y[None, :]
+    return np.sqrt(dx * dx + dy * dy) * (KM_PER_DEG * 180 / np.pi)
+
+def _nearest_neighbour(dist):
+    # Node 0 is the depot
+    n = len(dist)
+    visited = np.zeros(n, dtype=bool)
+    visited[0] = True
+    order = [0]
+    for _ in range(n - 1):
+        row = np.where(visited, np.inf, dist[order[-1]])
+        nxt = int(np.argmin(row))
+        visited[nxt] = True
+        order.append(nxt)
+    return np.array(order)
+
+def _two_opt(order, dist, passes=TWO_OPT_PASSES):
+    # Closed tour through the depot. For each edge (a, b) score reversing
+    # every later segment at once instead of looping over j in Python.
+    tour = np.append(order, order[0])
+    n = len(tour)
+    for _ in range(passes):
+        improved = False
+        for i in range(1, n - 2):
+            a, b = tour[i - 1], tour[i]
+            c, d = tour[i + 1:n - 1], tour[i + 2:n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                j = i + 1 + best
+                tour[i:j + 1] = tour[i:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return tour[:-1]
+
+def plan_routes(stops, depot=DEPOT, drivers=DRIVERS, max_stops=MAX_STOPS):
+    # stops: one row per machine with lat, lon and an urgency column.
+    # The most urgent machines that fit are split into pie slices around
+    # the depot, one per driver, then each slice is ordered NN + 2-opt.
+    columns = ['driver', 'stop', 'machine_id', 'lat', 'lon', 'leg_km']
+    if stops.empty or drivers <= 0:
+        return pd.DataFrame(columns=columns)
+    stops = stops.sort_values('hours_to_stockout', kind='stable').head(drivers * max_stops)
+    lats = stops['lat'].to_numpy(dtype=np.float64)
+    lngs = stops['lon'].to_numpy(dtype=np.float64)
+    bearing = np.arctan2(lats - depot[0], (lngs - depot[1]) * np.cos(np.radians(depot[0])))
+    by_angle = np.argsort(bearing, kind='stable')
+
+    routes = []
+    for driver, members in enumerate(np.array_split(by_angle, drivers), start=1):
+        if not len(members):
+            continue
+        route_lats = np.concatenate([[depot[0]], lats[members]])
+        route_lngs = np.concatenate([[depot[1]], lngs[members]])
+        dist = _distance_matrix(route_lats, route_lngs)
+        order = _two_opt(_nearest_neighbour(dist), dist)
+        legs = dist[np.append(0, order[1:-1]), order[1:]]
+        picked = stops.iloc[members[order[1:] - 1]]
+        routes.append(picked.assign(
+            driver=driver,
+            stop=np.arange(1, len(members) + 1),
+            leg_km=np.round(legs, 3),
+            return_km=np.round(dist[order[-1], 0], 3),
+        ))
+    return pd.concat(routes, ignore_index=True)
+
+def replan(horizon_hours=HORIZON_HOURS, drivers=DRIVERS, max_stops=MAX_STOPS, lookback_days=LOOKBACK_DAYS):
+    slots = forecast_stockouts(horizon_hours, lookback_days)
+    due = slots[slots['needs_visit']]
+    per_machine = due.groupby('machine_id', sort=False).agg(
+        hours_to_stockout=('hours_to_stockout', 'min'),
+        restock_units=('restock_units', 'sum'),
+        slots=('item_id', 'size'),
+    ).reset_index()
+    machines = data.query("""
+        SELECT machine_id, address, location_lat AS lat, location_lng AS lon
+        FROM vending_machines
+        WHERE location_lat IS NOT NULL AND location_lng IS NOT NULL
+    """)
+    per_machine = per_machine.merge(machines, on='machine_id')
+    routes = plan_routes(per_machine, drivers=drivers, max_stops=max_stops)
+    return {'slots': due, 'machines': per_machine, 'routes': routes}
+
+def cached_plan(horizon_hours=HORIZON_HOURS, drivers=DRIVERS, max_stops=MAX_STOPS):
+    # Replanned only when stock, sales or machines changed since the last render
+    return data.cached(('restock_plan', horizon_hours, drivers, max_stops),
+                       lambda: replan(horizon_hours, drivers, max_stops),
+                       tables=('inventory', 'purchases', 'sales_daily_machine_item', 'vending_machines'))
+
+def route_summary(routes):
+    if routes.empty:
+        return pd.DataFrame(columns=['driver', 'stops', 'units', 'km'])
+    summary = routes.groupby('driver').agg(
+        stops=('machine_id', 'size'),
+        units=('restock_units', 'sum'),
+        km=('leg_km', 'sum'),
+        return_km=('return_km', 'first'),
+    ).reset_index()
+    summary['km'] = (summary['km'] + summary.pop('return_km')).round(1)
+    return summary
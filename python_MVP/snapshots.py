@@ -0,0 +1,69 @@
+import os
+import threading
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+
+# Written by export_purchases.py in the repo root
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPORT_DIR = os.environ.get('VENDING_EXPORT_DIR', os.path.join(ROOT_DIR, 'exports', 'purchases'))
+
+_lock = threading.Lock()
+_cache = {}
+
+def partitions():
+    # Published part files; late purchases add part-1, part-2... to a day
+    if not os.path.isdir(EXPORT_DIR):
+        return ()
+    return tuple(sorted(
+        f"{name}/{part}" for name in os.listdir(EXPORT_DIR) if name.startswith('day=')
+        for part in os.listdir(os.path.join(EXPORT_DIR, name)) if part.endswith('.parquet')
+    ))
+
+def purchases_dataset():
+    # Memory-mapped local reads; the "day" column comes from the directory names
+    return ds.dataset(
+        EXPORT_DIR,
+        format='parquet',
+        partitioning=ds.partitioning(pa.schema([('day', pa.string())]), flavor='hive'),
+        filesystem=pafs.LocalFileSystem(use_mmap=True),
+        exclude_invalid_files=True,
+    )
+
+def daily_revenue(since=None):
+    # Streams only credits_earned (plus the free partition key) batch by
+    # batch, so memory stays flat however many rows the snapshot holds.
+    dataset = purchases_dataset()
+    filter_ = ds.field('day') >= since if since else None
+    totals = {}
+    for batch in dataset.to_batches(columns=['day', 'credits_earned'], filter=filter_):
+        if not batch.num_rows:
+            continue
+        grouped = pa.Table.from_batches([batch]).group_by('day').aggregate(
+            [('credits_earned', 'sum'), ('credits_earned', 'count')]
+        )
+        for day, revenue, count in zip(*(grouped.column(c).to_pylist() for c in
+                                         ['day', 'credits_earned_sum', 'credits_earned_count'])):
+            prev = totals.get(day, (0.0, 0))
+            totals[day] = (prev[0] + revenue, prev[1] + count)
+    return pd.DataFrame(
+        [(day, revenue, count) for day, (revenue, count) in sorted(totals.items())],
+        columns=['day', 'revenue', 'purchases'],
+    )
+
+def monthly_revenue():
+    # Daily totals are cached per set of published part files; a new
+    # export run is the only thing that can change the answer.
+    key = partitions()
+    if not key:
+        return pd.DataFrame(columns=['month', 'revenue', 'purchases', 'change_percent'])
+    with _lock:
+        if key not in _cache:
+            _cache.clear()
+            _cache[key] = daily_revenue()
+        daily = _cache[key]
+    monthly = daily.assign(month=daily['day'].str[:7]).groupby('month', as_index=False)[['revenue', 'purchases']].sum()
+    monthly['change_percent'] = (monthly['revenue'].pct_change() * 100).round(1)
+    return monthly
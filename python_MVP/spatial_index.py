@@ -0,0 +1,179 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_loader as data
+
+# Grid cell edge in degrees (~1.1 km north-south). Small enough that a
+# campus-sized search touches a handful of cells, large enough that a
+# 50k-machine fleet averages a few machines per cell.
+CELL_DEG = 0.01
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG = 111.2
+# Packs (cx, cy) into one sortable int64 key
+_OFFSET = 1 << 20
+_STRIDE = 1 << 21
+
+def haversine_km(lat, lng, lats, lngs):
+    lat1, lng1 = np.radians(lat), np.radians(lng)
+    lat2, lng2 = np.radians(lats), np.radians(lngs)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+class MachineIndex:
+    # Uniform lat/lng grid over the machines. Machines are stored sorted by
+    # cell key, so any rectangle of cells is one searchsorted per column.
+
+    def __init__(self, machine_ids, lats, lngs, accessible, cell_deg=CELL_DEG):
+        self.cell_deg = cell_deg
+        cx = np.floor(np.asarray(lngs, dtype=np.float64) / cell_deg).astype(np.int64)
+        cy = np.floor(np.asarray(lats, dtype=np.float64) / cell_deg).astype(np.int64)
+        keys = (cx + _OFFSET) * _STRIDE + (cy + _OFFSET)
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.machine_ids = np.asarray(machine_ids, dtype=np.int64)[order]
+        self.lats = np.asarray(lats, dtype=np.float64)[order]
+        self.lngs = np.asarray(lngs, dtype=np.float64)[order]
+        self.accessible = np.asarray(accessible, dtype=bool)[order]
+        self.cx_range = (int(cx.min()), int(cx.max())) if len(cx) else (0, -1)
+        self.cy_range = (int(cy.min()), int(cy.max())) if len(cy) else (0, -1)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _in_box(self, lat, lng, half_lat_deg, half_lng_deg):
+        cx0 = max(int(np.floor((lng - half_lng_deg) / self.cell_deg)), self.cx_range[0])
+        cx1 = min(int(np.floor((lng + half_lng_deg) / self.cell_deg)), self.cx_range[1])
+        cy0 = max(int(np.floor((lat - half_lat_deg) / self.cell_deg)), self.cy_range[0])
+        cy1 = min(int(np.floor((lat + half_lat_deg) / self.cell_deg)), self.cy_range[1])
+        if cx0 > cx1 or cy0 > cy1:
+            return np.empty(0, dtype=np.int64)
+        columns = np.arange(cx0, cx1 + 1, dtype=np.int64) + _OFFSET
+        starts = np.searchsorted(self.keys, columns * _STRIDE + cy0 + _OFFSET, side='left')
+        stops = np.searchsorted(self.keys, columns * _STRIDE + cy1 + _OFFSET, side='right')
+        spans = [np.arange(a, b) for a, b in zip(starts, stops) if b > a]
+        return np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+
+    def _covers_all(self, lat, lng, half_lat_deg, half_lng_deg):
+        return (
+            np.floor((lng - half_lng_deg) / self.cell_deg) <= self.cx_range[0]
+            and np.floor((lng + half_lng_deg) / self.cell_deg) >= self.cx_range[1]
+            and np.floor((lat - half_lat_deg) / self.cell_deg) <= self.cy_range[0]
+            and np.floor((lat + half_lat_deg) / self.cell_deg) >= self.cy_range[1]
+        )
+
+    def within(self, lat, lng, radius_km, keep=None):
+        # keep(machine_ids, positions) -> bool mask lets callers filter on stock etc.
+        half_lat = radius_km / KM_PER_DEG
+        half_lng = radius_km / (KM_PER_DEG * max(np.cos(np.radians(lat)), 1e-6))
+        idx = self._in_box(lat, lng, half_lat, half_lng)
+        dist = haversine_km(lat, lng, self.lats[idx], self.lngs[idx])
+        idx, dist = idx[dist <= radius_km], dist[dist <= radius_km]
+        if keep is not None and len(idx):
+            mask = keep(self.machine_ids[idx], idx)
+            idx, dist = idx[mask], dist[mask]
+        order = np.argsort(dist, kind='stable')
+        return self.machine_ids[idx[order]], dist[order]
+
+    def nearest(self, lat, lng, k, keep=None):
+        # Grow a box around the point until it holds k matches that are
+        # closer than the box's inscribed radius; nothing outside can beat them.
+        if not len(self) or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        km_per_lng_deg = KM_PER_DEG * max(np.cos(np.radians(lat)), 1e-6)
+        radius_km = self.cell_deg * min(KM_PER_DEG, km_per_lng_deg)
+        kept = {}
+        while True:
+            half_lat = radius_km / KM_PER_DEG
+            half_lng = radius_km / km_per_lng_deg
+            idx = self._in_box(lat, lng, half_lat, half_lng)
+            if keep is not None and len(idx):
+                # Only ask about machines we haven't classified yet
+                new = np.array([i for i in idx.tolist() if i not in kept], dtype=np.int64)
+                if len(new):
+                    kept.update(zip(new.tolist(), keep(self.machine_ids[new], new).tolist()))
+                idx = idx[np.fromiter((kept[i] for i in idx.tolist()), dtype=bool, count=len(idx))]
+            dist = haversine_km(lat, lng, self.lats[idx], self.lngs[idx])
+            exhausted = self._covers_all(lat, lng, half_lat, half_lng)
+            if exhausted or np.count_nonzero(dist <= radius_km) >= k:
+                order = np.argsort(dist, kind='stable')[:k]
+                return self.machine_ids[idx[order]], dist[order]
+            radius_km *= 2
+
+_lock = threading.Lock()
+_index = None
+_fingerprint = None
+
+def get_index():
+    # Rebuild only when machines were added, removed or moved. The
+    # fingerprint query is itself cached until vending_machines changes.
+    global _index, _fingerprint
+    fingerprint = tuple(data.query("""
+        SELECT COUNT(*), MAX(machine_id), TOTAL(location_lat), TOTAL(location_lng),
+               TOTAL(accessible_features != 'Standard')
+        FROM vending_machines
+    """).iloc[0].tolist())
+    with _lock:
+        if _index is None or fingerprint != _fingerprint:
+            machines = data.query("""
+                SELECT machine_id, location_lat, location_lng, accessible_features != 'Standard' AS accessible
+                FROM vending_machines
+                WHERE location_lat IS NOT NULL AND location_lng IS NOT NULL
+            """)
+            _index = MachineIndex(machines['machine_id'], machines['location_lat'],
+                                  machines['location_lng'], machines['accessible'])
+            _fingerprint = fingerprint
+        return _index
+
+def _stock_filter(index, item_ids, accessible_only):
+    item_ids = list(item_ids) if item_ids is not None else None
+
+    def keep(machine_ids, positions):
+        mask = np.ones(len(machine_ids), dtype=bool)
+        if accessible_only:
+            mask &= index.accessible[positions]
+        if item_ids is not None:
+            if not item_ids:
+                return np.zeros(len(machine_ids), dtype=bool)
+            candidates = machine_ids[mask].tolist()
+            # Checked live against inventory so stock changes need no rebuild
+            stocked = set()
+            for start in range(0, len(candidates), 500):
+                batch = candidates[start:start + 500]
+                rows = data.fetch(f"""
+                    SELECT DISTINCT machine_id FROM inventory
+                    WHERE machine_id IN ({','.join('?' * len(batch))})
+                      AND item_id IN ({','.join('?' * len(item_ids))})
+                      AND quantity > 0
+                """, batch + item_ids)
+                stocked.update(row[0] for row in rows)
+            mask &= np.isin(machine_ids, list(stocked))
+        return mask
+
+    if item_ids is None and not accessible_only:
+        return None
+    return keep
+
+def _with_details(machine_ids, distances):
+    result = pd.DataFrame({'machine_id': machine_ids, 'distance_km': np.round(distances, 3)})
+    if result.empty:
+        return result.assign(address=[], accessible_features=[], lat=[], lon=[])
+    rows = data.fetch(f"""
+        SELECT machine_id, address, accessible_features, location_lat, location_lng
+        FROM vending_machines
+        WHERE machine_id IN ({','.join('?' * len(result))})
+    """, result['machine_id'].tolist())
+    details = pd.DataFrame(rows, columns=['machine_id', 'address', 'accessible_features', 'lat', 'lon'])
+    return result.merge(details, on='machine_id', how='left')
+
+def nearest_machines(lat, lng, k=10, item_ids=None, accessible_only=False):
+    # item_ids=None means any machine; an empty list means nothing matched
+    index = get_index()
+    ids, dist = index.nearest(lat, lng, k, keep=_stock_filter(index, item_ids, accessible_only))
+    return _with_details(ids, dist)
+
+def machines_within(lat, lng, radius_km, item_ids=None, accessible_only=False):
+    index = get_index()
+    ids, dist = index.within(lat, lng, radius_km, keep=_stock_filter(index, item_ids, accessible_only))
+    return _with_details(ids, dist)
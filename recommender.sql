@@ -0,0 +1,15 @@
+-- Co-occurrence recommender state maintained by python_MVP/recommender.py.
+-- The interest and co-occurrence matrices are stored whole, together with
+-- the purchase and survey ids folded into them, so the dashboards load
+-- them at startup and only fold in what arrived since. Purchases the
+-- archiver has moved out stay counted.
+
+CREATE TABLE IF NOT EXISTS recommender_state (
+    name TEXT PRIMARY KEY,
+    last_purchase_id INTEGER NOT NULL DEFAULT 0,
+    last_survey_id INTEGER NOT NULL DEFAULT 0,
+    matrices BLOB,
+    updated_at TEXT
+);
+
+INSERT OR IGNORE INTO recommender_state (name) VALUES ('cooccurrence');
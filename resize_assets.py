@@ -1,49 +1,218 @@
+import argparse
+import hashlib
+import io
+import json
 import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from PIL import Image
 
-ASSETS_DIR = r'c:\Users\jbajc\Documents\vending\vending-app\assets'
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+# vending-app/assets holds the originals; every target gets the same output,
+# except files a target has its own version of (see _write_all)
+SOURCE_DIR = os.path.join(ROOT_DIR, 'vending-app', 'assets')
+TARGET_DIRS = [
+    os.path.join(ROOT_DIR, 'vending-app', 'assets'),
+    os.path.join(ROOT_DIR, 'vending-web', 'assets'),
+    os.path.join(ROOT_DIR, 'vending-web', 'public'),
+]
+MANIFEST_FILE = os.path.join(ROOT_DIR, 'asset-manifest.json')
+
 MAX_SIZE = (300, 300)
+VARIANT_SIZES = [150, 64]
+WEBP_QUALITY = 80
 EXCLUDED_FILES = {
     'adaptive-icon.png', 'favicon.png', 'icon.png', 'splash-icon.png',
     'map-pin.png', 'map-pin-black.png', 'vending-machine.png',
     'cat-drink.png', 'cat-snack.png', 'cat-candy.png', 'cat-health.png'
 }
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+# Outputs we write next to the originals (name@150.jpg, name@64.webp, ...)
+VARIANT_RE = re.compile(r'@\d+(' + '|'.join(re.escape(ext) for ext in IMAGE_EXTENSIONS + ('.webp',)) + r')$',
+                        re.IGNORECASE)
 
-def resize_images():
-    count = 0
-    saved_space = 0
-    
-    for filename in os.listdir(ASSETS_DIR):
-        if filename in EXCLUDED_FILES:
-            print(f"Skipping excluded file: {filename}")
+# Bump when the pipeline output changes so every image is rebuilt once
+PIPELINE_VERSION = 2
+SETTINGS_KEY = json.dumps([PIPELINE_VERSION, MAX_SIZE, VARIANT_SIZES, WEBP_QUALITY, sorted(EXCLUDED_FILES)])
+
+def file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, 'r') as f:
+        manifest = json.load(f)
+    # Different sizes/quality means every cached entry is stale
+    if manifest.get('settings') != SETTINGS_KEY:
+        return {}
+    return manifest.get('files', {})
+
+def load_written():
+    # Target path -> hash of what we last wrote there. Kept across settings
+    # changes: it decides ownership of target files, not freshness.
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, 'r') as f:
+        return json.load(f).get('written', {})
+
+def save_manifest(files, written):
+    with open(MANIFEST_FILE, 'w') as f:
+        json.dump({'settings': SETTINGS_KEY, 'files': files, 'written': written}, f, indent=2, sort_keys=True)
+
+def list_sources():
+    sources = []
+    for filename in sorted(os.listdir(SOURCE_DIR)):
+        if not filename.lower().endswith(IMAGE_EXTENSIONS) or VARIANT_RE.search(filename):
+            continue
+        sources.append(filename)
+    return sources
+
+def _encode(img, fmt, **kwargs):
+    buf = io.BytesIO()
+    img.save(buf, fmt, **kwargs)
+    return buf.getvalue()
+
+def _write_all(filename, data, written, kept):
+    # The web folders aren't pure copies: some files (map pins, icons) are
+    # web-specific. A target file is only replaced if it is missing, already
+    # identical, or still what we wrote last run; anything else is kept.
+    data_hash = hashlib.sha256(data).hexdigest()
+    for target in TARGET_DIRS:
+        path = os.path.join(target, filename)
+        key = os.path.relpath(path, ROOT_DIR)
+        if os.path.abspath(target) != os.path.abspath(SOURCE_DIR) and os.path.exists(path):
+            current = file_hash(path)
+            if current not in (data_hash, written.get(key)):
+                kept.append(key)
+                continue
+        with open(path, 'wb') as f:
+            f.write(data)
+        written[key] = data_hash
+
+def process_image(filename, previous_writes):
+    # Runs in a worker process: decode once, encode each variant once,
+    # then fan the same bytes out to every target directory.
+    started = time.perf_counter()
+    written, kept = dict(previous_writes), []
+    src_path = os.path.join(SOURCE_DIR, filename)
+    with open(src_path, 'rb') as f:
+        original = f.read()
+    original_size = len(original)
+
+    if filename in EXCLUDED_FILES:
+        _write_all(filename, original, written, kept)
+        return {
+            'file': filename, 'outputs': [filename], 'output_hash': hashlib.sha256(original).hexdigest(),
+            'written': written, 'kept': kept,
+            'original_size': original_size, 'new_size': original_size,
+            'seconds': time.perf_counter() - started, 'action': 'copied',
+        }
+
+    stem, ext = os.path.splitext(filename)
+    fmt = 'PNG' if ext.lower() == '.png' else 'JPEG'
+    outputs = {}
+    with Image.open(io.BytesIO(original)) as img:
+        img.load()
+        if img.width > MAX_SIZE[0] or img.height > MAX_SIZE[1]:
+            # Resize maintaining aspect ratio
+            img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
+            outputs[filename] = _encode(img, fmt, optimize=True, quality=85)
+        else:
+            # Already small enough, don't re-encode the original
+            outputs[filename] = original
+        outputs[f"{stem}.webp"] = _encode(img, 'WEBP', quality=WEBP_QUALITY, method=4)
+
+        for size in VARIANT_SIZES:
+            if img.width <= size and img.height <= size:
+                continue
+            variant = img.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            outputs[f"{stem}@{size}{ext}"] = _encode(variant, fmt, optimize=True, quality=85)
+            outputs[f"{stem}@{size}.webp"] = _encode(variant, 'WEBP', quality=WEBP_QUALITY, method=4)
+
+    for name, data in outputs.items():
+        _write_all(name, data, written, kept)
+
+    return {
+        'file': filename, 'outputs': sorted(outputs), 'output_hash': hashlib.sha256(outputs[filename]).hexdigest(),
+        'written': written, 'kept': kept,
+        'original_size': original_size, 'new_size': len(outputs[filename]),
+        'seconds': time.perf_counter() - started, 'action': 'built',
+    }
+
+def _is_fresh(filename, entry, current_hash):
+    if not entry:
+        return False
+    # The primary output overwrites the original in SOURCE_DIR, so either
+    # hash means "nothing new to do" as long as every output still exists.
+    if current_hash not in (entry['source_hash'], entry['output_hash']):
+        return False
+    return all(os.path.exists(os.path.join(target, name)) for target in TARGET_DIRS for name in entry['outputs'])
+
+def build_assets(force=False, workers=None):
+    started = time.perf_counter()
+    manifest = {} if force else load_manifest()
+    written = load_written()
+    sources = list_sources()
+
+    pending = {}
+    skipped = 0
+    for filename in sources:
+        current_hash = file_hash(os.path.join(SOURCE_DIR, filename))
+        if _is_fresh(filename, manifest.get(filename), current_hash):
+            skipped += 1
             continue
-            
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            filepath = os.path.join(ASSETS_DIR, filename)
-            try:
-                with Image.open(filepath) as img:
-                    # Check dimensions
-                    if img.width > 300 or img.height > 300:
-                        original_size = os.path.getsize(filepath)
-                        
-                        # Resize maintaining aspect ratio
-                        img.thumbnail(MAX_SIZE, Image.Resampling.LANCZOS)
-                        
-                        # Save back to same path
-                        img.save(filepath, optimize=True, quality=85)
-                        
-                        new_size = os.path.getsize(filepath)
-                        saved = original_size - new_size
-                        saved_space += saved
-                        count += 1
-                        print(f"Resized {filename}: {original_size/1024:.1f}KB -> {new_size/1024:.1f}KB")
-                    else:
-                        print(f"Skipping {filename} (Size: {img.width}x{img.height})")
-            except Exception as e:
-                print(f"Error processing {filename}: {e}")
-
-    print(f"\nCompleted. Resized {count} images.")
+        pending[filename] = current_hash
+
+    for target in TARGET_DIRS:
+        os.makedirs(target, exist_ok=True)
+
+    built = 0
+    saved_space = 0
+    kept = []
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(process_image, filename, written): filename
+                for filename in pending
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error processing {filename}: {e}")
+                    continue
+                manifest[filename] = {
+                    'source_hash': pending[filename],
+                    'output_hash': result['output_hash'],
+                    'outputs': result['outputs'],
+                }
+                written.update(result['written'])
+                kept.extend(result['kept'])
+                built += 1
+                saved_space += result['original_size'] - result['new_size']
+                print(f"{result['action'].capitalize()} {filename} in {result['seconds'] * 1000:.0f}ms: "
+                      f"{result['original_size']/1024:.1f}KB -> {result['new_size']/1024:.1f}KB, "
+                      f"{len(result['outputs'])} outputs x {len(TARGET_DIRS)} targets")
+
+    # Forget images that were deleted from the source directory
+    manifest = {name: entry for name, entry in manifest.items() if name in sources}
+    save_manifest(manifest, written)
+
+    if kept:
+        print(f"\nKept {len(kept)} target files that differ from the source (delete one to let it be replaced):")
+        for path in sorted(kept):
+            print(f"  {path}")
+    print(f"\nCompleted in {time.perf_counter() - started:.2f}s. Built {built}, skipped {skipped} unchanged.")
     print(f"Total space saved: {saved_space/1024/1024:.2f} MB")
 
 if __name__ == "__main__":
-    resize_images()
+    parser = argparse.ArgumentParser(description="Resize product images and sync them to the app and web assets")
+    parser.add_argument('--force', action='store_true', help="Ignore the manifest and rebuild every image")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+    build_assets(force=args.force, workers=args.workers)
@@ -0,0 +1,39 @@
+-- Daily sales rollups maintained by build_rollups.py.
+-- Rows are merged in from purchases with purchase_id above the
+-- high-water mark in rollup_state, so refreshes never rescan history.
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    last_purchase_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS sales_daily_machine (
+    day TEXT NOT NULL,
+    machine_id INTEGER NOT NULL,
+    purchase_count INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, machine_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS sales_daily_item (
+    day TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    purchase_count INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, item_id)
+) WITHOUT ROWID;
+
+-- Per machine and item, for restock depletion rates. Tracked under its
+-- own rollup_state row so it can be backfilled independently.
+CREATE TABLE IF NOT EXISTS sales_daily_machine_item (
+    day TEXT NOT NULL,
+    machine_id INTEGER NOT NULL,
+    item_id INTEGER NOT NULL,
+    purchase_count INTEGER NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, machine_id, item_id)
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO rollup_state (name, last_purchase_id) VALUES ('sales_daily', 0);
+INSERT OR IGNORE INTO rollup_state (name, last_purchase_id) VALUES ('sales_daily_machine_item', 0);
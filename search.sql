@@ -0,0 +1,55 @@
+-- Full-text index over the catalog, used by /search/item and the customer
+-- app. Safe to run on every connect: everything is IF NOT EXISTS and the
+-- rebuild only fires when the index is missing rows.
+
+-- External content: the text lives in items, the index only stores tokens.
+-- prefix='2 3' keeps "co", "coc" style prefix queries off the slow path.
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    name,
+    category,
+    content='items',
+    content_rowid='item_id',
+    tokenize='unicode61 remove_diacritics 2',
+    prefix='2 3'
+);
+
+-- Vocabulary of indexed terms, for spelling correction of unknown words
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts_vocab USING fts5vocab(items_fts, 'row');
+
+-- Keep the index in step with items
+CREATE TRIGGER IF NOT EXISTS items_fts_insert AFTER INSERT ON items BEGIN
+    INSERT INTO items_fts (rowid, name, category) VALUES (new.item_id, new.name, new.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS items_fts_delete AFTER DELETE ON items BEGIN
+    INSERT INTO items_fts (items_fts, rowid, name, category) VALUES ('delete', old.item_id, old.name, old.category);
+END;
+
+CREATE TRIGGER IF NOT EXISTS items_fts_update AFTER UPDATE OF name, category ON items BEGIN
+    INSERT INTO items_fts (items_fts, rowid, name, category) VALUES ('delete', old.item_id, old.name, old.category);
+    INSERT INTO items_fts (rowid, name, category) VALUES (new.item_id, new.name, new.category);
+END;
+
+-- Items loaded before the triggers existed (or by a bulk seed)
+INSERT INTO items_fts (items_fts)
+SELECT 'rebuild'
+WHERE (SELECT COUNT(*) FROM items_fts_docsize) != (SELECT COUNT(*) FROM items);
+
+-- Words shoppers use that aren't in the catalog. Queries match the word
+-- itself or its expansion as a phrase, so "coke" finds "Coca-Cola".
+CREATE TABLE IF NOT EXISTS search_synonyms (
+    term TEXT PRIMARY KEY,
+    expansion TEXT NOT NULL
+) WITHOUT ROWID;
+
+INSERT OR IGNORE INTO search_synonyms (term, expansion) VALUES
+    ('coke', 'coca cola'),
+    ('soda', 'drink'),
+    ('pop', 'drink'),
+    ('mms', 'm ms'),
+    ('cheezits', 'cheez its'),
+    ('pb', 'reeses'),
+    ('energy', 'red bull'),
+    ('ramen', 'cup noodles'),
+    ('chips', 'doritos'),
+    ('fruit', 'health');
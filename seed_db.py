@@ -1,36 +1,132 @@
-import sqlite3
+import argparse
+import os
 import random
+import time
 from datetime import datetime, timedelta
 
+import numpy as np
+
+import db_access
+
 DB_FILE = 'vending.db'
-SCHEMA_FILE = 'schema.sql'
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+INDEXES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'indexes.sql')
+SEARCH_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search.sql')
+ROLLUP_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rollups.sql')
+SKETCH_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sketches.sql')
+RECOMMENDER_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recommender.sql')
+CHANGES_SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'changes.sql')
 
-def run_seed():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute("PRAGMA foreign_keys = ON;")
+FIRST_NAMES = ['Jack', 'Jill', 'Bob', 'Alice', 'Charlie', 'Megan', 'Tom', 'Sarah', 'Mike', 'Emily', 'David', 'Emma', 'Daniel', 'Olivia', 'James', 'Sophia', 'John', 'Isabella', 'Robert', 'Mia', 'Michael', 'Charlotte', 'William', 'Amelia', 'Mary', 'Harper']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin']
 
-    # 1. Reset Database
+ITEMS = [
+    # Drinks
+    ('Coca-Cola', 'Drink', 1.75), ('Sprite', 'Drink', 1.75), ('Dr Pepper', 'Drink', 1.75), ('Pepsi', 'Drink', 1.75),
+    ('Dasani Water', 'Drink', 1.50), ('Vitamin Water', 'Drink', 2.25), ('Red Bull', 'Drink', 3.00), ('Gatorade', 'Drink', 2.00),
+    
+    # Snacks
+    ('Doritos', 'Snack', 1.75), ('Cheez-its', 'Snack', 1.75), ('Pretzels', 'Snack', 1.50), ('Oreos', 'Snack', 2.00),
+    ('Trail Mix', 'Snack', 2.25), ('Granola Bar', 'Snack', 1.25), ('Protein Bar', 'Snack', 2.50),
+    
+    # Candy
+    ('Snickers', 'Candy', 1.50), ('M&Ms', 'Candy', 1.50), ('Reeses', 'Candy', 1.50),
+    
+    # Health
+    ('Apple', 'Health', 1.00), ('Banana', 'Health', 0.75),
+    
+    # Meals
+    ('Ham Sandwich', 'Meal', 6.50), ('Turkey Sandwich', 'Meal', 6.50), ('Tuna Wrap', 'Meal', 7.00), ('Chicken Caesar Salad', 'Meal', 7.50), ('Garden Salad', 'Meal', 6.00),
+    ('Pasta Salad', 'Meal', 6.50), ('Sushi Roll', 'Meal', 8.50), ('Burrito', 'Meal', 7.50), ('Pizza Slice', 'Meal', 4.50), ('Hot Pocket', 'Meal', 3.50),
+    ('Cup Noodles', 'Meal', 2.00), ('Mac n Cheese', 'Meal', 3.00), ('Soup Bowl', 'Meal', 4.00), ('Bagel Cream Cheese', 'Meal', 3.50), ('Croissant', 'Meal', 3.00),
+    ('Muffin', 'Meal', 2.50), ('Donut', 'Meal', 1.50), ('Hard Boiled Eggs', 'Meal', 2.00), ('Cheese Stick Crackers', 'Meal', 2.50), ('Lunchable', 'Meal', 4.50)
+]
+
+BASE_LAT, BASE_LNG = 42.7233, -84.4812 # East Lansing, MI
+BUILDINGS = [
+    'MSU Union', 'Main Library', 'Wells Hall', 'International Center', 'Breslin Center', 'Spartan Stadium', 
+    'IM Sports West', 'Chemistry Building', 'Biomedical Physical Sciences', 'Brody Hall', 'Case Hall', 
+    'Wonders Hall', 'Holden Hall', 'Wilson Hall', 'Akers Hall', 'Hubbard Hall', 'Holmes Hall', 
+    'McDonel Hall', 'Shaw Hall', 'Snyder-Phillips Hall', 'Mason Hall', 'Abbot Hall', 'Williams Hall', 
+    'Campbell Hall', 'Landon Hall', 'Yakeley Hall', 'Gilchrist Hall', 'Owen Hall', 'Van Hoosen Hall', 
+    'Wharton Center', 'Kellogg Center', 'Engineering Building', 'Business College', 'Communication Arts'
+]
+FEATURES = ['Standard', 'Ramp access', 'Voice guidance', 'Braille keypad', 'Elevator']
+
+# Base row counts for --scale 1 (same shape as the demo seed)
+BASE_USERS = 100
+BASE_MACHINES = 50
+BASE_PURCHASES = 3572
+HISTORY_DAYS = 30
+
+# Rows generated and committed per transaction in scale mode
+CHUNK_ROWS = 250_000
+
+def reset_schema(cursor):
     with open(SCHEMA_FILE, 'r') as f:
         schema_sql = f.read()
     
     tables = ['problem_reports', 'surveys', 'purchases', 'inventory', 'items', 'vending_machines', 'business_users', 'users']
+    # Derived tables, rebuilt from purchases by build_rollups.py
+    tables += ['sales_daily_machine', 'sales_daily_item', 'sales_daily_machine_item', 'rollup_state']
+    # Demand sketches, rebuilt from surveys/problem_reports by demand_sketches.py
+    tables += ['demand_sketches', 'sketch_state']
+    # Recommender matrices, rebuilt from purchases/surveys by python_MVP/recommender.py
+    tables += ['recommender_state']
+    # Catalog search index, rebuilt from items by search.sql
+    tables += ['items_fts_vocab', 'items_fts']
+    # Change counters for the dashboard cache, restarted with the data
+    tables += ['table_changes']
     for table in tables:
         cursor.execute(f"DROP TABLE IF EXISTS {table}")
     cursor.executescript(schema_sql)
     print("Schema initialized.")
 
+def create_indexes(cursor):
+    # Built after the data is loaded; one sort beats 100M incremental inserts
+    for path in (INDEXES_FILE, SEARCH_SCHEMA_FILE):
+        with open(path, 'r') as f:
+            cursor.executescript(f.read())
+    print("Indexes created.")
+
+def create_derived_tables(cursor):
+    # Empty until build_rollups.py / demand_sketches.py / recommender.py fill them, but the
+    # dashboards expect them to exist. The change-counter triggers go last:
+    # they attach to the state tables the other files create.
+    for path in (ROLLUP_SCHEMA_FILE, SKETCH_SCHEMA_FILE, RECOMMENDER_SCHEMA_FILE, CHANGES_SCHEMA_FILE):
+        with open(path, 'r') as f:
+            cursor.executescript(f.read())
+
+def migrate(db_file):
+    # Brings an existing database up to date without reseeding. Index builds
+    # hold the write lock, so run this from a deploy step, not from the apps.
+    conn = db_access.connect(db_file)
+    cursor = conn.cursor()
+    started = time.perf_counter()
+    create_indexes(cursor)
+    create_derived_tables(cursor)
+    conn.commit()
+    conn.close()
+    print(f"Migrated {db_file} in {time.perf_counter() - started:.1f}s.")
+
+def run_seed(seed=None):
+    random.seed(seed)
+    conn = db_access.connect(DB_FILE)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA foreign_keys = ON;")
+
+    # 1. Reset Database
+    reset_schema(cursor)
+
     # 2. Insert Users (100 Users)
     users = []
-    names = ['Jack', 'Jill', 'Bob', 'Alice', 'Charlie', 'Megan', 'Tom', 'Sarah', 'Mike', 'Emily', 'David', 'Emma', 'Daniel', 'Olivia', 'James', 'Sophia', 'John', 'Isabella', 'Robert', 'Mia', 'Michael', 'Charlotte', 'William', 'Amelia', 'Mary', 'Harper']
-    last_names = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin']
     
     # Specific demo user
     users.append(('Jack Bajc', 'jack@example.com', 5000, 'None'))
 
     for i in range(100):
-        first = random.choice(names)
-        last = random.choice(last_names)
+        first = random.choice(FIRST_NAMES)
+        last = random.choice(LAST_NAMES)
         name = f"{first} {last}"
         email = f"{first.lower()}.{last.lower()}{i}@example.com"
         credits = random.randint(0, 10000)
@@ -40,29 +136,7 @@ def run_seed():
     print(f"Inserted {len(users)} users.")
 
     # 3. Insert Items
-    # 3. Insert Items
-    items = [
-        # Drinks
-        ('Coca-Cola', 'Drink', 1.75), ('Sprite', 'Drink', 1.75), ('Dr Pepper', 'Drink', 1.75), ('Pepsi', 'Drink', 1.75),
-        ('Dasani Water', 'Drink', 1.50), ('Vitamin Water', 'Drink', 2.25), ('Red Bull', 'Drink', 3.00), ('Gatorade', 'Drink', 2.00),
-        
-        # Snacks
-        ('Doritos', 'Snack', 1.75), ('Cheez-its', 'Snack', 1.75), ('Pretzels', 'Snack', 1.50), ('Oreos', 'Snack', 2.00),
-        ('Trail Mix', 'Snack', 2.25), ('Granola Bar', 'Snack', 1.25), ('Protein Bar', 'Snack', 2.50),
-        
-        # Candy
-        ('Snickers', 'Candy', 1.50), ('M&Ms', 'Candy', 1.50), ('Reeses', 'Candy', 1.50),
-        
-        # Health
-        ('Apple', 'Health', 1.00), ('Banana', 'Health', 0.75),
-        
-        # Meals
-        ('Ham Sandwich', 'Meal', 6.50), ('Turkey Sandwich', 'Meal', 6.50), ('Tuna Wrap', 'Meal', 7.00), ('Chicken Caesar Salad', 'Meal', 7.50), ('Garden Salad', 'Meal', 6.00),
-        ('Pasta Salad', 'Meal', 6.50), ('Sushi Roll', 'Meal', 8.50), ('Burrito', 'Meal', 7.50), ('Pizza Slice', 'Meal', 4.50), ('Hot Pocket', 'Meal', 3.50),
-        ('Cup Noodles', 'Meal', 2.00), ('Mac n Cheese', 'Meal', 3.00), ('Soup Bowl', 'Meal', 4.00), ('Bagel Cream Cheese', 'Meal', 3.50), ('Croissant', 'Meal', 3.00),
-        ('Muffin', 'Meal', 2.50), ('Donut', 'Meal', 1.50), ('Hard Boiled Eggs', 'Meal', 2.00), ('Cheese Stick Crackers', 'Meal', 2.50), ('Lunchable', 'Meal', 4.50)
-    ]
-    cursor.executemany("INSERT INTO items (name, category, price) VALUES (?, ?, ?)", items)
+    cursor.executemany("INSERT INTO items (name, category, price) VALUES (?, ?, ?)", ITEMS)
     
     # Create lookup maps
     cursor.execute("SELECT item_id, name, price FROM items")
@@ -72,26 +146,15 @@ def run_seed():
 
     # 4. Insert Machines (50 Machines around MSU Campus)
     machines = []
-    base_lat, base_lng = 42.7233, -84.4812 # East Lansing, MI
-    buildings = [
-        'MSU Union', 'Main Library', 'Wells Hall', 'International Center', 'Breslin Center', 'Spartan Stadium', 
-        'IM Sports West', 'Chemistry Building', 'Biomedical Physical Sciences', 'Brody Hall', 'Case Hall', 
-        'Wonders Hall', 'Holden Hall', 'Wilson Hall', 'Akers Hall', 'Hubbard Hall', 'Holmes Hall', 
-        'McDonel Hall', 'Shaw Hall', 'Snyder-Phillips Hall', 'Mason Hall', 'Abbot Hall', 'Williams Hall', 
-        'Campbell Hall', 'Landon Hall', 'Yakeley Hall', 'Gilchrist Hall', 'Owen Hall', 'Van Hoosen Hall', 
-        'Wharton Center', 'Kellogg Center', 'Engineering Building', 'Business College', 'Communication Arts'
-    ]
-    features = ['Standard', 'Ramp access', 'Voice guidance', 'Braille keypad', 'Elevator']
-
     for i in range(50):
-        lat = base_lat + random.uniform(-0.02, 0.02)
-        lng = base_lng + random.uniform(-0.02, 0.02)
-        bldg = random.choice(buildings)
+        lat = BASE_LAT + random.uniform(-0.02, 0.02)
+        lng = BASE_LNG + random.uniform(-0.02, 0.02)
+        bldg = random.choice(BUILDINGS)
         floor = random.randint(1, 5)
         address = f"{bldg} Floor {floor}" if floor > 1 else f"{bldg} Lobby"
         # Unique-ish address
         address = f"{address} (#{i+1})"
-        feat = random.choice(features)
+        feat = random.choice(FEATURES)
         machines.append((lat, lng, address, feat))
 
     cursor.executemany("INSERT INTO vending_machines (location_lat, location_lng, address, accessible_features) VALUES (?, ?, ?, ?)", machines)
@@ -140,9 +203,182 @@ def run_seed():
     cursor.executemany("INSERT INTO purchases (user_id, machine_id, item_id, timestamp, credits_earned) VALUES (?, ?, ?, ?, ?)", purchases)
     print(f"Inserted {len(purchases)} purchase records.")
 
+    conn.commit()
+    create_indexes(cursor)
+    create_derived_tables(cursor)
     conn.commit()
     conn.close()
     print("Seed complete.")
 
+def _bulk_insert(conn, table, sql, chunks):
+    # Each chunk is generated, inserted and committed on its own, so memory
+    # stays bounded by CHUNK_ROWS no matter how many rows are requested.
+    total = 0
+    started = time.perf_counter()
+    for rows in chunks:
+        conn.executemany(sql, rows)
+        conn.commit()
+        total += len(rows)
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed > 0 else float('inf')
+    print(f"Inserted {total:,} {table} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec).")
+    return total
+
+def _chunk_bounds(n):
+    for start in range(0, n, CHUNK_ROWS):
+        yield start, min(start + CHUNK_ROWS, n)
+
+def _user_chunks(rng, n_users):
+    # Demo user keeps id 1, generated users follow
+    yield [(1, 'Jack Bajc', 'jack@example.com', 5000, 'None')]
+    for start, stop in _chunk_bounds(n_users):
+        size = stop - start
+        firsts = rng.integers(len(FIRST_NAMES), size=size).tolist()
+        lasts = rng.integers(len(LAST_NAMES), size=size).tolist()
+        credits = rng.integers(0, 10001, size=size).tolist()
+        rows = []
+        for i, f, l, c in zip(range(start, stop), firsts, lasts, credits):
+            first, last = FIRST_NAMES[f], LAST_NAMES[l]
+            rows.append((i + 2, f"{first} {last}", f"{first.lower()}.{last.lower()}{i}@example.com", c, 'None'))
+        yield rows
+
+def _machine_chunks(rng, n_machines, spread):
+    for start, stop in _chunk_bounds(n_machines):
+        size = stop - start
+        lats = (BASE_LAT + rng.uniform(-spread, spread, size=size)).tolist()
+        lngs = (BASE_LNG + rng.uniform(-spread, spread, size=size)).tolist()
+        bldgs = rng.integers(len(BUILDINGS), size=size).tolist()
+        floors = rng.integers(1, 6, size=size).tolist()
+        feats = rng.integers(len(FEATURES), size=size).tolist()
+        rows = []
+        for i, lat, lng, b, floor, f in zip(range(start, stop), lats, lngs, bldgs, floors, feats):
+            bldg = BUILDINGS[b]
+            address = f"{bldg} Floor {floor}" if floor > 1 else f"{bldg} Lobby"
+            rows.append((i + 1, lat, lng, f"{address} (#{i+1})", FEATURES[f]))
+        yield rows
+
+def _inventory_chunks(rng, n_machines, item_ids):
+    n_items = len(item_ids)
+    # ~8.5 slots per machine on average, keep the chunk near CHUNK_ROWS rows
+    machines_per_chunk = max(1, CHUNK_ROWS // 9)
+    for start in range(0, n_machines, machines_per_chunk):
+        stop = min(start + machines_per_chunk, n_machines)
+        size = stop - start
+        # Random permutation rank per machine; keeping ranks < k samples k distinct items
+        ranks = rng.random((size, n_items)).argsort(axis=1).argsort(axis=1)
+        counts = rng.integers(5, 13, size=size)
+        rows_idx, cols_idx = np.nonzero(ranks < counts[:, None])
+        mids = (rows_idx + start + 1).tolist()
+        iids = item_ids[cols_idx].tolist()
+        qtys = rng.integers(0, 16, size=len(mids)).tolist() # Some might be out of stock (0)
+        yield list(zip(mids, iids, qtys))
+
+def _purchase_chunks(rng, n_purchases, n_users, n_machines, item_ids, prices, start_date, days):
+    span = days * 86400
+    base = np.datetime64(start_date.replace(microsecond=0), 's')
+    for start, stop in _chunk_bounds(n_purchases):
+        size = stop - start
+        # Each chunk owns a sorted slice of the time window, so purchase_id
+        # order follows timestamp order like it does in production.
+        lo = span * start // n_purchases
+        hi = max(lo + 1, span * stop // n_purchases)
+        secs = np.sort(rng.integers(lo, hi, size=size))
+        stamps = np.char.replace(np.datetime_as_string(base + secs.astype('timedelta64[s]'), unit='s'), 'T', ' ')
+        item_idx = rng.integers(len(item_ids), size=size)
+        yield list(zip(
+            rng.integers(1, n_users + 2, size=size).tolist(),
+            rng.integers(1, n_machines + 1, size=size).tolist(),
+            item_ids[item_idx].tolist(),
+            stamps.tolist(),
+            prices[item_idx].tolist(),
+        ))
+
+def run_scaled_seed(scale, seed=None, purchases=None, end_date=None, db_file=None, with_indexes=True):
+    rng = np.random.default_rng(seed)
+    n_users = max(1, round(BASE_USERS * scale))
+    n_machines = max(1, round(BASE_MACHINES * scale))
+    n_purchases = purchases if purchases is not None else max(1, round(BASE_PURCHASES * scale))
+    # Keep machine density roughly constant as the fleet grows
+    spread = 0.02 * max(1.0, scale) ** 0.5
+
+    # Anchor the history window to a date rather than now() so the same
+    # --seed and --end-date always produce byte-identical rows.
+    if end_date is None:
+        end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = end_date - timedelta(days=HISTORY_DAYS)
+
+    conn = db_access.connect(db_file or DB_FILE)
+    cursor = conn.cursor()
+    reset_schema(cursor)
+
+    # Bulk-load settings: no rollback journal or fsync while loading.
+    # A crash mid-seed leaves a half-built file, which we just reseed.
+    cursor.execute("PRAGMA foreign_keys = OFF;")
+    cursor.execute("PRAGMA journal_mode = OFF;")
+    cursor.execute("PRAGMA synchronous = OFF;")
+    cursor.execute("PRAGMA temp_store = MEMORY;")
+    cursor.execute("PRAGMA cache_size = -65536;")
+    cursor.execute("PRAGMA locking_mode = EXCLUSIVE;")
+
+    print(f"Seeding scale {scale}: {n_users + 1:,} users, {n_machines:,} machines, {n_purchases:,} purchases.")
+    started = time.perf_counter()
+    total = 0
+
+    total += _bulk_insert(conn, 'users',
+        "INSERT INTO users (user_id, name, email, credits, accessibility_preferences) VALUES (?, ?, ?, ?, ?)",
+        _user_chunks(rng, n_users))
+
+    cursor.executemany("INSERT INTO items (name, category, price) VALUES (?, ?, ?)", ITEMS)
+    conn.commit()
+    cursor.execute("SELECT item_id, price FROM items ORDER BY item_id")
+    rows = cursor.fetchall()
+    item_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    prices = np.array([row[1] for row in rows], dtype=np.float64)
+    total += len(rows)
+
+    total += _bulk_insert(conn, 'vending_machines',
+        "INSERT INTO vending_machines (machine_id, location_lat, location_lng, address, accessible_features) VALUES (?, ?, ?, ?, ?)",
+        _machine_chunks(rng, n_machines, spread))
+
+    total += _bulk_insert(conn, 'inventory',
+        "INSERT INTO inventory (machine_id, item_id, quantity) VALUES (?, ?, ?)",
+        _inventory_chunks(rng, n_machines, item_ids))
+
+    total += _bulk_insert(conn, 'purchases',
+        "INSERT INTO purchases (user_id, machine_id, item_id, timestamp, credits_earned) VALUES (?, ?, ?, ?, ?)",
+        _purchase_chunks(rng, n_purchases, n_users, n_machines, item_ids, prices, start_date, HISTORY_DAYS))
+
+    # Benchmarks skip this so they start from the bare schema
+    if with_indexes:
+        index_started = time.perf_counter()
+        create_indexes(cursor)
+        print(f"Index build took {time.perf_counter() - index_started:.1f}s.")
+    create_derived_tables(cursor)
+
+    # Hand the file back in the mode the app and dashboards expect
+    cursor.execute("PRAGMA locking_mode = NORMAL;")
+    cursor.execute("PRAGMA journal_mode = WAL;")
+    cursor.execute("PRAGMA synchronous = NORMAL;")
+    conn.commit()
+    conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Seed complete: {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/sec overall).")
+
 if __name__ == "__main__":
-    run_seed()
+    parser = argparse.ArgumentParser(description="Reset and seed vending.db")
+    parser.add_argument('--scale', type=float, help="Multiply the demo row counts (e.g. 1000 = 50k machines) and stream them in bulk")
+    parser.add_argument('--purchases', type=int, help="Override the purchase count in scale mode (e.g. 100000000)")
+    parser.add_argument('--seed', type=int, help="Random seed for reproducible data")
+    parser.add_argument('--end-date', type=lambda s: datetime.strptime(s, '%Y-%m-%d'), help="Last day of purchase history in scale mode (default: today)")
+    parser.add_argument('--db', default=DB_FILE, help="Database file to write")
+    parser.add_argument('--migrate', action='store_true', help="Create missing indexes and derived tables in an existing database instead of reseeding")
+    args = parser.parse_args()
+
+    DB_FILE = args.db
+    if args.migrate:
+        migrate(DB_FILE)
+    elif args.scale is not None:
+        run_scaled_seed(args.scale, seed=args.seed, purchases=args.purchases, end_date=args.end_date)
+    else:
+        run_seed(seed=args.seed)
@@ -3,6 +3,7 @@ console.log(">>> THIS IS THE CORRECT SERVER.JS <<<");
 const express = require('express');
 const sqlite3 = require('sqlite3').verbose();
 const path = require('path');
+const fs = require('fs');
 
 const app = express();
 const PORT = 3000;
@@ -14,6 +15,14 @@ const db = new sqlite3.Database(dbPath, (err) => {
     console.error('Failed to connect to database:', err.message);
   } else {
     console.log('Connected to SQLite database.');
+    // Daily rollup tables kept current by build_rollups.py
+    db.exec(fs.readFileSync(path.resolve(__dirname, 'rollups.sql'), 'utf8'), (err) => {
+      if (err) console.error('Failed to initialize rollup tables:', err.message);
+    });
+    // Full-text catalog index, kept in sync with items by triggers
+    db.exec(fs.readFileSync(path.resolve(__dirname, 'search.sql'), 'utf8'), (err) => {
+      if (err) console.error('Failed to initialize search index:', err.message);
+    });
   }
 });
 
@@ -55,30 +64,125 @@ app.get('/machines/:id/inventory', (req, res) => {
   });
 });
 
-// Search machines by item name
+// Catalog search helpers (same rules as python_MVP/item_search.py)
+const MIN_PREFIX_CHARS = 2;
+const MIN_SIMILARITY = 0.45;
+
+function searchWords(text) {
+  return (text || '').toLowerCase().match(/[\p{L}\p{N}]+/gu) || [];
+}
+
+function trigrams(word) {
+  const padded = `  ${word} `;
+  const grams = new Set();
+  for (let i = 0; i < padded.length - 2; i++) grams.add(padded.slice(i, i + 3));
+  return grams;
+}
+
+// Closest indexed term by trigram similarity, for misspelled words
+function closestTerm(word, terms) {
+  const grams = trigrams(word);
+  let best = null;
+  let bestScore = MIN_SIMILARITY;
+  for (const term of terms) {
+    const termGrams = trigrams(term);
+    let shared = 0;
+    for (const gram of grams) if (termGrams.has(gram)) shared++;
+    const score = (2 * shared) / (grams.size + termGrams.size);
+    if (score > bestScore) {
+      best = term;
+      bestScore = score;
+    }
+  }
+  return best;
+}
+
+// FTS5 query with one group per word: the word as a prefix, its synonym as
+// a phrase, and a spelling correction when the word matches no indexed
+// term. Groups are ANDed so extra words narrow the search.
+function matchExpression(text, terms, synonyms, operator = 'AND') {
+  const groups = [];
+  for (const word of searchWords(text)) {
+    const alternatives = [word.length >= MIN_PREFIX_CHARS ? `"${word}"*` : `"${word}"`];
+    if (synonyms[word]) {
+      alternatives.push(`"${searchWords(synonyms[word]).join(' ')}"`);
+    } else if (!terms.some((term) => term.startsWith(word))) {
+      const corrected = closestTerm(word, terms);
+      if (corrected) alternatives.push(`"${corrected}"`);
+    }
+    groups.push(`(${alternatives.join(' OR ')})`);
+  }
+  return groups.join(` ${operator} `);
+}
+
+// Search machines by item name: prefix, synonym and typo-tolerant, and
+// every machine with a matching item in stock
 app.get('/search/item', (req, res) => {
   const { name } = req.query;
 
-  const sql = `
-    SELECT vm.machine_id, vm.address, inv.quantity
-    FROM inventory inv
-    JOIN vending_machines vm ON inv.machine_id = vm.machine_id
-    JOIN items i ON inv.item_id = i.item_id
-    WHERE i.name = ? AND inv.quantity > 0;
+  // ?name=a&name=b arrives as an array; anything thrown in a sqlite
+  // callback below would take the whole process down
+  if (typeof name !== 'string' || !name.trim()) {
+    return res.status(400).json({ error: "name query parameter is required" });
+  }
+
+  const vocabSql = `
+    SELECT term, NULL AS expansion FROM items_fts_vocab
+    UNION ALL
+    SELECT term, expansion FROM search_synonyms;
   `;
 
-  db.all(sql, [name], (err, rows) => {
+  db.all(vocabSql, [], (err, vocab) => {
     if (err) return res.status(500).json({ error: err.message });
-    res.json(rows);
+    const terms = vocab.filter((row) => row.expansion === null).map((row) => row.term);
+    const synonyms = {};
+    for (const row of vocab) if (row.expansion !== null) synonyms[row.term] = row.expansion;
+
+    const strict = matchExpression(name, terms, synonyms, 'AND');
+    const loose = matchExpression(name, terms, synonyms, 'OR');
+    if (!strict) return res.json([]);
+
+    // Items matching every word; any word only when none match them all.
+    // Best-ranked items first, nearest to the user is the app's job.
+    const sql = `
+      WITH strict AS (
+        SELECT rowid AS item_id, rank FROM items_fts WHERE items_fts MATCH ?
+      ),
+      loose AS (
+        SELECT rowid AS item_id, rank FROM items_fts
+        WHERE items_fts MATCH ? AND NOT EXISTS (SELECT 1 FROM strict)
+      ),
+      m AS (
+        SELECT * FROM strict UNION ALL SELECT * FROM loose
+      )
+      SELECT vm.machine_id, vm.address, inv.quantity, i.item_id, i.name
+      FROM m
+      JOIN items i ON i.item_id = m.item_id
+      JOIN inventory inv ON inv.item_id = m.item_id AND inv.quantity > 0
+      JOIN vending_machines vm ON inv.machine_id = vm.machine_id
+      ORDER BY m.rank, vm.machine_id;
+    `;
+
+    db.all(sql, [strict, loose], (err, rows) => {
+      if (err) return res.status(500).json({ error: err.message });
+      res.json(rows);
+    });
   });
 });
 
 // Analytics: items sold
 app.get('/analytics/items-sold', (req, res) => {
+  // Rollup rows plus any purchases since the last build_rollups.py refresh
   const sql = `
-    SELECT i.name AS item_name, COUNT(*) AS times_sold
-    FROM purchases p
-    JOIN items i ON p.item_id = i.item_id
+    WITH item_sales AS (
+      SELECT item_id, purchase_count FROM sales_daily_item
+      UNION ALL
+      SELECT item_id, 1 FROM purchases
+      WHERE purchase_id > (SELECT last_purchase_id FROM rollup_state WHERE name = 'sales_daily')
+    )
+    SELECT i.name AS item_name, SUM(s.purchase_count) AS times_sold
+    FROM item_sales s
+    JOIN items i ON s.item_id = i.item_id
     GROUP BY i.item_id
     ORDER BY times_sold DESC;
   `;
@@ -0,0 +1,17 @@
+-- Demand sketches maintained by demand_sketches.py.
+-- One row of mergeable sketches per day; sliding windows merge the last
+-- N days. Rows are folded in from surveys and problem_reports above the
+-- high-water marks in sketch_state, so refreshes never rescan history.
+
+CREATE TABLE IF NOT EXISTS sketch_state (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT
+);
+
+CREATE TABLE IF NOT EXISTS demand_sketches (
+    day TEXT PRIMARY KEY,
+    sketch BLOB NOT NULL
+);
+
+INSERT OR IGNORE INTO sketch_state (name) VALUES ('surveys'), ('problem_reports');
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Root scripts and the dashboard modules import each other by bare name
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'python_MVP'))
+# Keep query metrics from test databases out of the checkout
+os.environ.setdefault('VENDING_METRICS_DIR', tempfile.mkdtemp(prefix='vending-metrics-'))
@@ -0,0 +1,88 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+import archive_history
+import build_rollups
+import recommender
+from seed_db import SCHEMA_FILE
+
+START = datetime(2024, 1, 1)
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / 'vending.db')
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO users (user_id, name, email) VALUES (1, 'Test', 'test@example.com')")
+    conn.executemany("INSERT INTO items (item_id, name, category, price) VALUES (?, ?, 'Drink', 1.5)",
+                     [(1, 'Pepsi'), (2, 'Sprite')])
+    conn.executemany("INSERT INTO vending_machines (machine_id, address) VALUES (?, ?)", [(1, 'Union'), (2, 'Library')])
+    # Two purchases an hour for 60 days, all long past HOT_DAYS
+    conn.executemany(
+        "INSERT INTO purchases (user_id, machine_id, item_id, timestamp, credits_earned) VALUES (1, ?, ?, ?, ?)",
+        [(n % 2 + 1, n % 3 % 2 + 1, (START + timedelta(minutes=30 * n)).strftime('%Y-%m-%d %H:%M:%S'), n % 5)
+         for n in range(2 * 24 * 60)],
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+def rollup_totals(db_file):
+    conn = sqlite3.connect(db_file)
+    totals = {table: conn.execute(f"SELECT SUM(purchase_count), TOTAL(revenue) FROM {table}").fetchone()
+              for tables, _ in build_rollups.ROLLUPS.values() for table in tables}
+    conn.close()
+    return totals
+
+def refresh(db_file):
+    conn = build_rollups.connect(db_file)
+    build_rollups.refresh_rollups(conn)
+    conn.close()
+    conn = recommender.connect(db_file)
+    rec = recommender.refresh_recommender(conn)
+    conn.close()
+    return rec
+
+def test_archiving_everything_keeps_rollup_history(db_file, tmp_path):
+    rec = refresh(db_file)
+    before = rollup_totals(db_file)
+    assert before['sales_daily_item'][0] == 2 * 24 * 60
+
+    moved, _ = archive_history.archive_history(db_file, str(tmp_path / 'archive'), export_dir=str(tmp_path / 'export'))
+    assert moved == 2 * 24 * 60
+    conn = sqlite3.connect(db_file)
+    assert conn.execute("SELECT COUNT(*) FROM purchases").fetchone()[0] == 0
+    conn.close()
+
+    after = refresh(db_file)
+    assert rollup_totals(db_file) == before
+    # The stored matrices still count the archived purchases
+    assert after.last_purchase_id == rec.last_purchase_id
+    assert (after.interest.values == rec.interest.values).all()
+    assert (after.cooccurrence.values == rec.cooccurrence.values).all()
+
+def test_waits_for_the_recommender(db_file, tmp_path):
+    refresh(db_file)
+    conn = recommender.connect(db_file)
+    recommender.reset_recommender(conn)
+    conn.close()
+    moved, _ = archive_history.archive_history(db_file, str(tmp_path / 'archive'), export_dir=str(tmp_path / 'export'))
+    assert moved == 0
+
+def test_reseed_still_rebuilds_rollups(db_file):
+    refresh(db_file)
+    conn = sqlite3.connect(db_file)
+    # Recreating the table (what seed_db does) resets its id sequence
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("DELETE FROM purchases")
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'purchases'")
+    conn.execute("INSERT INTO purchases (user_id, machine_id, item_id, timestamp, credits_earned) "
+                 "VALUES (1, 1, 1, '2024-05-01 10:00:00', 3)")
+    conn.commit()
+    conn.close()
+
+    refresh(db_file)
+    assert rollup_totals(db_file)['sales_daily_item'] == (1, 3.0)
@@ -0,0 +1,32 @@
+import sqlite3
+
+import bench_queries
+from seed_db import SCHEMA_FILE
+
+def bench_indexes(db_file):
+    conn = sqlite3.connect(db_file)
+    names = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'bench_%'")}
+    conn.close()
+    return names
+
+def test_try_indexes_keeps_run_level_indexes(tmp_path, monkeypatch):
+    db_file = str(tmp_path / 'bench.db')
+    conn = sqlite3.connect(db_file)
+    with open(SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    conn.close()
+    bench_queries._with_indexes(db_file, ['inventory_machine_item'], create=True)
+
+    seen = []
+    def run_queries(db_file, names, repeat):
+        seen.append(bench_indexes(db_file))
+        return {}, {'machine_inventory': {'p50': 1.0, 'plan': []}}
+    monkeypatch.setattr(bench_queries, 'run_queries', run_queries)
+
+    baseline = {'machine_inventory': {'p50': 1.0, 'plan': []}}
+    speedups = bench_queries.try_indexes(db_file, 1, ['machine_inventory'], 1, baseline,
+                                         applied=['inventory_machine_item'])
+    assert 'inventory_machine_item' not in speedups
+    assert len(seen) == len(bench_queries.INDEXES) - 1
+    assert all('bench_inventory_machine_item' in names and len(names) == 2 for names in seen)
+    assert bench_indexes(db_file) == {'bench_inventory_machine_item'}
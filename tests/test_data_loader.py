@@ -0,0 +1,95 @@
+import sqlite3
+from collections import OrderedDict
+
+import pytest
+
+import data_loader as data
+import seed_db
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'vending.db')
+    conn = sqlite3.connect(path)
+    with open(seed_db.SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO users (user_id, name, email) VALUES (1, 'Test', 'test@example.com')")
+    conn.execute("INSERT INTO items (item_id, name, category, price) VALUES (1, 'Pepsi', 'Drink', 1.5)")
+    conn.executemany("INSERT INTO vending_machines (machine_id, address) VALUES (?, ?)", [(1, 'Union'), (2, 'Library')])
+    conn.executemany("INSERT INTO inventory (machine_id, item_id, quantity) VALUES (?, 1, 10)", [(1,), (2,)])
+    conn.commit()
+    conn.close()
+    seed_db.migrate(path)
+
+    monkeypatch.setattr(data, 'DB_FILE', path)
+    monkeypatch.setattr(data, '_pool', None)
+    monkeypatch.setattr(data, '_cache', OrderedDict())
+    monkeypatch.setattr(data, '_data_version', None)
+    yield path
+    data.get_pool().close()
+
+def write(db_file, sql, params=()):
+    # From another connection, like the ingest service or the API
+    conn = sqlite3.connect(db_file)
+    conn.execute(sql, params)
+    conn.commit()
+    conn.close()
+
+@pytest.fixture
+def runs(monkeypatch):
+    # Statements that actually reached SQLite
+    statements = []
+    run = data._run
+    monkeypatch.setattr(data, '_run', lambda sql, params: statements.append(sql) or run(sql, params))
+    return statements
+
+def test_unrelated_commits_keep_cached_results(db_file, runs):
+    data.urgent_maintenance()
+    data.fleet_summary()
+    assert len(runs) == 2
+    write(db_file, "INSERT INTO alerts (machine_id, type, message) VALUES (1, 'power_off', 'off')")
+    write(db_file, "INSERT INTO purchases (user_id, machine_id, item_id, timestamp) VALUES (1, 1, 1, '2024-01-01 10:00:00')")
+    data.urgent_maintenance()
+    data.fleet_summary()
+    assert len(runs) == 2
+
+def test_commits_to_a_read_table_invalidate(db_file):
+    issues = data.urgent_maintenance()
+    stock = data.machine_stock()
+    write(db_file, "UPDATE inventory SET quantity = 0 WHERE machine_id = 2")
+    assert data.urgent_maintenance() is issues
+    assert data.machine_stock() is not stock
+    assert data.machine_stock().set_index('name')['items_in_stock'].to_dict() == {'Union': 1, 'Library': 0}
+
+    data.submit_problem_report(2, "Coin slot jammed", user_id=1)
+    assert data.urgent_maintenance()[['name', 'issue_count']].values.tolist() == [['Library', 1]]
+
+def test_cached_values_follow_their_tables(db_file):
+    calls = []
+    compute = lambda: calls.append(1) or len(calls)
+    assert data.cached('plan', compute, tables=('sales_daily_machine_item',)) == 1
+    write(db_file, "INSERT INTO alerts (machine_id, type, message) VALUES (1, 'power_off', 'off')")
+    assert data.cached('plan', compute, tables=('sales_daily_machine_item',)) == 1
+    write(db_file, "UPDATE rollup_state SET last_purchase_id = 1 WHERE name = 'sales_daily_machine_item'")
+    assert data.cached('plan', compute, tables=('sales_daily_machine_item',)) == 2
+
+def test_open_reports_use_the_status_index(db_file):
+    conn = sqlite3.connect(db_file)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM problem_reports WHERE status = 'open'").fetchall()
+    conn.close()
+    assert 'idx_problem_reports_status' in plan[0][-1]
+
+def test_unmigrated_database_names_the_migration(tmp_path, monkeypatch):
+    path = str(tmp_path / 'vending.db')
+    conn = sqlite3.connect(path)
+    with open(seed_db.SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    conn.close()
+    monkeypatch.setattr(data, 'DB_FILE', path)
+    monkeypatch.setattr(data, '_pool', None)
+    monkeypatch.setattr(data, '_cache', OrderedDict())
+    monkeypatch.setattr(data, '_data_version', None)
+    with pytest.raises(RuntimeError, match='seed_db.py --migrate'):
+        data.fleet_summary()
+    seed_db.migrate(path)
+    assert data.fleet_summary()['total_machines'] == 0
+    data.get_pool().close()
@@ -0,0 +1,129 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import demand_sketches
+from demand_sketches import CountMin, DemandSketch, DistinctUsers
+from seed_db import SCHEMA_FILE
+
+TODAY = datetime(2026, 3, 31, 12)
+
+def zipf_requests(seed, n=20_000):
+    rng = np.random.default_rng(seed)
+    return rng.zipf(1.3, n) % 200 + 1, rng.integers(1, 3_000, n)
+
+def test_count_min_never_underestimates():
+    items, _ = zipf_requests(1)
+    cms = CountMin()
+    keys, counts = np.unique(items, return_counts=True)
+    cms.add(keys, counts)
+    estimates = cms.estimate(keys)
+    assert np.all(estimates >= counts)
+    # e/width of the total, with room for the 1 - e^-depth failure odds
+    assert np.mean(estimates - counts <= np.e / demand_sketches.CMS_WIDTH * counts.sum()) > 0.95
+
+@pytest.mark.parametrize('n_users', [10, 300, 20_000])
+def test_distinct_users_within_error(n_users):
+    rng = np.random.default_rng(n_users)
+    users = rng.integers(1, 10 ** 9, n_users * 3) % n_users
+    sketch = DistinctUsers()
+    sketch.add(np.full(len(users), 7), users)
+    estimate = sketch.estimate([7])[0]
+    assert abs(estimate - n_users) <= max(2, 4 * 1.04 / np.sqrt(1 << demand_sketches.HLL_P) * n_users)
+
+def test_merged_days_match_one_sketch_of_everything():
+    items, users = zipf_requests(2)
+    whole = DemandSketch()
+    whole.add_requests(items, users, np.ones(len(items), dtype=np.int64))
+    merged = DemandSketch()
+    for part in np.array_split(np.arange(len(items)), 5):
+        day = DemandSketch()
+        day.add_requests(items[part], users[part], np.ones(len(part), dtype=np.int64))
+        merged.merge(DemandSketch.from_bytes(day.to_bytes()))
+    assert merged.requests == whole.requests == len(items)
+    np.testing.assert_array_equal(merged.item_counts.table, whole.item_counts.table)
+    keys = np.unique(items)
+    np.testing.assert_array_equal(merged.item_users.estimate(keys.tolist()), whole.item_users.estimate(keys.tolist()))
+
+def test_top_items_match_exact_counts():
+    items, users = zipf_requests(3)
+    sketch = DemandSketch()
+    sketch.add_requests(items, users, np.ones(len(items), dtype=np.int64))
+    keys, counts = np.unique(items, return_counts=True)
+    heaviest = keys[np.argsort(-counts, kind='stable')][:5]
+    top_keys, top_counts, _ = sketch.top('items', 5)
+    assert top_keys.tolist() == heaviest.tolist()
+    np.testing.assert_array_equal(top_counts, np.sort(counts)[::-1][:5])
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / 'vending.db')
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    # Only the surveys and reports matter here, not the rows they point at
+    conn.execute("PRAGMA foreign_keys = OFF")
+    rng = np.random.default_rng(14)
+    add_activity(conn, rng, 0, 40)
+    conn.close()
+    return path
+
+def add_activity(conn, rng, first_day, days, n=6_000):
+    stamps = [(TODAY - timedelta(days=int(d), minutes=int(m))).strftime('%Y-%m-%d %H:%M:%S')
+              for d, m in zip(rng.integers(first_day, first_day + days, n), rng.integers(0, 600, n))]
+    conn.executemany(
+        "INSERT INTO surveys (user_id, item_id, vote, created_at) VALUES (?, ?, ?, ?)",
+        zip(rng.integers(1, 500, n).tolist(), (rng.zipf(1.4, n) % 40 + 1).tolist(),
+            rng.choice([1, 1, 1, -1], n).tolist(), stamps),
+    )
+    conn.executemany(
+        "INSERT INTO problem_reports (user_id, machine_id, description, created_at) VALUES (?, ?, 'broken', ?)",
+        zip([None if u % 5 == 0 else u for u in rng.integers(1, 500, n // 3).tolist()],
+            (rng.zipf(1.4, n // 3) % 30 + 1).tolist(), stamps[:n // 3]),
+    )
+    conn.commit()
+
+def window(conn, days):
+    rows = conn.execute("SELECT day, sketch FROM demand_sketches").fetchall()
+    return demand_sketches.window_sketch(rows, days, TODAY)
+
+@pytest.mark.parametrize('days', [1, 7, 30])
+def test_refreshed_windows_match_sql(db_file, days):
+    conn = demand_sketches.connect(db_file)
+    demand_sketches.refresh_sketches(conn, batch_rows=1_000, today=TODAY)
+    sketch = window(conn, days)
+    since = (TODAY - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+    exact = conn.execute("""
+        SELECT item_id, SUM(vote), COUNT(DISTINCT user_id) FROM surveys
+        WHERE vote > 0 AND created_at >= ? GROUP BY item_id ORDER BY 2 DESC, 1 LIMIT 3
+    """, (since,)).fetchall()
+    assert sketch.requests == conn.execute(
+        "SELECT COALESCE(SUM(vote), 0) FROM surveys WHERE vote > 0 AND created_at >= ?", (since,)).fetchone()[0]
+    assert sketch.reports == conn.execute(
+        "SELECT COUNT(*) FROM problem_reports WHERE created_at >= ?", (since,)).fetchone()[0]
+    keys, counts, users = sketch.top('items', 3)
+    # Few distinct items, so the counts are exact; distinct users are HLL
+    assert counts.tolist() == [row[1] for row in exact]
+    for estimate, (_, _, distinct) in zip(users.tolist(), exact):
+        assert abs(estimate - distinct) <= max(3, 0.2 * distinct)
+    conn.close()
+
+def test_incremental_refresh_matches_rebuild(db_file):
+    conn = demand_sketches.connect(db_file)
+    demand_sketches.refresh_sketches(conn, today=TODAY)
+    add_activity(conn, np.random.default_rng(15), 0, 3, n=900)
+    demand_sketches.refresh_sketches(conn, batch_rows=250, today=TODAY)
+    incremental = window(conn, 30)
+    demand_sketches.reset_sketches(conn)
+    demand_sketches.refresh_sketches(conn, today=TODAY)
+    rebuilt = window(conn, 30)
+    assert (incremental.requests, incremental.reports) == (rebuilt.requests, rebuilt.reports)
+    for dimension in ('items', 'machines'):
+        for a, b in zip(incremental.top(dimension, 10), rebuilt.top(dimension, 10)):
+            np.testing.assert_array_equal(a, b)
+    # Nothing older than the retention window is kept
+    oldest = (TODAY - timedelta(days=demand_sketches.RETENTION_DAYS - 1)).strftime('%Y-%m-%d')
+    assert conn.execute("SELECT MIN(day) FROM demand_sketches").fetchone()[0] >= oldest
+    conn.close()
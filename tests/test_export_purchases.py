@@ -0,0 +1,97 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pyarrow.dataset as ds
+import pytest
+
+import export_purchases
+from seed_db import SCHEMA_FILE
+
+START = datetime(2024, 1, 1)
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / 'vending.db')
+    conn = sqlite3.connect(path)
+    with open(SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    conn.execute("INSERT INTO users (user_id, name, email) VALUES (1, 'Test', 'test@example.com')")
+    conn.execute("INSERT INTO items (item_id, name, category, price) VALUES (1, 'Pepsi', 'Drink', 1.5)")
+    conn.execute("INSERT INTO vending_machines (machine_id, address) VALUES (1, 'Union')")
+    # Ten purchases a day for 40 days, in id (= time) order
+    add_purchases(conn, [START + timedelta(hours=2.4 * n) for n in range(400)])
+    conn.close()
+    return path
+
+def add_purchases(conn, stamps):
+    conn.executemany(
+        "INSERT INTO purchases (user_id, machine_id, item_id, timestamp, credits_earned) VALUES (1, 1, 1, ?, ?)",
+        [(stamp.strftime('%Y-%m-%d %H:%M:%S'), n % 7) for n, stamp in enumerate(stamps)],
+    )
+    conn.commit()
+
+def exported(export_dir):
+    table = ds.dataset(export_dir, format='parquet', partitioning='hive').to_table()
+    return sorted(table.column('purchase_id').to_pylist())
+
+def expected(db_file, until):
+    conn = sqlite3.connect(db_file)
+    ids = [row[0] for row in conn.execute("SELECT purchase_id FROM purchases WHERE timestamp < ? ORDER BY 1", (until,))]
+    conn.close()
+    return ids
+
+def test_resume_exports_each_finished_day_once(db_file, tmp_path, monkeypatch):
+    export_dir = str(tmp_path / 'export')
+    monkeypatch.setattr(export_purchases, 'FETCH_ROWS', 37)
+    export_purchases.export_purchases(db_file, export_dir, until='2024-01-20')
+    assert exported(export_dir) == expected(db_file, '2024-01-20')
+    export_purchases.export_purchases(db_file, export_dir, until='2024-02-05')
+    export_purchases.export_purchases(db_file, export_dir, until='2024-02-05')
+    assert exported(export_dir) == expected(db_file, '2024-02-05')
+
+def test_late_purchases_become_extra_parts(db_file, tmp_path):
+    export_dir = str(tmp_path / 'export')
+    export_purchases.export_purchases(db_file, export_dir, until='2024-02-01')
+    conn = sqlite3.connect(db_file)
+    add_purchases(conn, [datetime(2024, 1, 5, 12)] * 3)
+    conn.close()
+    export_purchases.export_purchases(db_file, export_dir, until='2024-02-01')
+    assert sorted(os.listdir(os.path.join(export_dir, 'day=2024-01-05'))) == ['part-0.parquet', 'part-1.parquet']
+    assert exported(export_dir) == expected(db_file, '2024-02-01')
+
+def test_crash_mid_export_never_duplicates(db_file, tmp_path, monkeypatch):
+    export_dir = str(tmp_path / 'export')
+    monkeypatch.setattr(export_purchases, 'FETCH_ROWS', 25)
+    save_state = export_purchases.save_state
+    saves = []
+
+    def crash_after_ten(export_dir, state):
+        save_state(export_dir, state)
+        saves.append(1)
+        if len(saves) == 10:
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(export_purchases, 'save_state', crash_after_ten)
+    with pytest.raises(KeyboardInterrupt):
+        export_purchases.export_purchases(db_file, export_dir, until='2024-02-01')
+    monkeypatch.setattr(export_purchases, 'save_state', save_state)
+    export_purchases.export_purchases(db_file, export_dir, until='2024-02-01')
+    assert exported(export_dir) == expected(db_file, '2024-02-01')
+    leftovers = [name for _, _, files in os.walk(export_dir) for name in files if name.endswith('.tmp')]
+    assert leftovers == []
+
+def test_reseed_is_refused_then_reexported(db_file, tmp_path):
+    export_dir = str(tmp_path / 'export')
+    export_purchases.export_purchases(db_file, export_dir, until='2024-02-01')
+    conn = sqlite3.connect(db_file)
+    # What seed_db's DROP/CREATE does to purchases: fewer rows, ids from 1 again
+    conn.execute("DELETE FROM purchases")
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'purchases'")
+    add_purchases(conn, [START + timedelta(hours=5 * n) for n in range(100)])
+    conn.close()
+
+    with pytest.raises(RuntimeError, match='--reset'):
+        export_purchases.export_purchases(db_file, export_dir, until='2024-02-01')
+    export_purchases.export_purchases(db_file, export_dir, until='2024-02-01', reset=True)
+    assert exported(export_dir) == expected(db_file, '2024-02-01')
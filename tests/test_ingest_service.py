@@ -0,0 +1,84 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+import ingest_service
+from seed_db import INDEXES_FILE, SCHEMA_FILE
+
+@pytest.fixture
+def db_file(tmp_path):
+    path = str(tmp_path / 'vending.db')
+    conn = sqlite3.connect(path)
+    for schema in (SCHEMA_FILE, INDEXES_FILE):
+        with open(schema, 'r') as f:
+            conn.executescript(f.read())
+    conn.executemany("INSERT INTO items (item_id, name, category, price) VALUES (?, ?, 'Drink', 1.5)",
+                     [(1, 'Pepsi'), (2, 'Sprite')])
+    conn.executemany("INSERT INTO vending_machines (machine_id, address) VALUES (?, ?)", [(1, 'Union'), (2, 'Library')])
+    conn.executemany("INSERT INTO inventory (machine_id, item_id, quantity) VALUES (?, ?, 10)",
+                     [(machine_id, item_id) for machine_id in (1, 2) for item_id in (1, 2)])
+    conn.commit()
+    conn.close()
+    return path
+
+def rows(db_file, sql):
+    conn = sqlite3.connect(db_file)
+    result = conn.execute(sql).fetchall()
+    conn.close()
+    return result
+
+def post_all(db_file, payloads):
+    # Queues every heartbeat before the writer starts, so they share one group commit
+    async def run():
+        service = ingest_service.IngestService(db_file)
+        requests = [asyncio.ensure_future(service.route('POST', '/machine/update', json.dumps(payload).encode()))
+                    for payload in payloads]
+        await asyncio.sleep(0)
+        writer = asyncio.ensure_future(service.writer())
+        responses = await asyncio.gather(*requests)
+        writer.cancel()
+        service.conn.close()
+        return service, responses
+    return asyncio.run(run())
+
+def test_repeated_ids_in_any_json_form_open_one_alert(db_file):
+    heartbeats = [{'machine_id': machine_id, 'inventory': {item_id: 1}}
+                  for machine_id, item_id in [(1, 2), ('1', '2'), (1.0, 2), (1, 2.0)]]
+    post_all(db_file, heartbeats)
+    post_all(db_file, heartbeats)
+    assert rows(db_file, "SELECT machine_id, type, message FROM alerts") == [(1, 'low_stock', 'Item 2 low stock (1 left)')]
+    assert rows(db_file, "SELECT quantity FROM inventory WHERE machine_id = 1 AND item_id = 2") == [(1,)]
+
+@pytest.mark.parametrize('payload', [
+    [],
+    {},
+    {'machine_id': None},
+    {'machine_id': True},
+    {'machine_id': 1.5},
+    {'machine_id': 'one'},
+    {'machine_id': -1},
+    {'machine_id': 99999999999999999999},
+    {'machine_id': 1, 'inventory': [1, 2]},
+    {'machine_id': 1, 'inventory': {'1': None}},
+    {'machine_id': 1, 'inventory': {'1': -3}},
+    {'machine_id': 1, 'inventory': {'99999999999999999999': 1}},
+    {'machine_id': 1, 'temperature': '50'},
+    {'machine_id': 1, 'power': 0},
+])
+def test_malformed_updates_are_rejected(payload):
+    with pytest.raises(ValueError):
+        ingest_service.parse_update(payload)
+
+def test_bad_update_does_not_fail_its_batch(db_file):
+    good = [{'machine_id': 1, 'inventory': {1: 4}}, {'machine_id': 2, 'inventory': {2: 0}, 'power': 'off'}]
+    bad = {'machine_id': 2, 'inventory': {1: 99999999999999999999}}
+    service, responses = post_all(db_file, [good[0], bad, good[1]])
+    assert [status for status, _ in responses] == [200, 400, 200]
+    assert service.batches == 1 and service.updates == 2
+    assert rows(db_file, "SELECT machine_id, item_id, quantity FROM inventory ORDER BY 1, 2") == [
+        (1, 1, 4), (1, 2, 10), (2, 1, 10), (2, 2, 0),
+    ]
+    assert rows(db_file, "SELECT status FROM vending_machines ORDER BY machine_id") == [('operational',), ('offline',)]
+    assert sorted(rows(db_file, "SELECT machine_id, type FROM alerts")) == [(2, 'low_stock'), (2, 'power_off')]
@@ -0,0 +1,127 @@
+import numpy as np
+import pytest
+
+import recommender
+from recommender import Recommender, SparseMatrix, _weights
+from seed_db import SCHEMA_FILE
+
+N_USERS = 60
+N_ITEMS = 25
+
+def activity(seed, n=3_000):
+    # (user, item, amount): purchases are +1, votes +/- VOTE_WEIGHT-ish
+    rng = np.random.default_rng(seed)
+    users = rng.integers(1, N_USERS + 1, n)
+    items = rng.zipf(1.5, n) % N_ITEMS + 1
+    amounts = np.where(rng.random(n) < 0.8, 1.0, rng.choice([-3.0, 3.0], n))
+    return users, items, amounts
+
+def dense_cooccurrence(users, items, amounts):
+    interest = np.zeros((N_USERS + 1, N_ITEMS + 1))
+    np.add.at(interest, (users, items), amounts)
+    weights = _weights(interest)
+    return weights.T @ weights
+
+def as_dense(matrix, size):
+    dense = np.zeros((size, size))
+    rows, cols, values = matrix.rows(np.arange(size))
+    dense[rows, cols] = values
+    return dense
+
+def test_sparse_matrix_add_matches_dense():
+    rng = np.random.default_rng(1)
+    matrix = SparseMatrix()
+    dense = np.zeros((30, 30))
+    for _ in range(20):
+        rows, cols, values = rng.integers(0, 30, 50), rng.integers(0, 30, 50), rng.normal(size=50)
+        matrix.add(rows, cols, values)
+        np.add.at(dense, (rows, cols), values)
+    np.testing.assert_allclose(as_dense(matrix, 30), dense)
+    np.testing.assert_allclose(matrix.get([3, 29], [4, 0]), dense[[3, 29], [4, 0]])
+
+@pytest.mark.parametrize('batches', [1, 7, 100])
+def test_incremental_updates_match_full_rebuild(batches):
+    users, items, amounts = activity(11)
+    rec = Recommender()
+    for chunk in np.array_split(np.arange(len(users)), batches):
+        rec.update(users[chunk], items[chunk], amounts[chunk])
+    np.testing.assert_allclose(as_dense(rec.cooccurrence, N_ITEMS + 1),
+                               dense_cooccurrence(users, items, amounts), atol=1e-9)
+
+def test_small_pair_chunks_give_the_same_matrix(monkeypatch):
+    users, items, amounts = activity(12)
+    full = Recommender()
+    full.update(users, items, amounts)
+    monkeypatch.setattr('recommender.PAIR_CHUNK', 10)
+    chunked = Recommender()
+    chunked.update(users, items, amounts)
+    np.testing.assert_allclose(as_dense(chunked.cooccurrence, N_ITEMS + 1),
+                               as_dense(full.cooccurrence, N_ITEMS + 1), atol=1e-9)
+
+def test_recommend_skips_disliked_and_falls_back_to_popular():
+    rec = Recommender()
+    # Users 1-3 buy 1 and 2 together; user 4 buys 3 a lot; user 5 hates 2
+    rec.update([1, 1, 2, 2, 3, 3, 4, 5, 5], [1, 2, 1, 2, 1, 2, 3, 1, 2], [1, 1, 1, 1, 1, 1, 9, 2, -3])
+    item_ids, scores = rec.recommend(1, [2, 3])
+    assert item_ids.tolist()[0] == 2
+    item_ids, _ = rec.recommend(5, [2, 3])
+    assert 2 not in item_ids.tolist()
+    # Unknown user: most co-purchased (popular) first
+    item_ids, _ = rec.recommend(99, [1, 2, 3])
+    assert item_ids.tolist()[0] == 3
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = recommender.connect(str(tmp_path / 'vending.db'))
+    with open(SCHEMA_FILE, 'r') as f:
+        conn.executescript(f.read())
+    conn.executemany("INSERT INTO users (user_id, name, email) VALUES (?, 'Test', ?)",
+                     [(n, f"test{n}@example.com") for n in range(1, N_USERS + 1)])
+    conn.executemany("INSERT INTO items (item_id, name, category, price) VALUES (?, ?, 'Drink', 1.5)",
+                     [(n, f"Item {n}") for n in range(1, N_ITEMS + 1)])
+    conn.execute("INSERT INTO vending_machines (machine_id, address) VALUES (1, 'Union')")
+    yield conn
+    conn.close()
+
+def add_activity(conn, seed, n=500):
+    users, items, amounts = activity(seed, n)
+    conn.executemany("INSERT INTO purchases (user_id, machine_id, item_id, timestamp) VALUES (?, 1, ?, '2024-01-01 10:00:00')",
+                     [(int(u), int(i)) for u, i, a in zip(users, items, amounts) if a == 1.0])
+    conn.executemany("INSERT INTO surveys (user_id, item_id, vote, created_at) VALUES (?, ?, ?, '2024-01-01 10:00:00')",
+                     [(int(u), int(i), int(a // 3)) for u, i, a in zip(users, items, amounts) if a != 1.0])
+
+def test_stored_matrices_round_trip():
+    users, items, amounts = activity(13)
+    rec = Recommender()
+    rec.update(users, items, amounts)
+    loaded = Recommender.from_bytes(rec.to_bytes(), 7, 3)
+    assert (loaded.last_purchase_id, loaded.last_survey_id) == (7, 3)
+    np.testing.assert_array_equal(loaded.cooccurrence.keys, rec.cooccurrence.keys)
+    np.testing.assert_array_equal(loaded.cooccurrence.values, rec.cooccurrence.values)
+    assert loaded.recommend(1, list(range(1, N_ITEMS + 1)))[0].tolist() == \
+        rec.recommend(1, list(range(1, N_ITEMS + 1)))[0].tolist()
+
+def test_refresh_picks_up_where_the_stored_state_stopped(conn):
+    add_activity(conn, 21)
+    recommender.refresh_recommender(conn, batch_rows=50)
+    add_activity(conn, 22)
+    incremental = recommender.refresh_recommender(conn, batch_rows=50)
+
+    recommender.reset_recommender(conn)
+    rebuilt = recommender.refresh_recommender(conn)
+    stored = recommender.load_state(lambda sql, params=(): conn.execute(sql, params).fetchall())
+    assert (stored.last_purchase_id, stored.last_survey_id) == (rebuilt.last_purchase_id, rebuilt.last_survey_id)
+    for rec in (incremental, stored):
+        np.testing.assert_array_equal(rec.cooccurrence.keys, rebuilt.cooccurrence.keys)
+        np.testing.assert_allclose(rec.cooccurrence.values, rebuilt.cooccurrence.values, atol=1e-9)
+
+def test_reseeded_purchases_rebuild_the_stored_state(conn):
+    add_activity(conn, 23)
+    recommender.refresh_recommender(conn)
+    conn.execute("DELETE FROM purchases")
+    conn.execute("DELETE FROM surveys")
+    conn.execute("DELETE FROM sqlite_sequence")
+    conn.execute("INSERT INTO purchases (user_id, machine_id, item_id, timestamp) VALUES (1, 1, 2, '2024-01-01 10:00:00')")
+    rec = recommender.refresh_recommender(conn)
+    assert rec.last_purchase_id == 1
+    assert rec.favourites(1)[0].tolist() == [2]
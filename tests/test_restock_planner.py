@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from restock_planner import DEPOT, _distance_matrix, _nearest_neighbour, _two_opt, plan_routes
+
+def tour_length(order, dist):
+    return dist[order, np.roll(order, -1)].sum()
+
+def random_stops(n, seed):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(42.70, 42.75, n), rng.uniform(-84.50, -84.45, n)
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('n', [2, 3, 8, 40])
+def test_two_opt_never_worse_than_nearest_neighbour(n, seed):
+    lats, lngs = random_stops(n, seed)
+    dist = _distance_matrix(lats, lngs)
+    start = _nearest_neighbour(dist)
+    order = _two_opt(start, dist)
+    assert order[0] == 0
+    assert sorted(order.tolist()) == list(range(n))
+    assert tour_length(order, dist) <= tour_length(start, dist) + 1e-9
+
+@pytest.mark.parametrize('seed', range(5))
+def test_two_opt_reaches_a_local_optimum(seed):
+    lats, lngs = random_stops(30, seed)
+    dist = _distance_matrix(lats, lngs)
+    tour = np.append(_two_opt(_nearest_neighbour(dist), dist, passes=1_000), 0)
+    # No single segment reversal left that shortens the tour
+    for i in range(1, len(tour) - 2):
+        for j in range(i + 1, len(tour) - 1):
+            a, b, c, d = tour[i - 1], tour[i], tour[j], tour[j + 1]
+            assert dist[a, c] + dist[b, d] >= dist[a, b] + dist[c, d] - 1e-9
+
+def test_plan_routes_visits_the_most_urgent_stops_once():
+    lats, lngs = random_stops(60, 8)
+    stops = pd.DataFrame({
+        'machine_id': np.arange(1, 61), 'lat': lats, 'lon': lngs,
+        'hours_to_stockout': np.arange(60, dtype=np.float64)[::-1],
+    })
+    routes = plan_routes(stops, DEPOT, drivers=3, max_stops=10)
+    assert len(routes) == 30
+    assert sorted(routes['machine_id'].tolist()) == list(range(31, 61))
+    assert set(routes['driver']) == {1, 2, 3}
+    for _, route in routes.groupby('driver'):
+        assert route['stop'].tolist() == list(range(1, len(route) + 1))
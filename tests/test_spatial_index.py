@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from spatial_index import MachineIndex, haversine_km
+
+# A campus-sized fleet with a dense cluster, so some cells hold many machines
+rng = np.random.default_rng(6)
+N = 2_000
+LATS = np.concatenate([rng.uniform(42.70, 42.75, N - 200), rng.normal(42.725, 0.001, 200)])
+LNGS = np.concatenate([rng.uniform(-84.50, -84.45, N - 200), rng.normal(-84.48, 0.001, 200)])
+IDS = rng.permutation(N) + 1
+ACCESSIBLE = rng.random(N) < 0.3
+INDEX = MachineIndex(IDS, LATS, LNGS, ACCESSIBLE)
+
+def brute_force(lat, lng, mask=None):
+    dist = haversine_km(lat, lng, LATS, LNGS)
+    ids = IDS
+    if mask is not None:
+        ids, dist = ids[mask], dist[mask]
+    order = np.argsort(dist, kind='stable')
+    return ids[order], dist[order]
+
+POINTS = [(42.725, -84.48), (42.70, -84.50), (42.76, -84.44), (42.60, -84.30), (42.7251, -84.4801)]
+
+@pytest.mark.parametrize('lat, lng', POINTS)
+@pytest.mark.parametrize('k', [1, 7, 50, N + 5])
+def test_nearest_matches_brute_force(lat, lng, k):
+    ids, dist = INDEX.nearest(lat, lng, k)
+    expected_ids, expected_dist = brute_force(lat, lng)
+    np.testing.assert_allclose(dist, expected_dist[:k])
+    # Ties could legitimately swap ids, so compare ids as sets per distance
+    assert set(ids.tolist()) == set(expected_ids[:k].tolist())
+
+@pytest.mark.parametrize('lat, lng', POINTS)
+def test_nearest_with_filter_matches_brute_force(lat, lng):
+    by_id = dict(zip(IDS.tolist(), ACCESSIBLE.tolist()))
+    keep = lambda machine_ids, positions: np.array([by_id[m] for m in machine_ids.tolist()], dtype=bool)
+    ids, dist = INDEX.nearest(lat, lng, 10, keep=keep)
+    expected_ids, expected_dist = brute_force(lat, lng, ACCESSIBLE)
+    np.testing.assert_allclose(dist, expected_dist[:10])
+    assert set(ids.tolist()) == set(expected_ids[:10].tolist())
+
+@pytest.mark.parametrize('lat, lng', POINTS)
+@pytest.mark.parametrize('radius_km', [0.05, 0.5, 3.0])
+def test_within_matches_brute_force(lat, lng, radius_km):
+    ids, dist = INDEX.within(lat, lng, radius_km)
+    expected_ids, expected_dist = brute_force(lat, lng)
+    inside = expected_dist <= radius_km
+    assert sorted(ids.tolist()) == sorted(expected_ids[inside].tolist())
+    assert np.all(np.diff(dist) >= 0)
+
+def test_empty_index():
+    index = MachineIndex([], [], [], [])
+    ids, dist = index.nearest(42.7, -84.5, 5)
+    assert len(ids) == 0 and len(dist) == 0
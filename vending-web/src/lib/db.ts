@@ -1,8 +1,11 @@
 import Database from 'better-sqlite3';
+import fs from 'fs';
 import path from 'path';
 
 // Database is located in the parent directory of the web project root
 const DB_PATH = path.join(process.cwd(), '../vending.db');
+// Daily rollup tables kept current by build_rollups.py
+const ROLLUP_SCHEMA_PATH = path.join(process.cwd(), '../rollups.sql');
 
 let db: Database.Database | null = null;
 
@@ -12,6 +15,8 @@ export function getDb() {
             console.log(`Connecting to DB at: ${DB_PATH} `);
             db = new Database(DB_PATH, { verbose: console.log });
             db.pragma('journal_mode = WAL');
+            // Idempotent; makes the rollup reads below safe before the first refresh
+            db.exec(fs.readFileSync(ROLLUP_SCHEMA_PATH, 'utf8'));
         } catch (error) {
             console.error("Failed to connect to database:", error);
             throw error;
@@ -20,6 +25,20 @@ export function getDb() {
     return db;
 }
 
+// Daily per-item sales: the rollup rows plus whatever purchases arrived after
+// the last build_rollups.py refresh. The tail is a purchase_id range scan on
+// the primary key, so it stays cheap however large history gets.
+const ITEM_SALES_CTE = `
+    WITH item_sales AS (
+        SELECT day, item_id, purchase_count, revenue
+        FROM sales_daily_item
+        UNION ALL
+        SELECT DATE(timestamp), item_id, 1, credits_earned
+        FROM purchases
+        WHERE purchase_id > (SELECT last_purchase_id FROM rollup_state WHERE name = 'sales_daily')
+    )
+`;
+
 // Queries
 export interface DashboardStats {
     totalMachines: number;
@@ -35,7 +54,7 @@ export function getDashboardStats(): DashboardStats {
     const machineCount = db.prepare('SELECT COUNT(*) as count FROM vending_machines').get() as { count: number };
 
     // Calculate revenue from purchases (Sum of credits_earned)
-    const revenueQuery = db.prepare('SELECT SUM(credits_earned) as total FROM purchases').get() as { total: number };
+    const revenueQuery = db.prepare(`${ITEM_SALES_CTE} SELECT SUM(revenue) as total FROM item_sales`).get() as { total: number };
     const totalRevenue = revenueQuery.total || 0;
 
     // Calculate revenue change from last week
@@ -44,9 +63,10 @@ export function getDashboardStats(): DashboardStats {
     const lastWeekDate = lastWeek.toISOString().split('T')[0];
 
     const lastWeekPurchases = db.prepare(`
-        SELECT SUM(credits_earned) as total FROM purchases 
-        WHERE DATE(timestamp) < ?
-        AND DATE(timestamp) >= DATE(?, '-7 days')
+        ${ITEM_SALES_CTE}
+        SELECT SUM(revenue) as total FROM item_sales
+        WHERE day < ?
+        AND day >= DATE(?, '-7 days')
     `).get(lastWeekDate, lastWeekDate) as { total: number };
 
     const lastWeekRevenue = lastWeekPurchases.total || 0;
@@ -56,11 +76,12 @@ export function getDashboardStats(): DashboardStats {
 
     // Get top product by purchase count
     const topProduct = db.prepare(`
+        ${ITEM_SALES_CTE}
         SELECT i.name
-        FROM purchases p
-        JOIN items i ON p.item_id = i.item_id
-        GROUP BY p.item_id
-        ORDER BY COUNT(p.purchase_id) DESC
+        FROM item_sales s
+        JOIN items i ON s.item_id = i.item_id
+        GROUP BY s.item_id
+        ORDER BY SUM(s.purchase_count) DESC
         LIMIT 1
     `).get() as { name: string } | undefined;
 
@@ -77,12 +98,13 @@ export function getDashboardStats(): DashboardStats {
 export function getTopProducts(limit = 5): { name: string; total_sold: number; total_revenue: number }[] {
     const db = getDb();
     const rows = db.prepare(`
+        ${ITEM_SALES_CTE}
         SELECT i.name as name,
-               COUNT(p.purchase_id) as total_sold,
-               SUM(p.credits_earned) as total_revenue
-        FROM purchases p
-        JOIN items i ON p.item_id = i.item_id
-        GROUP BY p.item_id
+               SUM(s.purchase_count) as total_sold,
+               SUM(s.revenue) as total_revenue
+        FROM item_sales s
+        JOIN items i ON s.item_id = i.item_id
+        GROUP BY s.item_id
         ORDER BY total_sold DESC
         LIMIT ?
     `).all(limit) as { name: string; total_sold: number; total_revenue: number }[];
@@ -92,12 +114,13 @@ export function getTopProducts(limit = 5): { name: string; total_sold: number; t
 export function getRevenueSeries(days = 8): { date: string; total_revenue: number }[] {
     const db = getDb();
     const rows = db.prepare(`
-        SELECT DATE(timestamp) as date,
-               SUM(credits_earned) as total_revenue
-        FROM purchases
-        WHERE DATE(timestamp) >= DATE('now', ?)
-        GROUP BY DATE(timestamp)
-        ORDER BY DATE(timestamp) ASC
+        ${ITEM_SALES_CTE}
+        SELECT day as date,
+               SUM(revenue) as total_revenue
+        FROM item_sales
+        WHERE day >= DATE('now', ?)
+        GROUP BY day
+        ORDER BY day ASC
     `).all(`-${days - 1} days`) as { date: string; total_revenue: number }[];
 
     const map = new Map(rows.map((r) => [r.date, r.total_revenue]));